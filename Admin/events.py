@@ -0,0 +1,165 @@
+"""
+This file has the event stream server of the admin. Every open
+/api/admin/events stream is a coroutine on one asyncio loop in a background
+thread (as with server.py's TransferServer), not a thread of the WSGI pool, so
+hundreds of dashboards can stay connected while the API keeps all its threads.
+
+It only speaks enough HTTP/1.1 for EventSource: GET /api/admin/events answered
+with a text/event-stream that never ends. The frames themselves come from
+main.py (EventSnapshot / EventDelta), so they are the same as on the Flask
+route; building them runs on the default executor, and since every section is
+cached once per state version, many streams cost one build per change.
+"""
+
+import asyncio
+import threading
+
+EVENTS_PATH = "/api/admin/events"
+# Open streams at once; further ones get 503 (each is a socket and a coroutine, not a thread)
+MAX_STREAMS = 1000
+# Largest request head accepted
+MAX_HEAD = 16 * 1024
+
+class EventServer:
+    """
+    Serves the event stream of `state` (a ClusterState). snapshot() returns the
+    first frame, delta(topics) the frame for changed topics or None, and
+    on_idle() is called (in a worker thread) before every keep-alive comment.
+    """
+
+    def __init__(self, state, snapshot, delta, host="0.0.0.0", port=5001, keepalive=15, coalesce=0.25,
+                 on_idle=None, origins=(), max_streams=MAX_STREAMS):
+        self.state = state
+        self.snapshot = snapshot
+        self.delta = delta
+        self.host = host
+        self.port = port
+        self.keepalive = keepalive
+        self.coalesce = coalesce
+        self.on_idle = on_idle
+        self.origins = set(origins)
+        self.max_streams = max_streams
+        self._loop = None
+        self._server = None
+        self._streams = set()
+        self._ready = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Starts the event loop thread and waits until the server is listening"""
+        self._thread = threading.Thread(target=self._run, name="event-server", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self._close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def url(self, host):
+        """Stream URL for a client that reached the API at `host` (a Host header)"""
+        hostname = host.rsplit(":", 1)[0] if host and not host.endswith("]") else host
+        return f"http://{hostname or 'localhost'}:{self.port}{EVENTS_PATH}"
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(
+            self._handle, self.host, self.port, limit=MAX_HEAD))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _close(self):
+        self._server.close()
+        for task in list(self._streams):
+            task.cancel()
+        await asyncio.gather(*self._streams, return_exceptions=True)
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            head = (await reader.readuntil(b"\r\n\r\n")).decode("latin-1")
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, ConnectionError):
+            writer.close()
+            return
+        request, *lines = head.split("\r\n")
+        headers = {}
+        for line in lines:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        method, path = (request.split(" ") + ["", ""])[:2]
+        origin = headers.get("origin")
+        cors = f"Access-Control-Allow-Origin: {origin}\r\nVary: Origin\r\n" if origin in self.origins else ""
+
+        if method != "GET" or path.split("?")[0] != EVENTS_PATH:
+            await self._reply(writer, "404 Not Found", cors, b'{"error": "not found"}')
+            return
+        wake = asyncio.Event()
+        subscriber = self.state.subscribe(limit=self.max_streams, on_push=lambda: self._wake(wake))
+        if subscriber is None:
+            await self._reply(writer, "503 Service Unavailable", cors + "Retry-After: 30\r\n",
+                              b'{"error": "too many event streams, poll /api/admin/dashboard instead"}')
+            return
+
+        stream = asyncio.current_task()
+        self._streams.add(stream)
+        watch = asyncio.create_task(self._watch(reader, stream))
+        try:
+            writer.write((f"HTTP/1.1 200 OK\r\nContent-Type: text/event-stream\r\nCache-Control: no-cache\r\n"
+                          f"X-Accel-Buffering: no\r\nConnection: close\r\n{cors}\r\n").encode())
+            writer.write(b"retry: 3000\n\n")
+            writer.write((await asyncio.to_thread(self.snapshot)).encode())
+            await writer.drain()
+            while True:
+                try:
+                    await asyncio.wait_for(wake.wait(), self.keepalive)
+                except asyncio.TimeoutError:
+                    if self.on_idle:
+                        await asyncio.to_thread(self.on_idle)
+                    writer.write(b": keep-alive\n\n")
+                    await writer.drain()
+                    continue
+                wake.clear()
+                await asyncio.sleep(self.coalesce)
+                frame = await asyncio.to_thread(self.delta, subscriber.drain())
+                if frame:
+                    writer.write(frame.encode())
+                    await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass  # the dashboard went away, or stop() closes every stream
+        finally:
+            watch.cancel()
+            self.state.unsubscribe(subscriber)
+            self._streams.discard(stream)
+            writer.close()
+
+    async def _watch(self, reader, stream):
+        # a closed dashboard frees its slot now, not at the next write
+        try:
+            while await reader.read(4096):
+                pass
+        except ConnectionError:
+            pass
+        stream.cancel()
+
+    def _wake(self, event):
+        # called from whichever thread bumped the state
+        try:
+            self._loop.call_soon_threadsafe(event.set)
+        except RuntimeError:
+            pass  # the loop is already closed
+
+    async def _reply(self, writer, status, headers, body):
+        writer.write((f"HTTP/1.1 {status}\r\nContent-Type: application/json\r\nContent-Length: {len(body)}\r\n"
+                      f"Connection: close\r\n{headers}\r\n").encode() + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+        writer.close()
@@ -1,52 +1,253 @@
+"""
+This file merges the embeddings the nodes sent back (receivedd/*.zip) into
+merged_embeddings.npy and a FAISS index. The output .npy is preallocated as a
+memory map from the shapes in the node files' headers, every node file is
+copied in through its own memory map, and the index is filled in ADD_BATCH row
+batches, so peak memory stays flat however many nodes report.
+
+The index type is an index spec: "flat" (exact), "ivf-flat", "ivf-pq", "hnsw"
+or any faiss index_factory string. IVF/PQ indexes are trained on a sample;
+nprobe / efSearch can be given, or tuned for a target recall@k against exact
+search (benchmarks/index_eval.py compares the specs).
+
+With --shards the merge is skipped: every node gets its own index (shards.py),
+only the nodes whose results changed are rebuilt, and searches fan out to all
+shards in parallel.
+
+Usage: python finalrun.py [--index ivf-pq] [--nprobe 16 | --target-recall 0.95] [--shards]
+"""
+
+import argparse
+import math
 import os
 import zipfile
+from contextlib import nullcontext
 import numpy as np
 import faiss
+from numpy.lib.format import open_memmap
 
 RECEIVED_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "receivedd"))
 MERGED_DIR = os.path.join(RECEIVED_DIR, "merged")
-os.makedirs(MERGED_DIR, exist_ok=True)
-
-# Step 1: Unzip all ZIP files into merged folder
-for f in os.listdir(RECEIVED_DIR):
-    if f.endswith(".zip"):
-        zip_path = os.path.join(RECEIVED_DIR, f)
-        with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-            zip_ref.extractall(MERGED_DIR)
-
-# Step 2: Collect all embeddings
-embedding_list = []
-text_chunks = []
-
-for folder in os.listdir(MERGED_DIR):
-    folder_path = os.path.join(MERGED_DIR, folder)
-    if os.path.isdir(folder_path):
-        for file in os.listdir(folder_path):
-            if file.endswith(".npy"):
-                emb_path = os.path.join(folder_path, file)
-                emb = np.load(emb_path)
-                embedding_list.append(emb)
-
-                # Optionally, store the text chunk corresponding to this embedding
-                txt_file = file.replace(".npy", ".txt")
-                txt_path = os.path.join(folder_path, txt_file)
-                if os.path.exists(txt_path):
-                    with open(txt_path, 'r', encoding='utf-8') as f:
-                        text_chunks.append(f.read())
-                else:
-                    text_chunks.extend([f"Chunk {i}" for i in range(emb.shape[0])])
-
-# Step 3: Merge all embeddings
-all_embeddings = np.vstack(embedding_list)
-np.save(os.path.join(RECEIVED_DIR, "merged_embeddings.npy"), all_embeddings)
-print(f"Merged {len(embedding_list)} embedding files into shape {all_embeddings.shape}")
-
-# Step 4: Build FAISS index
-index = faiss.IndexFlatL2(all_embeddings.shape[1])
-index.add(all_embeddings)
-print(f"FAISS index built with {index.ntotal} vectors")
-
-# Step 5: Optional: save index for later use
-faiss.write_index(index, os.path.join(RECEIVED_DIR, "final_index.faiss"))
-
-print("Final merged model is ready for Q&A.")
+# Rows copied / added to the index at a time
+ADD_BATCH = 65536
+# Index built by main(): "flat", "ivf-flat", "ivf-pq", "hnsw" or an index_factory string
+INDEX_SPEC = "flat"
+# Vectors sampled to train IVF / PQ indexes
+TRAIN_SIZE = 100000
+# PQ trains 256 centroids per sub-quantizer on at least 39 vectors each; "ivf-pq" below this is built as "ivf-flat"
+PQ_MIN_TRAIN = 39 * 256
+# Search parameters used when none are given
+DEFAULT_NPROBE = 16
+DEFAULT_EF_SEARCH = 64
+
+def ExtractZips(received_dir=RECEIVED_DIR, merged_dir=MERGED_DIR):
+    """
+    Step 1: Unzip every ZIP file into merged/<zip name>/; all nodes name their
+    results n1_PostProcess/n1_*, so they cannot share one folder
+    """
+    os.makedirs(merged_dir, exist_ok=True)
+    for f in sorted(os.listdir(received_dir)):
+        if f.endswith(".zip"):
+            zip_path = os.path.join(received_dir, f)
+            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
+                zip_ref.extractall(os.path.join(merged_dir, f[:-len(".zip")]))
+
+def EmbeddingFiles(merged_dir=MERGED_DIR):
+    """Step 2: The .npy file of every node folder of every zip, in a stable order"""
+    files = []
+    for result in sorted(os.listdir(merged_dir)):
+        result_path = os.path.join(merged_dir, result)
+        if not os.path.isdir(result_path) or result.endswith(".tmp"):
+            continue
+        for folder in sorted(os.listdir(result_path)):
+            folder_path = os.path.join(result_path, folder)
+            if os.path.isdir(folder_path):
+                for file in sorted(os.listdir(folder_path)):
+                    if file.endswith(".npy"):
+                        files.append(os.path.join(folder_path, file))
+    return files
+
+def NpyShape(path):
+    """(rows, dim, dtype) from the .npy header only; a 1-D array is one row"""
+    with open(path, "rb") as f:
+        if np.lib.format.read_magic(f) == (1, 0):
+            shape, _, dtype = np.lib.format.read_array_header_1_0(f)
+        else:
+            shape, _, dtype = np.lib.format.read_array_header_2_0(f)
+    if len(shape) == 1:
+        return 1, shape[0], dtype
+    if len(shape) != 2:
+        raise ValueError(f"{path}: expected a 2-D embedding array, got shape {shape}")
+    return shape[0], shape[1], dtype
+
+def TextChunks(files):
+    """The text chunk next to each embedding file, or placeholders"""
+    text_chunks = []
+    for emb_path in files:
+        # Optionally, store the text chunk corresponding to this embedding
+        txt_path = emb_path[:-len(".npy")] + ".txt"
+        if os.path.exists(txt_path):
+            with open(txt_path, 'r', encoding='utf-8') as f:
+                text_chunks.append(f.read())
+        else:
+            text_chunks.extend([f"Chunk {i}" for i in range(NpyShape(emb_path)[0])])
+    return text_chunks
+
+def MergeEmbeddings(files, output_path, batch=ADD_BATCH):
+    """
+    Step 3: Copy every node's embeddings into one preallocated, memory-mapped
+    .npy; returns it opened read-only.
+    """
+    if not files:
+        raise ValueError("No embedding files to merge.")
+    shapes = [NpyShape(path) for path in files]
+    dims = {dim for _, dim, _ in shapes}
+    if len(dims) != 1:
+        raise ValueError(f"Embedding sizes differ between nodes: {sorted(dims)}")
+    total = sum(rows for rows, _, _ in shapes)
+    dtype = np.result_type(*(dtype for _, _, dtype in shapes))
+
+    merged = open_memmap(output_path, mode="w+", dtype=dtype, shape=(total, dims.pop()))
+    offset = 0
+    for path, (rows, dim, _) in zip(files, shapes):
+        emb = np.load(path, mmap_mode="r").reshape(rows, dim)
+        for start in range(0, rows, batch):
+            block = emb[start:start + batch]
+            merged[offset + start:offset + start + len(block)] = block
+        offset += rows
+    merged.flush()
+    del merged
+    return np.load(output_path, mmap_mode="r")
+
+def IndexFactoryString(spec, n, d):
+    """faiss index_factory string for an index spec, sized for n vectors of size d"""
+    nlist = max(1, min(int(4 * math.sqrt(n)), n // 39))
+    name = spec.lower()
+    if name == "flat":
+        return "Flat"
+    if name == "ivf-flat":
+        return f"IVF{nlist},Flat"
+    if name == "ivf-pq" and n < PQ_MIN_TRAIN:
+        # too few vectors to train 256 centroids per sub-quantizer: PQ training would be
+        # slow and inaccurate, and at this size the uncompressed vectors are small anyway
+        return f"IVF{nlist},Flat"
+    if name == "ivf-pq":
+        # about 8 dimensions per 8-bit sub-quantizer, and it has to divide d
+        m = max(m for m in range(1, max(1, d // 8) + 1) if d % m == 0)
+        return f"IVF{nlist},PQ{m}"
+    if name == "hnsw":
+        return "HNSW32"
+    return spec
+
+def TuneIndex(index, nprobe=None, ef_search=None):
+    """Sets nprobe (IVF) / efSearch (HNSW); parameters the index does not have are ignored"""
+    params = faiss.ParameterSpace()
+    for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+        if value is not None:
+            try:
+                params.set_index_parameter(index, name, value)
+            except RuntimeError:
+                pass
+    return index
+
+def BuildIndex(embeddings, spec=INDEX_SPEC, batch=ADD_BATCH, train_size=TRAIN_SIZE,
+               nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH):
+    """Step 4: Build FAISS index, training it on a sample if needed and adding ADD_BATCH rows at a time"""
+    n, d = embeddings.shape
+    index = faiss.index_factory(d, IndexFactoryString(spec, n, d))
+    if not index.is_trained:
+        rows = np.sort(np.random.default_rng(0).choice(n, size=min(n, train_size), replace=False))
+        index.train(np.ascontiguousarray(embeddings[rows], dtype=np.float32))
+    for start in range(0, n, batch):
+        index.add(np.ascontiguousarray(embeddings[start:start + batch], dtype=np.float32))
+    return TuneIndex(index, nprobe, ef_search)
+
+def ExactNeighbors(embeddings, queries, k, batch=ADD_BATCH):
+    """Exact k nearest neighbours (L2) of queries, scanning embeddings batch by batch"""
+    heap = faiss.ResultHeap(len(queries), k)
+    for start in range(0, embeddings.shape[0], batch):
+        block = np.ascontiguousarray(embeddings[start:start + batch], dtype=np.float32)
+        D, I = faiss.knn(queries, block, min(k, len(block)))
+        if D.shape[1] < k:
+            D = np.hstack([D, np.full((len(D), k - D.shape[1]), np.inf, dtype=D.dtype)])
+            I = np.hstack([I, np.full((len(I), k - I.shape[1]), -1, dtype=I.dtype)])
+        heap.add_result(D, np.where(I >= 0, I + start, -1))
+    heap.finalize()
+    return heap.I
+
+def Recall(found, truth):
+    """recall@k: the fraction of the true k nearest neighbours that were found"""
+    k = truth.shape[1]
+    return float(np.mean([len(set(f[:k]) & set(t)) / k for f, t in zip(found, truth)]))
+
+def QuerySample(embeddings, count=200, seed=1):
+    """A fixed random sample of the rows, used as queries to measure recall"""
+    rows = np.sort(np.random.default_rng(seed).choice(embeddings.shape[0], size=min(count, embeddings.shape[0]), replace=False))
+    return np.ascontiguousarray(embeddings[rows], dtype=np.float32)
+
+def TuneForRecall(index, embeddings, target=0.95, k=10, queries=None):
+    """
+    Raises nprobe / efSearch until recall@k on a sample of the data reaches target.
+    Returns the chosen {parameter: value, "recall": r}; {} for an exact index.
+    """
+    if faiss.try_extract_index_ivf(index) is not None:
+        name, values = "nprobe", [2 ** i for i in range(int(math.log2(faiss.extract_index_ivf(index).nlist)) + 1)]
+    elif "HNSW" in type(faiss.downcast_index(index)).__name__:
+        name, values = "efSearch", [16, 32, 64, 128, 256, 512, 1024]
+    else:
+        return {}
+
+    queries = QuerySample(embeddings) if queries is None else queries
+    truth = ExactNeighbors(embeddings, queries, k)
+    params = faiss.ParameterSpace()
+    for value in values:
+        params.set_index_parameter(index, name, value)
+        recall = Recall(index.search(queries, k)[1], truth)
+        if recall >= target:
+            break
+    return {name: value, "recall": recall}
+
+def main(spec=INDEX_SPEC, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH, target_recall=None, shards=False,
+         metrics=None):
+    """metrics (the admin server's Metrics) times the extract, merge and index_build stages"""
+    stage = metrics.stage if metrics else lambda name: nullcontext()
+    with stage("extract"):
+        ExtractZips()
+        files = EmbeddingFiles()
+        text_chunks = TextChunks(files)
+
+    if shards:
+        # imported here: shards.py builds on the functions above
+        from shards import SHARD_DIR, BuildShards, ShardedIndex
+        with stage("index_build"):
+            BuildShards(files, SHARD_DIR, spec, nprobe, ef_search)
+        index = ShardedIndex(SHARD_DIR)
+        print(f"{len(index.shards)} FAISS shards with {index.ntotal} vectors in {SHARD_DIR}")
+        print("Final sharded model is ready for Q&A.")
+        return index, text_chunks
+
+    with stage("merge"):
+        all_embeddings = MergeEmbeddings(files, os.path.join(RECEIVED_DIR, "merged_embeddings.npy"))
+    print(f"Merged {len(files)} embedding files into shape {all_embeddings.shape}")
+
+    with stage("index_build"):
+        index = BuildIndex(all_embeddings, spec, nprobe=nprobe, ef_search=ef_search)
+    print(f"FAISS index ({IndexFactoryString(spec, *all_embeddings.shape)}) built with {index.ntotal} vectors")
+    if target_recall:
+        print(f"Tuned for recall@10 >= {target_recall}: {TuneForRecall(index, all_embeddings, target_recall)}")
+
+    # Step 5: Optional: save index for later use
+    faiss.write_index(index, os.path.join(RECEIVED_DIR, "final_index.faiss"))
+
+    print("Final merged model is ready for Q&A.")
+    return index, text_chunks
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the node embeddings and build the final index")
+    parser.add_argument("--index", default=INDEX_SPEC, help="flat, ivf-flat, ivf-pq, hnsw or an index_factory string")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE)
+    parser.add_argument("--ef-search", type=int, default=DEFAULT_EF_SEARCH)
+    parser.add_argument("--target-recall", type=float, help="Tune nprobe / efSearch for this recall@10 instead")
+    parser.add_argument("--shards", action="store_true", help="One index per node instead of a merged one")
+    args = parser.parse_args()
+    main(args.index, args.nprobe, args.ef_search, args.target_recall, args.shards)
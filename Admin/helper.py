@@ -3,19 +3,256 @@ This file has all the required functions to slices/distribute data irrespective
 cross network
 """
 
+import bisect
+import hashlib
+import json
+import math
 import os
 import time
 
-def Partition(input_source=None,output_source=None):
-    pass
+STREAM_BUFFER = 1024 * 1024
+MIN_RAM_GB = 4
+RING_REPLICAS = 64
+PARTITION_SHARDS = 256
+MANIFEST_NAME = "manifest.json"
+ENCODER_WINDOW = 500  # chunk_size of SimpleTextQA.add_text_chunk on the workers
+
+class HashRing:
+    """
+    Consistent-hash ring of node IDs. Every node sits on the ring at `replicas`
+    points, so adding or removing one node only moves about 1/N of the keys.
+    """
+
+    def __init__(self, nodes=(), replicas=RING_REPLICAS):
+        self.replicas = replicas
+        self.points = []
+        self.owners = {}
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        for r in range(self.replicas):
+            point = _Hash(f"{node}#{r}")
+            if point not in self.owners:
+                bisect.insort(self.points, point)
+            self.owners[point] = node
+
+    def remove(self, node):
+        for r in range(self.replicas):
+            point = _Hash(f"{node}#{r}")
+            if self.owners.get(point) == node:
+                del self.owners[point]
+                self.points.pop(bisect.bisect_left(self.points, point))
+
+    def owner(self, key):
+        if not self.points:
+            raise ValueError("Hash ring has no nodes.")
+        i = bisect.bisect(self.points, _Hash(key)) % len(self.points)
+        return self.owners[self.points[i]]
+
+
+def Partition(input_source=None, output_source=None, nodes=None, shards=PARTITION_SHARDS):
+    """
+    Content-addressed sharding. Every line of the input files is hashed into one
+    of `shards` shard files (shard_K.txt), and the shards are placed on a HashRing
+    of the node IDs. A line always lands in the same shard, and a node joining or
+    leaving only moves the shards it owns/takes over.
+
+    The assignment is saved to partition.json in output_source, and the shards
+    that changed owner since the previous call are returned under "moved" so only
+    those need to be re-embedded.
+    """
+    if not input_source or not output_source:
+        raise ValueError("Both input_source and output_source must be provided.")
+    if not nodes:
+        raise ValueError("At least one node must be provided.")
+    if shards < 1:
+        raise ValueError("Shards must be at least 1.")
+
+    os.makedirs(output_source, exist_ok=True)
+    state_file = os.path.join(output_source, "partition.json")
+
+    previous = {}
+    if os.path.exists(state_file):
+        with open(state_file, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+        if saved.get("shards") == shards:
+            previous = saved.get("assignment", {})
+
+    outs = {}
+    try:
+        for path in _InputFiles(input_source):
+            with open(path, "rb") as f:
+                for line in f:
+                    if not line.strip():
+                        continue
+                    if not line.endswith(b"\n"):
+                        line += b"\n"
+                    k = _Hash(line) % shards
+                    if k not in outs:
+                        outs[k] = open(os.path.join(output_source, f"shard_{k}.txt"), "wb")
+                    outs[k].write(line)
+    finally:
+        for out in outs.values():
+            out.close()
+
+    # shards that got no records this time must not keep stale content
+    for k in range(shards):
+        shard_file = os.path.join(output_source, f"shard_{k}.txt")
+        if k not in outs and os.path.exists(shard_file):
+            os.remove(shard_file)
+
+    ring = HashRing(nodes)
+    assignment = {str(k): ring.owner(f"shard-{k}") for k in sorted(outs)}
+    moved = {
+        k: {"from": previous.get(k), "to": node}
+        for k, node in assignment.items()
+        if previous.get(k) != node
+    }
+
+    with open(state_file, "w", encoding="utf-8") as f:
+        json.dump({"shards": shards, "nodes": list(nodes), "assignment": assignment}, f)
+
+    layout = {node: [] for node in nodes}
+    for k, node in assignment.items():
+        layout[node].append(os.path.join(output_source, f"shard_{k}.txt"))
+
+    return {"nodes": layout, "moved": moved}
 
 def ModelSplit(input_source=None,output_source=None):
     pass
 
-def DataSplit(input_source="../PreProcess/", output_source="../PostProcess/", Objtype=1, chunks=1):
+def CapacityWeights(nodes, capacity):
+    """
+    Turns the capacity reports of the nodes (see User/SystemData.py:GetCapacity)
+    into chunk weights, in the same order as nodes.
+    Measured embeddings/sec is used when every node has it, otherwise CPU cores.
+    Nodes below MIN_RAM_GB are scaled down. Returns None if a node has no report.
+    """
+    if not capacity or any(node not in capacity for node in nodes):
+        return None
+
+    reports = [capacity[node] or {} for node in nodes]
+    use_rate = all((r.get("embeddings_per_sec") or 0) > 0 for r in reports)
+
+    weights = []
+    for r in reports:
+        if use_rate:
+            w = float(r["embeddings_per_sec"])
+        else:
+            w = float(r.get("cpu_cores") or 1)
+        ram_gb = r.get("ram_gb")
+        if ram_gb:
+            w *= min(1.0, float(ram_gb) / MIN_RAM_GB)
+        weights.append(max(w, 0.0))
+
+    if sum(weights) <= 0:
+        return None
+    return weights
+
+def DataSplit(input_source="../PreProcess/", output_source="../PostProcess/", Objtype=1, chunks=1, weights=None, tokenizer=None):
     """
-    Splits the input file into multiple chunk files.
+    Splits the input file into multiple chunk files and returns their paths.
+    Objtype 4 streams the input files straight into the chunk files, without
+    building sample1.txt, so memory use does not grow with the corpus.
+    Objtype 5 streams too, but balances the number of ENCODER_WINDOW-character
+    encoder windows per chunk, which is what the workers pay for. If tokenizer
+    (a callable returning the token count of a line) is given, it balances
+    model tokens instead.
+    weights (one per chunk, e.g. from CapacityWeights) sizes the chunks
+    proportionally instead of equally.
+
+    The input files (size, mtime, sha256) and the chunks produced are recorded in
+    output_source/manifest.json. A call with unchanged inputs and settings does no
+    work. With Objtype 4 or 5, data appended to the inputs only produces new tail chunks.
     """
+    if not input_source or not output_source:
+        raise ValueError("Both input_source and output_source must be provided.")
+    if chunks < 1:
+        raise ValueError("Chunks must be at least 1.")
+    if weights is not None and len(weights) != chunks:
+        raise ValueError("weights must have one entry per chunk.")
+
+    manifest_file = os.path.join(output_source, MANIFEST_NAME)
+    manifest = _LoadManifest(manifest_file)
+    settings = {"Objtype": Objtype, "chunks": chunks, "weights": weights}
+    if tokenizer is not None:
+        settings["tokenizer"] = getattr(tokenizer, "__qualname__", type(tokenizer).__name__)
+    inputs = _InputState(input_source, manifest.get("inputs", []))
+
+    if manifest.get("settings") == settings and _LayoutIntact(output_source, manifest.get("layout", [])):
+        layout = [os.path.join(output_source, c["name"]) for c in manifest["layout"]]
+        if _SameInputs(manifest["inputs"], inputs):
+            return layout
+
+        appended = _AppendedData(input_source, manifest["inputs"], inputs) if Objtype in (4, 5) else None
+        if appended:
+            try:
+                appended, trim = appended
+                # the last chunks end with the start of the line that was appended to
+                # (and the newline added after the last file): it moves to the tail.
+                # A chunk can close before that newline, so the line may span two chunks
+                while trim and layout:
+                    size = os.path.getsize(layout[-1])
+                    if size > trim:
+                        os.truncate(layout[-1], size - trim)
+                        break
+                    os.remove(layout.pop())
+                    trim -= size
+                tail_bytes = sum(os.path.getsize(p) - offset + 1 for p, offset in appended)
+                avg_chunk = sum(c["size"] for c in manifest["layout"]) / max(len(layout), 1)
+                tail_chunks = max(1, math.ceil(tail_bytes / max(avg_chunk, 1)))
+                if Objtype == 4:
+                    layout += _StreamSplit(appended, output_source, _Boundaries(tail_bytes, tail_chunks), first=len(layout) + 1)
+                else:
+                    layout += _StreamSplitLines(appended, output_source, tail_chunks, None, tokenizer, first=len(layout) + 1)
+                _SaveManifest(manifest_file, settings, inputs, layout)
+                _RemoveStaleChunks(output_source, layout)
+                return layout
+            except Exception as e:
+                print("Error while Splitting data - appended tail")
+                with open("../.log", "a", encoding="utf-8") as log:
+                    log.write(f"{time.ctime()} - Error while Splitting data - appended tail - {e}\n")
+
+    written = _Split(input_source, output_source, Objtype, chunks, weights, tokenizer)
+    if written is not None:
+        # types 1-3 write sample1.txt into input_source, so record the state after the split
+        _SaveManifest(manifest_file, settings, _InputState(input_source, inputs), written)
+        _RemoveStaleChunks(output_source, written)
+    return written
+
+def _Split(input_source, output_source, Objtype, chunks, weights, tokenizer=None):
+    """
+    Runs one split of the given Objtype. Returns the chunk files written,
+    or None if the split failed (the error goes to ../.log).
+    """
+    written = []
+
+    if Objtype == 4:
+        try:
+            os.makedirs(output_source, exist_ok=True)
+
+            files = _InputFiles(input_source)
+            # every file is followed by a newline, same as the concatenated text
+            total_bytes = sum(os.path.getsize(p) + 1 for p in files)
+            written = _StreamSplit(files, output_source, _Boundaries(total_bytes, chunks, weights))
+        except Exception as e:
+            print("Error while Splitting data - type 4")
+            with open("../.log", "a", encoding="utf-8") as log:
+                log.write(f"{time.ctime()} - Error while Splitting data - type 4 - {e}\n")
+            return None
+        return written
+
+    if Objtype == 5:
+        try:
+            os.makedirs(output_source, exist_ok=True)
+            written = _StreamSplitLines(_InputFiles(input_source), output_source, chunks, weights, tokenizer)
+        except Exception as e:
+            print("Error while Splitting data - type 5")
+            with open("../.log", "a", encoding="utf-8") as log:
+                log.write(f"{time.ctime()} - Error while Splitting data - type 5 - {e}\n")
+            return None
+        return written
 
     all_inp_files = os.listdir(input_source)
     text = ""
@@ -29,11 +266,6 @@ def DataSplit(input_source="../PreProcess/", output_source="../PostProcess/", Ob
     input_source = input_source+"/sample1.txt"
 
     if Objtype == 1:
-        if not input_source or not output_source:
-            raise ValueError("Both input_source and output_source must be provided.")
-        if chunks < 1:
-            raise ValueError("Chunks must be at least 1.")
-
         try:
             os.makedirs(output_source, exist_ok=True)
 
@@ -41,11 +273,11 @@ def DataSplit(input_source="../PreProcess/", output_source="../PostProcess/", Ob
                 lines = f.readlines()
 
             total_lines = len(lines)
-            chunk_size = (total_lines + chunks - 1) // chunks
+            bounds = _Boundaries(total_lines, chunks, weights)
 
             for i in range(chunks):
-                start = i * chunk_size
-                end = min(start + chunk_size, total_lines)
+                start = bounds[i - 1] if i else 0
+                end = bounds[i]
                 if start >= total_lines:
                     break
                 chunk_lines = lines[start:end]
@@ -53,17 +285,14 @@ def DataSplit(input_source="../PreProcess/", output_source="../PostProcess/", Ob
                 chunk_file = os.path.join(output_source, f"chunk_{i+1}.txt")
                 with open(chunk_file, "w", encoding="utf-8") as cf:
                     cf.writelines(chunk_lines)
+                written.append(chunk_file)
         except Exception as e:
             print("Error while Splitting data - type 1")
             with open("../.log", "a", encoding="utf-8") as log:
                 log.write(f"{time.ctime()} - Error while Splitting data - type 1 - {e}\n")
+            return None
 
     elif Objtype == 2:
-        if not input_source or not output_source:
-            raise ValueError("Both input_source and output_source must be provided.")
-        if chunks < 1:
-            raise ValueError("Chunks must be at least 1.")
-
         try:
             os.makedirs(output_source, exist_ok=True)
 
@@ -72,11 +301,11 @@ def DataSplit(input_source="../PreProcess/", output_source="../PostProcess/", Ob
 
             tokens = text.split()
             total_tokens = len(tokens)
-            chunk_size = (total_tokens + chunks - 1) // chunks
+            bounds = _Boundaries(total_tokens, chunks, weights)
 
             for i in range(chunks):
-                start = i * chunk_size
-                end = min(start + chunk_size, total_tokens)
+                start = bounds[i - 1] if i else 0
+                end = bounds[i]
                 if start >= total_tokens:
                     break
                 chunk_tokens = tokens[start:end]
@@ -84,17 +313,14 @@ def DataSplit(input_source="../PreProcess/", output_source="../PostProcess/", Ob
                 chunk_file = os.path.join(output_source, f"chunk_{i+1}.txt")
                 with open(chunk_file, "w", encoding="utf-8") as cf:
                     cf.write(" ".join(chunk_tokens))
+                written.append(chunk_file)
         except Exception as e:
             print("Error while Splitting data - type 2")
             with open("../.log", "a", encoding="utf-8") as log:
                 log.write(f"{time.ctime()} - Error while Splitting data - type 2 - {e}\n")
+            return None
     elif Objtype == 3:
         #Can use sentence-transformers or nltk for better sentence splitting
-        if not input_source or not output_source:
-            raise ValueError("Both input_source and output_source must be provided.")
-        if chunks < 1:
-            raise ValueError("Chunks must be at least 1.")
-
         try:
             os.makedirs(output_source, exist_ok=True)
 
@@ -104,11 +330,11 @@ def DataSplit(input_source="../PreProcess/", output_source="../PostProcess/", Ob
             # Split by paragraphs (two or more newlines)
             paragraphs = [p.strip() for p in text.split("\n\n") if p.strip()]
             total_paragraphs = len(paragraphs)
-            chunk_size = (total_paragraphs + chunks - 1) // chunks
+            bounds = _Boundaries(total_paragraphs, chunks, weights)
 
             for i in range(chunks):
-                start = i * chunk_size
-                end = min(start + chunk_size, total_paragraphs)
+                start = bounds[i - 1] if i else 0
+                end = bounds[i]
                 if start >= total_paragraphs:
                     break
                 chunk_paragraphs = paragraphs[start:end]
@@ -116,11 +342,298 @@ def DataSplit(input_source="../PreProcess/", output_source="../PostProcess/", Ob
                 chunk_file = os.path.join(output_source, f"chunk_{i+1}.txt")
                 with open(chunk_file, "w", encoding="utf-8") as cf:
                     cf.write("\n\n".join(chunk_paragraphs))
+                written.append(chunk_file)
         except Exception as e:
             print("Error while Splitting data - type 3")
             with open("../.log", "a", encoding="utf-8") as log:
                 log.write(f"{time.ctime()} - Error while Splitting data - type 3 - {e}\n")
+            return None
+
+    return written
 
 
+def _InputFiles(input_source):
+    """
+    Returns the files of input_source in a stable (sorted) order.
+    """
+    return [
+        os.path.join(input_source, name)
+        for name in sorted(os.listdir(input_source))
+        if os.path.isfile(os.path.join(input_source, name))
+    ]
+
+
+def _Boundaries(total, chunks, weights=None):
+    """
+    Returns the cumulative size at which each chunk ends.
+    """
+    if weights is None:
+        chunk_size = (total + chunks - 1) // chunks
+        return [min((i + 1) * chunk_size, total) for i in range(chunks)]
+
+    weight_sum = float(sum(weights))
+    if weight_sum <= 0:
+        raise ValueError("weights must add up to more than 0.")
+    bounds = []
+    running = 0.0
+    for w in weights:
+        running += w
+        bounds.append(min(int(round(total * running / weight_sum)), total))
+    bounds[-1] = total
+    return bounds
 
 
+def _StreamSplit(files, output_source, bounds, first=1):
+    """
+    Copies the input files block by block into chunk_N.txt files, numbered from
+    `first`. A chunk is closed at the first newline after its byte boundary, so
+    lines are never cut. A file can be given as (path, offset) to start mid-file.
+    Returns the list of chunk files written.
+    """
+    written = []
+    state = {"chunk": 0, "pos": 0, "out": None}
+
+    def write(data):
+        if not data:
+            return
+        if state["out"] is None:
+            chunk_file = os.path.join(output_source, f"chunk_{first + state['chunk']}.txt")
+            state["out"] = open(chunk_file, "wb")
+            written.append(chunk_file)
+        state["out"].write(data)
+        state["pos"] += len(data)
+
+    def rotate():
+        if state["out"] is not None:
+            state["out"].close()
+            state["out"] = None
+        state["chunk"] += 1
+
+    def pending():
+        # the last chunk takes everything that is left
+        return state["chunk"] < len(bounds) - 1
+
+    try:
+        for entry in files:
+            path, offset = entry if isinstance(entry, tuple) else (entry, 0)
+            with open(path, "rb") as f:
+                f.seek(offset)
+                while block := f.read(STREAM_BUFFER):
+                    start = 0
+                    while pending() and state["pos"] + len(block) - start >= bounds[state["chunk"]]:
+                        cut = bounds[state["chunk"]] - state["pos"] - 1 + start
+                        nl = block.find(b"\n", max(start, cut))
+                        if nl == -1:
+                            break
+                        write(block[start:nl + 1])
+                        start = nl + 1
+                        rotate()
+                    write(block[start:])
+            write(b"\n")
+            if pending() and state["pos"] >= bounds[state["chunk"]]:
+                rotate()
+    finally:
+        if state["out"] is not None:
+            state["out"].close()
+
+    return written
+
+
+def _Hash(key):
+    """
+    Stable 64-bit hash of a str or bytes key (Python's hash() is salted per process).
+    """
+    if isinstance(key, str):
+        key = key.encode("utf-8")
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(), "big")
+
+
+def _StreamSplitLines(files, output_source, chunks, weights, tokenizer=None, first=1):
+    """
+    Line-streaming split balanced on encode cost. The first pass adds up the
+    cost of every line (characters, counted in ENCODER_WINDOW windows, or
+    tokenizer tokens), the second writes each line to its chunk. Files are
+    followed by a newline, as in _StreamSplit. Returns the chunk files written.
+    """
+    cost = tokenizer if tokenizer is not None else len
+
+    def lines():
+        for entry in files:
+            path, offset = entry if isinstance(entry, tuple) else (entry, 0)
+            with open(path, "rb") as f:
+                f.seek(offset)
+                for raw in f:
+                    yield raw.decode("utf-8", errors="replace")
+            yield "\n"
+
+    total = sum(cost(line) for line in lines())
+    if tokenizer is None:
+        windows = math.ceil(total / ENCODER_WINDOW)
+        bounds = [b * ENCODER_WINDOW for b in _Boundaries(windows, chunks, weights)]
+    else:
+        bounds = _Boundaries(total, chunks, weights)
+
+    written = []
+    chunk = 0
+    spent = 0
+    out = None
+    try:
+        for line in lines():
+            if out is None:
+                chunk_file = os.path.join(output_source, f"chunk_{first + chunk}.txt")
+                out = open(chunk_file, "w", encoding="utf-8", newline="")
+                written.append(chunk_file)
+            out.write(line)
+            spent += cost(line)
+            if chunk < chunks - 1 and spent >= bounds[chunk]:
+                out.close()
+                out = None
+                chunk += 1
+    finally:
+        if out is not None:
+            out.close()
+
+    return written
+
+
+def Sha256(path, limit=None):
+    """
+    sha256 of a file (or of its first `limit` bytes), read in blocks.
+    """
+    digest = hashlib.sha256()
+    remaining = limit
+    with open(path, "rb") as f:
+        while True:
+            size = STREAM_BUFFER if remaining is None else min(STREAM_BUFFER, remaining)
+            block = f.read(size)
+            if not block:
+                break
+            digest.update(block)
+            if remaining is not None:
+                remaining -= len(block)
+                if remaining <= 0:
+                    break
+    return digest.hexdigest()
+
+
+def _InputState(input_source, known):
+    """
+    Returns name/size/mtime/sha256 of every input file. Files whose size and
+    mtime match `known` (the previous manifest) are not read again.
+    """
+    known = {entry["name"]: entry for entry in known}
+    state = []
+    for path in _InputFiles(input_source):
+        st = os.stat(path)
+        name = os.path.basename(path)
+        old = known.get(name)
+        if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+            sha = old["sha256"]
+        else:
+            sha = Sha256(path)
+        state.append({"name": name, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha256": sha})
+    return state
+
+
+def _SameInputs(old, new):
+    """
+    Inputs are the same if names, sizes and hashes match (mtime alone does not count).
+    """
+    key = lambda entry: (entry["name"], entry["size"], entry["sha256"])
+    return [key(e) for e in old] == [key(e) for e in new]
+
+
+def _AppendedData(input_source, old, new):
+    """
+    If the only change since the manifest is data appended to the last input file
+    and/or new files sorting after it, returns the (path, offset) list of the new
+    data and the number of bytes to cut from the end of the last chunk. Otherwise
+    returns None.
+
+    Data appended to the last file continues its last line, so the tail starts
+    at the beginning of that line, and that line (plus the newline written after
+    the file) is cut from the last chunk.
+    """
+    if not old or len(new) < len(old):
+        return None
+    if not _SameInputs(old[:-1], new[:len(old) - 1]):
+        return None
+
+    last_old, last_new = old[-1], new[len(old) - 1]
+    if last_old["name"] != last_new["name"] or last_new["size"] < last_old["size"]:
+        return None
+
+    appended = []
+    trim = 0
+    last_path = os.path.join(input_source, last_new["name"])
+    if last_new["size"] > last_old["size"]:
+        if Sha256(last_path, limit=last_old["size"]) != last_old["sha256"]:
+            return None
+        line_start = _LineStart(last_path, last_old["size"])
+        appended.append((last_path, line_start))
+        trim = last_old["size"] - line_start + 1
+    elif last_new["sha256"] != last_old["sha256"]:
+        return None
+
+    appended += [(os.path.join(input_source, e["name"]), 0) for e in new[len(old):]]
+    return (appended, trim) if appended else None
+
+
+def _LineStart(path, end):
+    """
+    Offset of the start of the line that contains byte end - 1 (end itself
+    if the file ends with a newline there).
+    """
+    with open(path, "rb") as f:
+        pos = end
+        while pos > 0:
+            size = min(STREAM_BUFFER, pos)
+            f.seek(pos - size)
+            block = f.read(size)
+            if pos == end and block.endswith(b"\n"):
+                return end
+            nl = block.rfind(b"\n")
+            if nl != -1:
+                return pos - size + nl + 1
+            pos -= size
+    return 0
+
+
+def _RemoveStaleChunks(output_source, chunk_files):
+    """
+    Deletes chunk_N.txt files left in output_source by an earlier split that
+    are not part of chunk_files.
+    """
+    keep = {os.path.basename(p) for p in chunk_files}
+    for name in os.listdir(output_source):
+        if name.startswith("chunk_") and name.endswith(".txt") and name not in keep:
+            os.remove(os.path.join(output_source, name))
+
+
+def _LoadManifest(manifest_file):
+    if not os.path.exists(manifest_file):
+        return {}
+    try:
+        with open(manifest_file, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def _SaveManifest(manifest_file, settings, inputs, chunk_files):
+    layout = [{"name": os.path.basename(p), "size": os.path.getsize(p)} for p in chunk_files]
+    with open(manifest_file, "w", encoding="utf-8") as f:
+        json.dump({"settings": settings, "inputs": inputs, "layout": layout}, f, indent=2)
+
+
+def _LayoutIntact(output_source, layout):
+    """
+    True if every chunk in the manifest layout is still on disk with its recorded size.
+    """
+    if not layout:
+        return False
+    for chunk in layout:
+        path = os.path.join(output_source, chunk["name"])
+        if not os.path.exists(path) or os.path.getsize(path) != chunk["size"]:
+            return False
+    return True
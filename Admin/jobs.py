@@ -0,0 +1,130 @@
+"""
+This file has the background job queue of the admin server. Long running work
+(splitting, bundling) is queued here so the HTTP request can return right away,
+and the job's progress can be polled by its ID.
+"""
+
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+MAX_FINISHED_JOBS = 200
+
+class Job:
+    """
+    One queued piece of work with per-stage status and timings.
+    """
+
+    def __init__(self, kind, on_change=None):
+        self.on_change = on_change
+        self.id = uuid.uuid4().hex[:12]
+        self.kind = kind
+        self.status = "queued"
+        self.stages = []
+        self.result = None
+        self.error = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """Block until the job has finished; returns False on timeout"""
+        return self._done.wait(timeout)
+
+    @contextmanager
+    def stage(self, name):
+        """Times one stage of the job; an exception marks the stage as failed"""
+        entry = {"name": name, "status": "running", "started": time.time(), "seconds": None}
+        with self._lock:
+            self.stages.append(entry)
+        self._changed()
+        try:
+            yield entry
+        except Exception:
+            entry["status"] = "failed"
+            raise
+        else:
+            entry["status"] = "done"
+        finally:
+            entry["seconds"] = round(time.time() - entry["started"], 4)
+            self._changed()
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change("jobs")
+
+    def to_dict(self):
+        with self._lock:
+            stages = [dict(s) for s in self.stages]
+        return {
+            "id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stages": stages,
+            "result": self.result,
+            "error": self.error,
+            "queuedSeconds": round((self.started or time.time()) - self.created, 4),
+            "runSeconds": round((self.finished or time.time()) - self.started, 4) if self.started else None,
+        }
+
+
+class JobQueue:
+    """
+    Runs jobs on a small thread pool. With the default single worker, jobs that
+    touch the same files (temp_input, zips) run one after another in FIFO order.
+    """
+
+    def __init__(self, workers=1, on_change=None):
+        self.on_change = on_change
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind, fn, *args, **kwargs):
+        """Queue fn(job, *args, **kwargs); its return value becomes job.result"""
+        job = Job(kind, on_change=self.on_change)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._prune()
+        job._changed()
+        self._pool.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _run(self, job, fn, args, kwargs):
+        job.status = "running"
+        job.started = time.time()
+        job._changed()
+        try:
+            job.result = fn(job, *args, **kwargs)
+            job.status = "done"
+        except Exception as e:
+            job.error = str(e)
+            job.status = "failed"
+            print(f"[JOB] {job.kind} {job.id} failed: {e}")
+            traceback.print_exc()
+        finally:
+            job.finished = time.time()
+            job._done.set()
+            job._changed()
+
+    def shutdown(self, wait=True):
+        """Stop taking jobs: running ones finish (if wait), queued ones are dropped"""
+        self._pool.shutdown(wait=wait, cancel_futures=True)
+
+    def _prune(self):
+        finished = [j for j in self._jobs.values() if j.status in ("done", "failed")]
+        for job in sorted(finished, key=lambda j: j.created)[:-MAX_FINISHED_JOBS or None]:
+            del self._jobs[job.id]
@@ -0,0 +1,124 @@
+"""
+This file is a small load test for the admin server. It hammers the dashboard
+routes from many threads, optionally while slow clients upload files to
+/api/receivedd, and prints throughput and latency percentiles. Run it once
+against the dev server (python main.py) and once against the production
+server (python serve.py) to compare.
+
+Usage: python loadtest.py --url http://localhost:5000 --concurrency 32 --duration 20 --uploaders 4
+"""
+
+import argparse
+import json
+import threading
+import time
+
+import requests
+
+DEFAULT_PATHS = [
+    "/api/health",
+    "/api/admin/dashboard",
+    "/api/admin/stats",
+    "/api/admin/nodes",
+    "/api/user/dashboard",
+]
+
+def Percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))]
+
+def _Poll(url, paths, deadline, latencies, errors, lock):
+    session = requests.Session()
+    i = 0
+    while time.time() < deadline:
+        path = paths[i % len(paths)]
+        i += 1
+        start = time.perf_counter()
+        try:
+            r = session.get(url + path, timeout=30)
+            ok = r.status_code < 500
+        except requests.RequestException:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            if ok:
+                latencies.append(elapsed)
+            else:
+                errors[0] += 1
+
+def _SlowUpload(url, deadline, size, rate, uploaded, lock):
+    """Uploads `size` bytes at roughly `rate` bytes/s, again and again until the deadline"""
+    def body():
+        block = b"x" * 64 * 1024
+        sent = 0
+        while sent < size and time.time() < deadline:
+            yield block
+            sent += len(block)
+            time.sleep(len(block) / rate)
+
+    boundary = "loadtestboundary"
+    def multipart():
+        yield (f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; "
+               f"filename=\"loadtest-upload.bin\"\r\nContent-Type: application/octet-stream\r\n\r\n").encode()
+        yield from body()
+        yield f"\r\n--{boundary}--\r\n".encode()
+
+    while time.time() < deadline:
+        try:
+            requests.post(url + "/api/receivedd", data=multipart(), timeout=size / rate + 60,
+                          headers={"Content-Type": f"multipart/form-data; boundary={boundary}"})
+            with lock:
+                uploaded[0] += 1
+        except requests.RequestException:
+            pass
+
+def Run(url, concurrency=32, duration=20, paths=None, uploaders=0, upload_mb=32, upload_rate_kb=512):
+    paths = paths or DEFAULT_PATHS
+    url = url.rstrip("/")
+    latencies, errors, uploaded = [], [0], [0]
+    lock = threading.Lock()
+    deadline = time.time() + duration
+
+    threads = [threading.Thread(target=_Poll, args=(url, paths, deadline, latencies, errors, lock))
+               for _ in range(concurrency)]
+    threads += [threading.Thread(target=_SlowUpload, daemon=True,
+                                 args=(url, deadline, upload_mb * 1024 * 1024, upload_rate_kb * 1024, uploaded, lock))
+                for _ in range(uploaders)]
+    start = time.time()
+    for t in threads:
+        t.start()
+    for t in threads[:concurrency]:
+        t.join()
+    elapsed = time.time() - start
+
+    return {
+        "url": url,
+        "concurrency": concurrency,
+        "uploaders": uploaders,
+        "seconds": round(elapsed, 2),
+        "requests": len(latencies),
+        "errors": errors[0],
+        "uploads_finished": uploaded[0],
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "latency_ms": {
+            "p50": round(Percentile(latencies, 50) * 1000, 1),
+            "p95": round(Percentile(latencies, 95) * 1000, 1),
+            "p99": round(Percentile(latencies, 99) * 1000, 1),
+            "max": round(max(latencies, default=0) * 1000, 1),
+        },
+    }
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test the admin server")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=20)
+    parser.add_argument("--path", action="append", dest="paths", help="Route to poll (repeatable)")
+    parser.add_argument("--uploaders", type=int, default=0, help="Slow concurrent uploads to /api/receivedd")
+    parser.add_argument("--upload-mb", type=int, default=32)
+    parser.add_argument("--upload-rate-kb", type=int, default=512, help="Upload speed per uploader in KB/s")
+    args = parser.parse_args()
+    print(json.dumps(Run(args.url, args.concurrency, args.duration, args.paths,
+                         args.uploaders, args.upload_mb, args.upload_rate_kb), indent=2))
@@ -1,13 +1,24 @@
 import subprocess
 import threading
 import time
+import json
 import requests
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, redirect, send_file
 from flask_cors import CORS
 import os
 from helper import *
 
 from userside import *
+from jobs import JobQueue
+from registry import NodeRegistry
+from scheduler import ChunkScheduler, OVERPARTITION
+from state import ClusterState
+from uploads import UploadStore, UploadError, PART_SIZE
+from metrics import Metrics
+from server import TransferServer
+from events import EventServer
+from merger import IncrementalMerger
+import finalrun
 
 allc = [
     {
@@ -18,15 +29,63 @@ allc = [
 
 ngrok_url = None
 received_nodes = []
+node_chunks = {}
+state = ClusterState()
+job_queue = JobQueue(on_change=state.bump)
+registry = NodeRegistry(on_change=state.bump)
+scheduler = ChunkScheduler(on_change=state.bump)
+state.refresh = registry.expire
+uploads = UploadStore(destination="receivedd")
+metrics = Metrics()
+
+# Serve node bundles as streamed zips built on request instead of writing {node_id}.zip files
+STREAM_BUNDLES = True
+# Event stream: seconds between keep-alive comments, and how long to gather a burst of changes
+EVENTS_KEEPALIVE = 15
+EVENTS_COALESCE = 0.25
+# Event streams are served by events.py on their own asyncio loop and port, started by
+# main()/serve.py; /api/admin/events redirects there. Without it the Flask route
+# streams itself, holding a server thread per stream, so it takes at most
+# MAX_EVENT_STREAMS (serve.py sizes it to a quarter of its threads)
+EVENTS_PORT = 5001
+event_server = None
+MAX_EVENT_STREAMS = 8
+
+# LAN transfer server (server.py) for workers on the same network, started by main()/serve.py
+LAN_TRANSFER = False
+LAN_PORT = 5002
+transfer_server = None
+
+# Live index over the node results (merger.py), updated as each one arrives; started by main()/serve.py
+LIVE_INDEX = True
+merger = None
+
+# Over-partition the corpus and let nodes pull chunks from the scheduler (/api/tasks/next)
+# instead of giving every node one fixed, capacity-weighted chunk
+SCHEDULE_CHUNKS = True
 
 app = Flask(__name__)
 
 # Configure CORS to allow requests from Next.js frontend (port 3000)
-CORS(app, origins=["http://localhost:3000", "http://127.0.0.1:3000"])
+CORS_ORIGINS = ["http://localhost:3000", "http://127.0.0.1:3000"]
+CORS(app, origins=CORS_ORIGINS)
+metrics.init_app(app)
+metrics.gauge("nodes", "Registered nodes by status",
+              lambda: {s: registry.count(s) for s in ("online", "maintenance", "offline")})
+metrics.gauge("tasks", "Scheduler tasks by status", scheduler.counts)
+metrics.gauge("jobs", "Jobs by status", lambda: {s: sum(j.status == s for j in job_queue.list())
+                                                 for s in ("queued", "running", "done", "failed")})
+metrics.gauge("event_subscribers", "Open /api/admin/events streams", lambda: state.subscribers)
+metrics.gauge("index_vectors", "Vectors searchable in the live index", lambda: merger.ntotal)
 
 # ====== FRONTEND API ROUTES ======
 # These routes provide data for the Next.js dashboard components
 
+@app.route("/api/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Request latency histograms, error counts, stage timers and gauges in Prometheus text format"""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
 @app.route("/api/health", methods=["GET"])
 def health_check():
     """Health check endpoint for frontend monitoring"""
@@ -53,125 +112,210 @@ def system_status():
 @app.route("/api/admin/stats", methods=["GET"])
 def admin_stats():
     """Get admin dashboard statistics"""
-    # Mock data - replace with actual logic if needed
-    return jsonify({
-        "totalNodes": len(received_nodes) if received_nodes else 3,
-        "onlineNodes": len([n for n in received_nodes if n]) if received_nodes else 2,
-        "maintenanceNodes": 1,
-        "runningTasks": 5,
-        "queuedTasks": 3,
-        "completedToday": 12,
-        "systemLoad": 67
-    })
+    return jsonify(AdminStats())
+
+def AdminStats():
+    """Data behind /api/admin/stats, also part of the dashboard snapshot"""
+    online = registry.by_status("online")
+    tasks = scheduler.counts()
+    return {
+        "totalNodes": registry.count(),
+        "onlineNodes": len(online),
+        "maintenanceNodes": registry.count("maintenance"),
+        "runningTasks": tasks["running"],
+        "queuedTasks": tasks["queued"],
+        "completedToday": scheduler.done_since(time.mktime(time.localtime()[:3] + (0, 0, 0, 0, 0, -1))),
+        "systemLoad": round(sum(n["metrics"].get("cpu_percent") or 0 for n in online) / len(online)) if online else 0
+    }
 
 @app.route("/api/admin/nodes", methods=["GET"])
 def admin_nodes():
     """Get all nodes for admin dashboard"""
-    # Mock data based on received_nodes - replace with actual logic if needed
-    nodes = []
-    if received_nodes:
-        for i, node_id in enumerate(received_nodes):
-            nodes.append({
-                "id": node_id,
-                "name": f"Node-{node_id}",
-                "status": "online" if i < 2 else "maintenance",
-                "gpuCount": 4,
-                "cpuCores": 16,
-                "memory": "32GB",
-                "utilization": 45 + (i * 15),
-                "location": f"Datacenter-{i+1}"
-            })
-    else:
-        # Default mock nodes when no received_nodes
-        nodes = [
-            {
-                "id": "n1",
-                "name": "Node-GPU-01",
-                "status": "online",
-                "gpuCount": 4,
-                "cpuCores": 16,
-                "memory": "64GB",
-                "utilization": 75,
-                "location": "Datacenter-A"
-            },
-            {
-                "id": "n2", 
-                "name": "Node-GPU-02",
-                "status": "online",
-                "gpuCores": 8,
-                "cpuCores": 32,
-                "memory": "128GB",
-                "utilization": 60,
-                "location": "Datacenter-B"
-            }
-        ]
-    return jsonify(nodes)
+    return jsonify(AdminNodes())
+
+def AdminNodes():
+    """Data behind /api/admin/nodes, also part of the dashboard snapshot"""
+    return [NodeView(node) for node in registry.all()]
+
+def NodeView(node):
+    """Registry record in the shape the dashboard expects"""
+    metrics = node["metrics"]
+    return {
+        "id": node["id"],
+        "name": f"Node-{node['id']}",
+        "status": node["status"],
+        "gpuCount": metrics.get("gpu_count", 0),
+        "cpuCores": metrics.get("cpu_cores", 0),
+        "memory": f"{round(metrics['ram_gb'])}GB" if metrics.get("ram_gb") else "unknown",
+        "utilization": round(metrics.get("cpu_percent") or 0),
+        "location": metrics.get("hostname") or node.get("address") or "unknown"
+    }
 
 @app.route("/api/admin/task-assignments", methods=["GET"])
 def admin_task_assignments():
-    """Get task assignments for admin dashboard"""
-    # Mock data - replace with actual logic if needed
-    return jsonify([
-        {
-            "id": "task-1",
-            "name": "ML Model Training",
-            "user": "user1",
-            "node": "n1",
-            "priority": "high",
-            "status": "running",
-            "estimatedTime": "2h 30m"
-        },
+    """Get task assignments for admin dashboard - every chunk task of the scheduler"""
+    return jsonify(AdminTaskAssignments())
+
+def AdminTaskAssignments():
+    """Data behind /api/admin/task-assignments, also part of the dashboard snapshot"""
+    estimate = scheduler.estimate()
+    return [
         {
-            "id": "task-2",
-            "name": "Data Processing",
-            "user": "user2", 
-            "node": "n2",
-            "priority": "medium",
-            "status": "queued",
-            "estimatedTime": "1h 15m"
+            "id": task["id"],
+            "name": os.path.basename(task["chunk"]),
+            "user": "admin",
+            "node": task["node"] or "",
+            "priority": "high" if task["priority"] < 0 else "medium",
+            "status": "completed" if task["status"] == "done" else task["status"],
+            "estimatedTime": FormatDuration(estimate) if estimate is not None and task["status"] != "done" else "-"
         }
-    ])
+        for task in scheduler.tasks()
+    ]
 
 @app.route("/api/admin/new-nodes", methods=["GET"])
 def admin_new_nodes():
-    """Get new nodes pending approval"""
-    # Mock data - replace with actual logic if needed
-    return jsonify([
+    """Get new nodes pending approval - online nodes that have not been given work yet"""
+    return jsonify(AdminNewNodes())
+
+def AdminNewNodes():
+    """Data behind /api/admin/new-nodes, also part of the dashboard snapshot"""
+    assigned = set(received_nodes)
+    return [
         {
-            "id": "n3",
-            "name": "Node-GPU-03",
-            "joinedAt": "2 hours ago",
+            "id": node["id"],
+            "name": f"Node-{node['id']}",
+            "joinedAt": f"{int((time.time() - node['joined']) // 60)} minutes ago",
             "status": "pending"
         }
-    ])
+        for node in registry.by_status("online") if node["id"] not in assigned
+    ]
 
 @app.route("/api/admin/current-assignments", methods=["GET"])
 def admin_current_assignments():
-    """Get current active task assignments"""
-    # Mock data - replace with actual logic if needed
-    return jsonify([
+    """Get current active task assignments - one entry per running copy of a chunk"""
+    return jsonify(AdminCurrentAssignments())
+
+def AdminCurrentAssignments():
+    """Data behind /api/admin/current-assignments, also part of the dashboard snapshot"""
+    return [
         {
-            "id": "assign-1",
-            "taskName": "Neural Network Training",
-            "userName": "alice",
-            "nodeName": "Node-GPU-01",
+            "id": f"{task['id']}@{node_id}",
+            "taskName": os.path.basename(task["chunk"]),
+            "userName": "admin",
+            "nodeName": f"Node-{node_id}",
             "status": "running"
-        },
-        {
-            "id": "assign-2",
-            "taskName": "Image Processing",
-            "userName": "bob",
-            "nodeName": "Node-GPU-02", 
-            "status": "queued"
         }
-    ])
+        for task in scheduler.tasks() if task["status"] == "running"
+        for node_id in task["nodes"]
+    ]
+
+def FormatDuration(seconds):
+    """1h 15m / 3m 20s style durations for the dashboard"""
+    seconds = int(seconds)
+    if seconds >= 3600:
+        return f"{seconds // 3600}h {seconds % 3600 // 60}m"
+    return f"{seconds // 60}m {seconds % 60}s"
+
+@app.route("/api/admin/dashboard", methods=["GET"])
+def admin_dashboard():
+    """Everything the admin dashboard shows in one cached, ETag-validated response"""
+    return SnapshotResponse("admin", lambda: {
+        "stats": AdminStats(),
+        "nodes": AdminNodes(),
+        "taskAssignments": AdminTaskAssignments(),
+        "newNodes": AdminNewNodes(),
+        "currentAssignments": AdminCurrentAssignments()
+    })
+
+def SnapshotResponse(name, build):
+    """JSON response for a state snapshot; 304 when the client's If-None-Match still matches"""
+    data, etag, version = state.snapshot(name, build)
+    response = jsonify({"version": version, **data})
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "no-cache"
+    return response.make_conditional(request)
+
+# Dashboard sections sent on the event stream when a topic changes
+EVENT_SECTIONS = {
+    "nodes": {"stats": AdminStats, "nodes": AdminNodes, "newNodes": AdminNewNodes},
+    "tasks": {"stats": AdminStats, "taskAssignments": AdminTaskAssignments, "currentAssignments": AdminCurrentAssignments},
+    "jobs": {"jobs": lambda: [j.to_dict() for j in job_queue.list()]},
+    "index": {"index": lambda: merger.status() if merger else None},
+}
+
+def EventSection(name, build):
+    # shared between all subscribers, rebuilt once per state version
+    data, _, _ = state.snapshot(f"event:{name}", build, ttl=0)
+    return data
+
+def EventFrame(kind, data):
+    return f"event: {kind}\nid: {state.version}\ndata: {json.dumps(data, default=str)}\n\n"
+
+def EventSnapshot():
+    """The first event of a stream: every section"""
+    sections = {}
+    for builders in EVENT_SECTIONS.values():
+        sections.update({name: EventSection(name, build) for name, build in builders.items()})
+    return EventFrame("snapshot", sections)
+
+def EventDelta(topics):
+    """The event for the changed topics, or None if none of them has a section"""
+    sections = {}
+    for topic in topics:
+        for name, build in EVENT_SECTIONS.get(topic, {}).items():
+            sections[name] = EventSection(name, build)
+    return EventFrame("delta", sections) if sections else None
+
+def StartEventServer(port=EVENTS_PORT):
+    """Starts the event stream server (events.py); /api/admin/events then redirects to it"""
+    global event_server
+    # registry.expire on keep-alive: nodes that stopped sending heartbeats only go offline when looked at
+    event_server = EventServer(state, EventSnapshot, EventDelta, port=port, keepalive=EVENTS_KEEPALIVE,
+                               coalesce=EVENTS_COALESCE, on_idle=registry.expire, origins=CORS_ORIGINS).start()
+    print(f"[EVENTS] Event streams on port {event_server.port}")
+    return event_server
+
+@app.route("/api/admin/events", methods=["GET"])
+def admin_events():
+    """Server-Sent Events: a full snapshot first, then only the sections that changed"""
+    if event_server:
+        # EventSource follows the redirect; the stream then holds no thread of this server
+        return redirect(event_server.url(request.host), code=307)
+    subscriber = state.subscribe(limit=MAX_EVENT_STREAMS)
+    if subscriber is None:
+        response = jsonify({"error": f"too many event streams (at most {MAX_EVENT_STREAMS}), poll /api/admin/dashboard instead"})
+        response.headers["Retry-After"] = "30"
+        return response, 503
+
+    def stream():
+        try:
+            yield "retry: 3000\n\n"
+            yield EventSnapshot()
+            while True:
+                if not subscriber.wait(EVENTS_KEEPALIVE):
+                    registry.expire()
+                    yield ": keep-alive\n\n"
+                    continue
+                time.sleep(EVENTS_COALESCE)
+                frame = EventDelta(subscriber.drain())
+                if frame:
+                    yield frame
+        finally:
+            state.unsubscribe(subscriber)
+
+    return Response(stream(), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # User API Routes  
 @app.route("/api/user/stats", methods=["GET"])
 def user_stats():
     """Get user dashboard statistics"""
+    return jsonify(UserStats())
+
+def UserStats():
+    """Data behind /api/user/stats, also part of the dashboard snapshot"""
     # Mock data - replace with actual logic if needed
-    return jsonify({
+    return {
         "activeTasks": 3,
         "completedToday": 7,
         "avgRuntime": "1h 45m",
@@ -180,13 +324,17 @@ def user_stats():
             "completedToday": 2,
             "avgRuntime": "15m"
         }
-    })
+    }
 
 @app.route("/api/user/gpus", methods=["GET"])
 def user_gpus():
     """Get GPU information for user dashboard"""
+    return jsonify(UserGPUs())
+
+def UserGPUs():
+    """Data behind /api/user/gpus, also part of the dashboard snapshot"""
     # Mock data - replace with actual logic if needed
-    return jsonify([
+    return [
         {
             "id": "gpu-1",
             "gpuName": "NVIDIA RTX 4090",
@@ -205,13 +353,17 @@ def user_gpus():
                 "total": 16
             }
         }
-    ])
+    ]
 
 @app.route("/api/user/tasks", methods=["GET"])
 def user_tasks():
     """Get user tasks for dashboard"""
+    return jsonify(UserTasks())
+
+def UserTasks():
+    """Data behind /api/user/tasks, also part of the dashboard snapshot"""
     # Mock data - replace with actual logic if needed
-    return jsonify([
+    return [
         {
             "id": "task-user-1",
             "name": "Image Classification",
@@ -236,16 +388,30 @@ def user_tasks():
             "duration": "0m",
             "gpuId": ""
         }
-    ])
+    ]
 
 @app.route("/api/user/processors", methods=["GET"])
 def user_processors():
     """Get processor information for user dashboard"""
+    return jsonify(UserProcessors())
+
+def UserProcessors():
+    """Data behind /api/user/processors, also part of the dashboard snapshot"""
     # Mock data - replace with actual logic if needed
-    return jsonify({
+    return {
         "activeProcessors": 6,
         "totalProcessors": 8,
         "efficiency": 87
+    }
+
+@app.route("/api/user/dashboard", methods=["GET"])
+def user_dashboard():
+    """Everything the user dashboard shows in one cached, ETag-validated response"""
+    return SnapshotResponse("user", lambda: {
+        "stats": UserStats(),
+        "gpus": UserGPUs(),
+        "tasks": UserTasks(),
+        "processors": UserProcessors()
     })
 
 # Node Management API Routes (integrating existing functionality)
@@ -260,30 +426,97 @@ def submit_nodes():
     if not isinstance(nodes, list):
         return jsonify({"error": "nodes should be a list"}), 400
     
+    extra = data.get("capacity") or {}
+    if not isinstance(extra, dict):
+        return jsonify({"error": "capacity should be an object of node ID to capacity"}), 400
+    capacity = {**registry.capacity(), **extra}
+    job = job_queue.submit("submit-nodes", ProcessNodes, nodes, capacity)
+    print(f"Queued job {job.id} for nodes {nodes}")
+
+    return jsonify({
+        "message": "Nodes queued for processing",
+        "nodes": nodes,
+        "job_id": job.id,
+        "status_url": f"/api/admin/jobs/{job.id}"
+    }), 202
+
+def ProcessNodes(job, nodes, capacity):
+    """Split the corpus for the given nodes and assign their bundles, one timed stage each"""
     global received_nodes
     received_nodes = nodes
 
     number_of_active_nodes = len(received_nodes)
-    
-    try:
-        # Use existing backend logic
-        DataSplit(input_source="mydata", output_source="temp_input", Objtype=1, chunks=number_of_active_nodes)
-
-        for i in range(len(received_nodes)):
-            CreateZip(f"temp_input/chunk_{i+1}.txt","mycmd", received_nodes[i], allcommands=allc)
-
-        print("Zip completed")
-        print(f"Received nodes from frontend: {received_nodes}")
-        
-        return jsonify({
-            "message": "Nodes processed successfully", 
-            "nodes": received_nodes,
-            "chunks_created": number_of_active_nodes
-        }), 200
-        
-    except Exception as e:
-        print(f"Error processing nodes: {e}")
-        return jsonify({"error": f"Failed to process nodes: {str(e)}"}), 500
+    if SCHEDULE_CHUNKS:
+        # nodes pull chunks at their own pace, so chunks stay equal-sized
+        weights = None
+        number_of_chunks = number_of_active_nodes * OVERPARTITION
+    else:
+        weights = CapacityWeights(received_nodes, capacity)
+        number_of_chunks = number_of_active_nodes
+
+    with job.stage("split"), metrics.stage("datasplit"):
+        chunk_files = DataSplit(input_source="mydata", output_source="temp_input", Objtype=5, chunks=number_of_chunks, weights=weights)
+        if chunk_files is None:
+            # DataSplit logs its errors to ../.log and returns None; fail the job (and the stage) instead
+            raise RuntimeError("DataSplit failed, see ../.log")
+
+    with job.stage("bundle"):
+        if SCHEDULE_CHUNKS:
+            scheduler.load(chunk_files, job_id=job.id)
+        else:
+            # tail chunks from appended data are handed out round-robin
+            AssignChunks(chunk_files)
+
+    print("Bundles ready")
+    print(f"Received nodes from frontend: {received_nodes}")
+    return {
+        "nodes": received_nodes,
+        "chunks_created": len(chunk_files),
+        "weighted": weights is not None
+    }
+
+@app.route("/api/admin/jobs", methods=["GET"])
+def admin_jobs():
+    """All known jobs, newest first"""
+    jobs = sorted(job_queue.list(), key=lambda j: j.created, reverse=True)
+    return jsonify([j.to_dict() for j in jobs])
+
+@app.route("/api/admin/jobs/<job_id>", methods=["GET"])
+def admin_job(job_id):
+    """Status, per-stage progress and timings of one job"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return jsonify({"error": "Job not found"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/api/nodes/capacity", methods=["POST"])
+def report_capacity():
+    """Workers report their capacity (User/SystemData.py:GetCapacity) for weighted splitting"""
+    data = request.get_json()
+    if not data or "node" not in data or not isinstance(data.get("capacity"), dict):
+        return jsonify({"error": "node and capacity are required"}), 400
+    registry.heartbeat(data["node"], data["capacity"], address=request.remote_addr)
+    return jsonify({"message": "Capacity recorded", "node": data["node"]}), 200
+
+@app.route("/api/nodes/heartbeat", methods=["POST"])
+def node_heartbeat():
+    """Workers call this every few seconds with their User/SystemData.py:GetMetrics"""
+    data = request.get_json()
+    if not data or "node" not in data:
+        return jsonify({"error": "node is required"}), 400
+    metrics = data.get("metrics") if isinstance(data.get("metrics"), dict) else {}
+    node = registry.heartbeat(data["node"], metrics, address=request.remote_addr)
+    return jsonify({"status": node["status"], "ttl": registry.ttl}), 200
+
+@app.route("/api/admin/nodes/<node_id>/status", methods=["POST"])
+def admin_node_status(node_id):
+    """Manually set a node's status, e.g. {"status": "maintenance"}"""
+    data = request.get_json()
+    if not data or data.get("status") not in ("online", "maintenance"):
+        return jsonify({"error": "status must be online or maintenance"}), 400
+    if not registry.set_status(node_id, data["status"]):
+        return jsonify({"error": "Node not found"}), 404
+    return jsonify(NodeView(registry.get(node_id))), 200
 
 # ====== EXISTING ROUTES ======
 
@@ -297,9 +530,63 @@ def receive_file():
         return jsonify({"error": "No selected file"}), 400
     os.makedirs("receivedd", exist_ok=True)
     save_path = os.path.join("receivedd", file.filename)
-    file.save(save_path)
+    with metrics.stage("upload"):
+        # written aside and renamed, so the merger never sees half a file
+        file.save(save_path + ".part")
+        os.replace(save_path + ".part", save_path)
+    NotifyMerger(save_path)
     return jsonify({"message": f"File saved to {save_path}"}), 200
 
+# Resumable uploads: init, then PUT parts in any order, then complete
+
+@app.route("/api/uploads", methods=["POST"])
+def upload_init():
+    """Start (or resume) an upload: {"filename", "size", "sha256"?, "part_size"?}"""
+    data = request.get_json() or {}
+    try:
+        upload = uploads.init(data.get("filename"), data.get("size"), data.get("sha256"),
+                              data.get("part_size") or PART_SIZE)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    return jsonify(upload), 201
+
+@app.route("/api/uploads/<upload_id>", methods=["GET"])
+def upload_status(upload_id):
+    """Parts received so far, missing parts and the contiguous acknowledged offset"""
+    try:
+        return jsonify(uploads.status(upload_id)), 200
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+
+@app.route("/api/uploads/<upload_id>/parts/<int:index>", methods=["PUT"])
+def upload_part(upload_id, index):
+    """Raw part body with its sha256 in the X-Checksum-Sha256 header"""
+    try:
+        with metrics.stage("upload_part"):
+            upload = uploads.write_part(upload_id, index, request.stream, request.headers.get("X-Checksum-Sha256"))
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    return jsonify({"part": index, "received": len(upload["received"]), "parts": upload["parts"],
+                    "offset": upload["offset"]}), 200
+
+@app.route("/api/uploads/<upload_id>/complete", methods=["POST"])
+def upload_complete(upload_id):
+    try:
+        with metrics.stage("upload_complete"):
+            result = uploads.complete(upload_id)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    NotifyMerger(result["path"])
+    return jsonify(result), 200
+
+@app.route("/api/uploads/<upload_id>", methods=["DELETE"])
+def upload_abort(upload_id):
+    try:
+        uploads.abort(upload_id)
+    except UploadError as e:
+        return jsonify({"error": str(e)}), e.status
+    return jsonify({"message": "Upload aborted"}), 200
+
 @app.route("/get_node", methods=["POST"])
 def get_node_legacy():
     """Legacy endpoint - kept for backward compatibility"""
@@ -315,19 +602,209 @@ def get_node_internal():
     if not isinstance(nodes, list):
         return jsonify({"error": "nodes should be a list"}), 400
     
-    global received_nodes
-    received_nodes = nodes
-
-    number_of_active_nodes = len(received_nodes)
-    DataSplit(input_source="mydata", output_source="temp_input", Objtype=1, chunks=number_of_active_nodes)
-
-    for i in range(len(received_nodes)):
-        CreateZip(f"temp_input/chunk_{i+1}.txt","mycmd", received_nodes[i], allcommands=allc)
-
-    print("Zip completed")
-    print(f"Received nodes from frontend:")
+    # goes through the queue so it never races a queued submit-nodes job
+    job = job_queue.submit("get-node", ProcessNodes, nodes, registry.capacity())
+    job.wait()
+    if job.status == "failed":
+        return jsonify({"error": f"Failed to process nodes: {job.error}"}), 500
     return jsonify({"message": "Nodes received", "nodes": received_nodes}), 200
 
+def AssignChunks(chunk_files):
+    """Map chunk files to received_nodes round-robin and build zips unless they are streamed"""
+    global node_chunks
+    n = len(received_nodes)
+    node_chunks = {node: chunk_files[i::n] for i, node in enumerate(received_nodes)}
+    if not STREAM_BUNDLES:
+        with metrics.stage("createzip"):
+            CreateZips(list(node_chunks.items()), "mycmd", allcommands=allc)
+
+def NodeChunks(node_id):
+    """Chunk files that belong in node_id's bundle right now"""
+    if SCHEDULE_CHUNKS:
+        return scheduler.current(node_id)
+    return node_chunks.get(node_id, [])
+
+def StartTransferServer(port=LAN_PORT):
+    """Starts the LAN transfer server; result files it receives land in receivedd/ like /api/receivedd uploads"""
+    global transfer_server
+    transfer_server = TransferServer(port=port, directory="receivedd",
+                                     on_file=lambda node_id, path: NotifyMerger(path)).start()
+    print(f"[LAN] Transfer server listening on port {transfer_server.port}")
+    return transfer_server
+
+@app.route("/api/admin/lan/nodes", methods=["GET"])
+def lan_nodes():
+    """Workers connected to the LAN transfer server"""
+    if transfer_server is None:
+        return jsonify({"error": "LAN transfer server is not running"}), 503
+    return jsonify({"nodes": transfer_server.connected()}), 200
+
+@app.route("/api/admin/lan/dispatch", methods=["POST"])
+def lan_dispatch():
+    """Push every connected node its bundle over the LAN, all nodes at once, as a background job"""
+    if transfer_server is None:
+        return jsonify({"error": "LAN transfer server is not running"}), 503
+    nodes = [n for n in transfer_server.connected() if NodeChunks(n)]
+    if not nodes:
+        return jsonify({"error": "No connected node has chunks assigned"}), 400
+    job = job_queue.submit("lan_dispatch", DispatchBundles, nodes)
+    return jsonify({"job_id": job.id, "status_url": f"/api/admin/jobs/{job.id}", "nodes": nodes}), 202
+
+def DispatchBundles(job, nodes):
+    with job.stage("bundle"), metrics.stage("createzip"):
+        zips = dict(zip(nodes, CreateZips([(n, NodeChunks(n)) for n in nodes], "mycmd", allcommands=allc)))
+    with job.stage("transfer"), metrics.stage("lan_dispatch"):
+        return transfer_server.dispatch(zips)
+
+# Live index: results are merged as they arrive, so questions work on partial results
+
+def StartMerger():
+    """Starts the incremental merger; it loads its last checkpoint and ingests what is new in receivedd/"""
+    global merger
+    merger = IncrementalMerger(directory="receivedd", on_change=state.bump, metrics=metrics).start()
+    print(f"[MERGE] Live index started with {merger.ntotal} vectors")
+    return merger
+
+def NotifyMerger(path):
+    if merger:
+        merger.notify(path)
+
+@app.route("/api/admin/index", methods=["GET"])
+def index_status():
+    """Files and vectors in the live index, vectors waiting for training, last checkpoint"""
+    if merger is None:
+        return jsonify({"error": "Live index is not running"}), 503
+    return jsonify(merger.status()), 200
+
+@app.route("/api/admin/index/search", methods=["POST"])
+def index_search():
+    """Nearest chunks for {"vector": [...]} or {"vectors": [[...], ...]}, with "k" (default 5)"""
+    if merger is None:
+        return jsonify({"error": "Live index is not running"}), 503
+    data = request.get_json() or {}
+    queries = data.get("vectors") or ([data["vector"]] if data.get("vector") else None)
+    if not queries:
+        return jsonify({"error": "vector or vectors is required"}), 400
+    try:
+        results = merger.search(queries, int(data.get("k", 5)))
+    except (ValueError, TypeError) as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify({"vectors": merger.ntotal, "results": results}), 200
+
+@app.route("/api/admin/index/finalize", methods=["POST"])
+def index_finalize():
+    """
+    Write final_index.faiss and merged_embeddings.npy as a background job: from
+    the live index, or with finalrun.py when the live index is off
+    """
+    job = job_queue.submit("finalize-index", FinalizeIndex)
+    return jsonify({"job_id": job.id, "status_url": f"/api/admin/jobs/{job.id}"}), 202
+
+def FinalizeIndex(job):
+    with job.stage("finalize"):
+        if merger:
+            with metrics.stage("merge_finalize"):
+                index, text_chunks = merger.finalize()
+        else:
+            index, text_chunks = finalrun.main(metrics=metrics)
+    return {"vectors": index.ntotal, "chunks": len(text_chunks)}
+
+@app.route("/api/tasks/next", methods=["POST"])
+def task_next():
+    """An idle node pulls its next chunk; 204 when there is nothing to do"""
+    data = request.get_json()
+    if not data or "node" not in data:
+        return jsonify({"error": "node is required"}), 400
+
+    # chunks held by nodes that stopped sending heartbeats go back in the queue
+    for node in registry.by_status("offline"):
+        scheduler.node_lost(node["id"])
+
+    task = scheduler.next(data["node"])
+    if task is None:
+        return "", 204
+    task["bundle_url"] = f"/{data['node']}.zip"
+    return jsonify(task), 200
+
+@app.route("/api/tasks/<task_id>/complete", methods=["POST"])
+def task_complete(task_id):
+    """A node finished a chunk (and uploaded its results)"""
+    data = request.get_json()
+    if not data or "node" not in data:
+        return jsonify({"error": "node is required"}), 400
+    accepted = scheduler.complete(task_id, data["node"])
+    return jsonify({"accepted": accepted}), 200
+
+@app.route("/api/tasks/<task_id>/fail", methods=["POST"])
+def task_fail(task_id):
+    """A node could not finish a chunk; it is retried on another node"""
+    data = request.get_json()
+    if not data or "node" not in data:
+        return jsonify({"error": "node is required"}), 400
+    accepted = scheduler.fail(task_id, data["node"], data.get("error"))
+    return jsonify({"accepted": accepted}), 200
+
+def SendVerified(path, mimetype=None):
+    """send_file with Range/If-Range support and the file's sha256 in X-Content-Sha256"""
+    path = os.path.abspath(path)
+    response = send_file(path, mimetype=mimetype, conditional=True, etag=True)
+    response.headers["X-Content-Sha256"] = FileSha256(path)
+    response.headers["Accept-Ranges"] = "bytes"
+    return response
+
+@app.route("/<node_id>.zip", methods=["GET"])
+@app.route("/api/bundle/<node_id>", methods=["GET"])
+def node_bundle(node_id):
+    """
+    Download a node's bundle - streamed while it is generated when STREAM_BUNDLES is on.
+    HEAD and Range requests get the zip built on disk instead, with Accept-Ranges, an
+    ETag and its sha256, so clients can fetch it in parallel segments and resume.
+    """
+    if not NodeChunks(node_id):
+        return jsonify({"error": f"No chunks assigned to {node_id}"}), 404
+    if not STREAM_BUNDLES or request.method == "HEAD" or "Range" in request.headers:
+        # no-op when the zip is already up to date
+        with metrics.stage("createzip"):
+            zip_filename = CreateZip(NodeChunks(node_id), "mycmd", node_id, allc)
+        return SendVerified(zip_filename, "application/zip")
+
+    zs = StreamZip(NodeChunks(node_id), "mycmd", allc)
+    return Response(metrics.iterate("bundle_stream", zs), mimetype="application/zip",
+                    headers={"Content-Disposition": f"attachment; filename={node_id}.zip"})
+
+@app.route("/api/bundle/<node_id>/manifest", methods=["GET"])
+def node_bundle_manifest(node_id):
+    """Content hashes of the code in a node's bundle, plus its data chunk names"""
+    if not NodeChunks(node_id):
+        return jsonify({"error": f"No chunks assigned to {node_id}"}), 404
+    return jsonify({
+        "code": CodeManifest("mycmd", allc),
+        "data": [os.path.basename(p) for p in NodeChunks(node_id)]
+    }), 200
+
+@app.route("/api/bundle/<node_id>/data", methods=["GET"])
+def node_bundle_data(node_id):
+    """A node's bundle without the code - only the PreProcess/ chunks (HEAD/Range as for the full bundle)"""
+    if not NodeChunks(node_id):
+        return jsonify({"error": f"No chunks assigned to {node_id}"}), 404
+    if request.method == "HEAD" or "Range" in request.headers:
+        with metrics.stage("createzip"):
+            zip_filename = CreateZip(NodeChunks(node_id), "mycmd", node_id, allc, include_code=False)
+        return SendVerified(zip_filename, "application/zip")
+    zs = StreamZip(NodeChunks(node_id), "mycmd", allc, include_code=False)
+    return Response(metrics.iterate("bundle_stream", zs), mimetype="application/zip",
+                    headers={"Content-Disposition": f"attachment; filename={node_id}_data.zip"})
+
+@app.route("/api/blob/<sha>", methods=["GET"])
+def code_blob(sha):
+    """A single code file of the current bundles, by sha256"""
+    blob = CodeBlob("mycmd", allc, sha)
+    if blob is None:
+        return jsonify({"error": "Unknown blob"}), 404
+    if isinstance(blob, bytes):
+        return Response(blob, mimetype="application/octet-stream")
+    return send_file(os.path.abspath(blob), mimetype="application/octet-stream")
+
 @app.route("/api/get_ngrok_url", methods=["GET"])
 def get_ngrok_url():
     """Get the ngrok public URL"""
@@ -373,11 +850,25 @@ def main():
     port = 5000  # Changed from 8000 to 5000 for frontend integration
     ngrok_proc = start_ngrok_http(port)
     threading.Thread(target=print_ngrok_url, daemon=True).start()
+    # debug=True runs this file twice: a reloader process that only watches the
+    # sources, and the child (WERKZEUG_RUN_MAIN set) that serves. One merger and
+    # one listening socket, in the child
+    serving = os.environ.get("WERKZEUG_RUN_MAIN") == "true"
+    if LAN_TRANSFER and serving:
+        StartTransferServer()
+    if LIVE_INDEX and serving:
+        StartMerger()
+    if serving:
+        StartEventServer()
     try:
         print(f"[FLASK] Starting Flask server on http://localhost:{port}")
         print(f"[FLASK] Frontend can access via: http://localhost:3000/api/flask/...")
         app.run(host="0.0.0.0", port=port, debug=True)
     finally:
+        if merger:
+            merger.stop()
+        if event_server:
+            event_server.stop()
         ngrok_proc.terminate()
         print("[NGROK] Tunnel closed.")
 
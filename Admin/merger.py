@@ -0,0 +1,352 @@
+"""
+This file has the incremental merger of the admin server. Instead of waiting
+for every node and running finalrun.py once, it ingests each result zip as soon
+as it lands in receivedd/ (an /api/receivedd upload, a finished resumable
+upload or a file from the LAN transfer server): the zip is extracted, its
+embeddings are added to a live FAISS index in ADD_BATCH row batches, and the
+index is checkpointed, so questions can be answered on partial results and the
+final merge only has to save what is already built.
+
+Zips are found through notify(path) from the upload routes and by a periodic
+scan of the directory, so results copied in by hand are picked up too. After a
+restart the last checkpoint is loaded and only what arrived since is ingested.
+Index IDs are row numbers in arrival order; a node that sends a result again
+with new content makes the index rebuild from all zips. Every zip is extracted
+to its own merged/<zip name>/ folder, since all nodes name their results
+n1_PostProcess/n1_*.npy.
+
+Usage: python merger.py [--index flat] [--once]
+"""
+
+import argparse
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+import zipfile
+from bisect import bisect_right
+from contextlib import nullcontext
+
+import numpy as np
+import faiss
+
+from finalrun import (ADD_BATCH, DEFAULT_EF_SEARCH, DEFAULT_NPROBE, INDEX_SPEC, IndexFactoryString,
+                      MergeEmbeddings, NpyShape, TextChunks, TuneIndex)
+
+# Seconds between scans of the received directory
+POLL_INTERVAL = 5
+# Least seconds between two checkpoints while results keep arriving
+CHECKPOINT_INTERVAL = 30
+# Vectors gathered before an index that needs training (IVF, PQ) is trained and filled
+TRAIN_ROWS = 50000
+
+class IncrementalMerger:
+    """
+    Keeps a live index over the result zips in `directory`. Extracted files go
+    to directory/merged/<zip name>, checkpoints to directory/live.
+    """
+
+    def __init__(self, directory="receivedd", spec=INDEX_SPEC, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH,
+                 train_rows=TRAIN_ROWS, on_change=None, metrics=None):
+        self.directory = directory
+        self.merged_dir = os.path.join(directory, "merged")
+        self.checkpoint_dir = os.path.join(directory, "live")
+        self.spec = spec
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.train_rows = train_rows
+        self.on_change = on_change
+        self.metrics = metrics
+        self.last_checkpoint = None
+        self._lock = threading.RLock()
+        self._checkpoint_lock = threading.Lock()
+        self._queue = queue.Queue()
+        self._stop = threading.Event()
+        self._thread = None
+        self._dirty = False
+        self._failed = {}
+        self._reset()
+        self._load()
+
+    def start(self):
+        """Ingests what is already there, then watches for new results in a background thread"""
+        self._thread = threading.Thread(target=self._run, name="merger", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._queue.put(None)
+        if self._thread:
+            self._thread.join()
+        self.checkpoint()
+
+    def notify(self, path):
+        """A result file has landed; ingest it without waiting for the next scan"""
+        self._queue.put(path)
+
+    def scan(self):
+        """Ingests every zip in the directory that is new or has changed; returns how many"""
+        names = sorted(f for f in os.listdir(self.directory) if f.endswith(".zip")) if os.path.isdir(self.directory) else []
+        return sum(self.ingest(os.path.join(self.directory, name)) for name in names)
+
+    def ingest(self, path):
+        """Extracts one result zip and adds its embeddings; returns False if there was nothing new"""
+        name = os.path.basename(path)
+        if not name.endswith(".zip"):
+            return False
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return False
+        key = [st.st_size, st.st_mtime_ns]
+        with self._lock:
+            known = self._files.get(name)
+            if (known and known["key"] == key) or self._failed.get(name) == key:
+                return False
+
+        target = os.path.join(self.merged_dir, name[:-len(".zip")])
+        try:
+            # into a fresh folder first, so a broken zip leaves the files of its last version alone
+            shutil.rmtree(target + ".tmp", ignore_errors=True)
+            with zipfile.ZipFile(path) as z:
+                members = sorted(m for m in z.namelist() if m.endswith(".npy"))
+                z.extractall(target + ".tmp")
+            sizes = [NpyShape(os.path.join(target + ".tmp", m))[0] for m in members]
+        except (zipfile.BadZipFile, OSError, ValueError) as e:
+            shutil.rmtree(target + ".tmp", ignore_errors=True)
+            # a zip still being copied in fails here too; it is retried once its size or mtime changes
+            print(f"[MERGE] Skipping {name}: {e}")
+            with self._lock:
+                self._failed[name] = key
+            return False
+
+        files = [os.path.join(target, m) for m in members]
+        with self.metrics.stage("merge") if self.metrics else nullcontext(), self._lock:
+            shutil.rmtree(target, ignore_errors=True)
+            os.replace(target + ".tmp", target)
+            self._failed.pop(name, None)
+            if name in self._files:
+                print(f"[MERGE] {name} changed, rebuilding the index")
+                others = [(n, self._files[n]) for n in self._files if n != name]
+                self._reset()
+                for other, entry in others:
+                    self._append(other, entry["key"], entry["embeddings"], entry["sizes"])
+            self._append(name, key, files, sizes)
+            self._flush()
+        print(f"[MERGE] {name}: {sum(sizes)} vectors, {self.ntotal} searchable")
+        self._changed()
+        return True
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal if self.index is not None else 0
+
+    def search(self, queries, k=5):
+        """
+        [[{"id", "distance", "file", "embeddings", "row"}, ...] per query] over
+        everything ingested so far: the result zip, and the .npy and row in it
+        that the vector came from. Nodes do not send one text per row, so the
+        text is looked up by the caller.
+        """
+        queries = np.ascontiguousarray(np.atleast_2d(queries), dtype=np.float32)
+        with self._lock:
+            if not self.ntotal:
+                return [[] for _ in queries]
+            if queries.shape[1] != self.index.d:
+                raise ValueError(f"query size {queries.shape[1]} does not match the index ({self.index.d})")
+            D, I = self.index.search(queries, k)
+            # files are kept in arrival order, so their starts are sorted
+            sources, starts = [], []
+            for name, entry in self._files.items():
+                start = entry["start"]
+                for path, rows in zip(entry["embeddings"], entry["sizes"]):
+                    sources.append((name, os.path.relpath(path, self.merged_dir)))
+                    starts.append(start)
+                    start += rows
+            hits = []
+            for ds, ids in zip(D, I):
+                hits.append([])
+                for d, i in zip(ds, ids):
+                    if i < 0:
+                        continue
+                    j = bisect_right(starts, i) - 1
+                    name, embeddings = sources[j]
+                    hits[-1].append({"id": int(i), "distance": float(d), "file": name,
+                                     "embeddings": embeddings, "row": int(i) - starts[j]})
+            return hits
+
+    def status(self):
+        with self._lock:
+            pending = sum(self._files[n]["rows"] for n in self._pending)
+            return {
+                "spec": self.spec,
+                "factory": self.factory,
+                "files": len(self._files),
+                "vectors": self.ntotal,
+                "pendingVectors": pending,
+                "failed": sorted(self._failed),
+                "lastCheckpoint": self.last_checkpoint,
+            }
+
+    def checkpoint(self):
+        """Writes the index and the list of ingested files to directory/live"""
+        with self._checkpoint_lock:
+            with self._lock:
+                if not self._dirty:
+                    return False
+                # copied under the lock, written to disk without holding up ingestion and searches
+                data = faiss.serialize_index(self.index) if self.index is not None else None
+                manifest = json.dumps({"spec": self.spec, "factory": self.factory, "ntotal": self.ntotal,
+                                       "next_id": self._next_id, "files": self._files, "pending": self._pending})
+                self._dirty = False
+
+            os.makedirs(self.checkpoint_dir, exist_ok=True)
+            index_path = os.path.join(self.checkpoint_dir, "index.faiss")
+            if data is not None:
+                data.tofile(index_path + ".tmp")
+                os.replace(index_path + ".tmp", index_path)
+            manifest_path = os.path.join(self.checkpoint_dir, "manifest.json")
+            with open(manifest_path + ".tmp", "w") as f:
+                f.write(manifest)
+            os.replace(manifest_path + ".tmp", manifest_path)
+            self.last_checkpoint = time.time()
+            return True
+
+    def finalize(self):
+        """
+        Trains on whatever has arrived if it is still waiting, then writes
+        final_index.faiss and merged_embeddings.npy like finalrun.py; returns
+        (index, text_chunks).
+        """
+        with self._lock:
+            self._flush(force=True)
+            if self.index is None:
+                raise ValueError("No embedding files to merge.")
+            files = [f for entry in self._files.values() for f in entry["embeddings"]]
+            MergeEmbeddings(files, os.path.join(self.directory, "merged_embeddings.npy"))
+            faiss.write_index(self.index, os.path.join(self.directory, "final_index.faiss"))
+        text_chunks = TextChunks(files)
+        self.checkpoint()
+        return self.index, text_chunks
+
+    def _run(self):
+        self.scan()
+        while not self._stop.is_set():
+            try:
+                path = self._queue.get(timeout=POLL_INTERVAL)
+            except queue.Empty:
+                path = None
+            try:
+                if path:
+                    self.ingest(path)
+                elif not self._stop.is_set():
+                    self.scan()
+                if self.last_checkpoint is None or time.time() - self.last_checkpoint >= CHECKPOINT_INTERVAL:
+                    self.checkpoint()
+            except Exception as e:
+                print(f"[MERGE] Error: {e}")
+
+    def _flush(self, force=False):
+        """Adds the pending files to the index, creating (and training) it first if needed"""
+        if not self._pending:
+            return
+        if self.index is None:
+            dims = {NpyShape(f)[1] for n in self._pending for f in self._files[n]["embeddings"]}
+            if len(dims) != 1:
+                raise ValueError(f"Embedding sizes differ between nodes: {sorted(dims)}")
+            d = dims.pop()
+            rows = sum(self._files[n]["rows"] for n in self._pending)
+            # sized for the training sample, so IVF lists get enough points each
+            factory = IndexFactoryString(self.spec, min(rows, self.train_rows), d)
+            index = faiss.index_factory(d, factory)
+            if not index.is_trained:
+                if rows < self.train_rows and not force:
+                    return
+                sample = np.concatenate([np.load(f, mmap_mode="r").reshape(-1, d)
+                                         for n in self._pending for f in self._files[n]["embeddings"]])
+                if len(sample) > self.train_rows:
+                    sample = sample[np.sort(np.random.default_rng(0).choice(len(sample), self.train_rows, replace=False))]
+                index.train(np.ascontiguousarray(sample, dtype=np.float32))
+            self.index = TuneIndex(index, self.nprobe, self.ef_search)
+            self.factory = factory
+
+        for name in self._pending:
+            for path in self._files[name]["embeddings"]:
+                rows, dim, _ = NpyShape(path)
+                if dim != self.index.d:
+                    raise ValueError(f"{path}: embedding size {dim} does not match the index ({self.index.d})")
+                emb = np.load(path, mmap_mode="r").reshape(rows, dim)
+                for start in range(0, rows, ADD_BATCH):
+                    self.index.add(np.ascontiguousarray(emb[start:start + ADD_BATCH], dtype=np.float32))
+        self._pending = []
+        self._dirty = True
+
+    def _append(self, name, key, files, sizes):
+        rows = sum(sizes)
+        self._files[name] = {"key": key, "embeddings": files, "sizes": sizes, "rows": rows, "start": self._next_id}
+        self._next_id += rows
+        self._pending.append(name)
+
+    def _reset(self):
+        self.index = None
+        self.factory = None
+        self._files = {}
+        self._pending = []
+        self._next_id = 0
+        self._dirty = True
+
+    def _load(self):
+        """Picks up the last checkpoint, if it matches the spec and its files are still there"""
+        manifest_path = os.path.join(self.checkpoint_dir, "manifest.json")
+        if not os.path.exists(manifest_path):
+            return
+        try:
+            with open(manifest_path) as f:
+                manifest = json.load(f)
+            index_path = os.path.join(self.checkpoint_dir, "index.faiss")
+            index = faiss.read_index(index_path) if os.path.exists(index_path) else None
+            ntotal = index.ntotal if index is not None else 0
+            files = manifest["files"]
+            if manifest["spec"] != self.spec or manifest["ntotal"] != ntotal:
+                raise ValueError("checkpoint does not match")
+            for entry in files.values():
+                if sum(entry["sizes"]) != entry["rows"] or not all(map(os.path.exists, entry["embeddings"])):
+                    raise ValueError("checkpoint does not match the extracted files")
+        except (OSError, ValueError, KeyError, RuntimeError) as e:
+            print(f"[MERGE] Ignoring checkpoint: {e}")
+            return
+        self.index = TuneIndex(index, self.nprobe, self.ef_search) if index is not None else None
+        self.factory = manifest.get("factory")
+        self._files = files
+        self._pending = manifest["pending"]
+        self._next_id = manifest["next_id"]
+        self._dirty = False
+        print(f"[MERGE] Loaded checkpoint: {len(files)} files, {ntotal} vectors")
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change("index")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge node results into a live index as they arrive")
+    parser.add_argument("--directory", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "receivedd"))
+    parser.add_argument("--index", default=INDEX_SPEC, help="flat, ivf-flat, ivf-pq, hnsw or an index_factory string")
+    parser.add_argument("--once", action="store_true", help="Ingest what is there, write the final index and exit")
+    args = parser.parse_args()
+
+    merger = IncrementalMerger(args.directory, args.index)
+    if args.once:
+        merger.scan()
+        index, _ = merger.finalize()
+        print(f"Final index written with {index.ntotal} vectors")
+    else:
+        merger.start()
+        print(f"[MERGE] Watching {args.directory} (Ctrl+C to stop)")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            merger.stop()
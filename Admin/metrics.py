@@ -0,0 +1,182 @@
+"""
+This file has the request and stage metrics of the admin server: a latency
+histogram, status and error counts per route, timers for the pipeline stages
+(DataSplit, CreateZip, bundle streaming, uploads, merge) and a few gauges, all
+rendered in the Prometheus text format for /api/metrics. Recording is a bisect
+and a few additions under a per-series lock, so it is cheap on every request.
+"""
+
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from flask import g, request
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+STAGE_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 10, 30, 60, 300, 900)
+
+class Histogram:
+    """Fixed buckets; counts[i] is the number of observations in (buckets[i-1], buckets[i]]"""
+
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def lines(self, name, labels):
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        out = []
+        cumulative = 0
+        for bound, n in zip(list(self.buckets) + ["+Inf"], counts):
+            cumulative += n
+            out.append(f"{name}_bucket{_Labels(labels, le=bound)} {cumulative}")
+        out.append(f"{name}_sum{_Labels(labels)} {total}")
+        out.append(f"{name}_count{_Labels(labels)} {count}")
+        return out
+
+class Metrics:
+    def __init__(self, prefix="devjam"):
+        self.prefix = prefix
+        self._requests = {}
+        self._statuses = {}
+        self._errors = {}
+        self._stages = {}
+        self._stage_errors = {}
+        self._gauges = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Time every request; the route label is the URL rule, so IDs in paths do not add series"""
+
+        @app.before_request
+        def _metrics_start():
+            g._metrics_start = time.perf_counter()
+
+        @app.after_request
+        def _metrics_record(response):
+            self._record(response.status_code)
+            return response
+
+        @app.teardown_request
+        def _metrics_teardown(exc):
+            # exceptions that skipped after_request (e.g. propagated in debug mode)
+            if exc is not None:
+                self._record(500)
+
+    def observe_request(self, route, method, status, seconds):
+        key = (route, method)
+        histogram = self._requests.get(key)
+        if histogram is None:
+            with self._lock:
+                histogram = self._requests.setdefault(key, Histogram(LATENCY_BUCKETS))
+        histogram.observe(seconds)
+        with self._lock:
+            status_key = (route, method, status)
+            self._statuses[status_key] = self._statuses.get(status_key, 0) + 1
+            if status >= 500:
+                self._errors[key] = self._errors.get(key, 0) + 1
+
+    def observe_stage(self, name, seconds, error=False):
+        histogram = self._stages.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self._stages.setdefault(name, Histogram(STAGE_BUCKETS))
+        histogram.observe(seconds)
+        if error:
+            with self._lock:
+                self._stage_errors[name] = self._stage_errors.get(name, 0) + 1
+
+    @contextmanager
+    def stage(self, name):
+        """with metrics.stage("datasplit"): ... - failures are counted as stage errors"""
+        start = time.perf_counter()
+        try:
+            yield
+        except BaseException:
+            self.observe_stage(name, time.perf_counter() - start, error=True)
+            raise
+        self.observe_stage(name, time.perf_counter() - start)
+
+    def iterate(self, name, iterable):
+        """Times a streamed response body from the first to the last chunk"""
+        start = time.perf_counter()
+        error = True
+        try:
+            yield from iterable
+            error = False
+        finally:
+            self.observe_stage(name, time.perf_counter() - start, error=error)
+
+    def gauge(self, name, help, fn):
+        """fn() returns a number, or a dict of {label value: number} for a `status` label"""
+        self._gauges[name] = (help, fn)
+
+    def render(self):
+        p = self.prefix
+        with self._lock:
+            requests = sorted(self._requests.items())
+            statuses = sorted(self._statuses.items())
+            errors = sorted(self._errors.items())
+            stages = sorted(self._stages.items())
+            stage_errors = sorted(self._stage_errors.items())
+
+        out = [f"# HELP {p}_http_request_duration_seconds Request latency by route",
+               f"# TYPE {p}_http_request_duration_seconds histogram"]
+        for (route, method), histogram in requests:
+            out += histogram.lines(f"{p}_http_request_duration_seconds", {"route": route, "method": method})
+
+        out += [f"# HELP {p}_http_requests_total Requests by route and status",
+                f"# TYPE {p}_http_requests_total counter"]
+        out += [f"{p}_http_requests_total{_Labels({'route': r, 'method': m, 'status': s})} {n}"
+                for (r, m, s), n in statuses]
+        out += [f"# HELP {p}_http_request_errors_total Requests that ended in a 5xx",
+                f"# TYPE {p}_http_request_errors_total counter"]
+        out += [f"{p}_http_request_errors_total{_Labels({'route': r, 'method': m})} {n}"
+                for (r, m), n in errors]
+
+        out += [f"# HELP {p}_stage_duration_seconds Pipeline stage duration",
+                f"# TYPE {p}_stage_duration_seconds histogram"]
+        for name, histogram in stages:
+            out += histogram.lines(f"{p}_stage_duration_seconds", {"stage": name})
+        out += [f"# HELP {p}_stage_errors_total Pipeline stages that raised",
+                f"# TYPE {p}_stage_errors_total counter"]
+        out += [f"{p}_stage_errors_total{_Labels({'stage': s})} {n}" for s, n in stage_errors]
+
+        for name, (help, fn) in sorted(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            out += [f"# HELP {p}_{name} {help}", f"# TYPE {p}_{name} gauge"]
+            if isinstance(value, dict):
+                out += [f"{p}_{name}{_Labels({'status': k})} {v}" for k, v in sorted(value.items())]
+            else:
+                out.append(f"{p}_{name} {value}")
+        return "\n".join(out) + "\n"
+
+    def _record(self, status):
+        start = g.pop("_metrics_start", None)
+        if start is None:
+            return
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        self.observe_request(route, request.method, status, time.perf_counter() - start)
+
+def _Labels(labels, **extra):
+    labels = dict(labels, **extra)
+    return "{" + ",".join(f'{k}="{_Escape(v)}"' for k, v in labels.items()) + "}"
+
+def _Escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
@@ -1,6 +1,7 @@
 import os
 import zipfile
 import shutil
+from formats import STORED_EXTENSIONS  # common/formats.py, shipped next to this file in the bundle
 
 def rename_file(old_path, new_path):
     os.rename(old_path, new_path)
@@ -27,6 +28,10 @@ with zipfile.ZipFile(zip_filename, 'w', zipfile.ZIP_DEFLATED) as zipf:
         for file in files:
             file_path = os.path.join(root, file)
             arcname = os.path.relpath(file_path, parent_dir)
-            zipf.write(file_path, arcname)
+            # embeddings are dense floats: deflating them costs CPU and saves almost nothing
+            if os.path.splitext(file)[1].lower() in STORED_EXTENSIONS:
+                zipf.write(file_path, arcname, zipfile.ZIP_STORED)
+            else:
+                zipf.write(file_path, arcname, zipfile.ZIP_DEFLATED, 1)
 
 
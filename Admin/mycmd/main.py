@@ -20,14 +20,27 @@ class SimpleTextQA:
 		emb = self.model.encode(chunks, convert_to_numpy=True)
 		self.embeddings_list.append(emb)
 
-	def finalize_index(self):
-		"""Merge all embeddings and build the FAISS index. Call after all chunks are added."""
+	def finalize_index(self, index_spec="Flat", nprobe=16, ef_search=64):
+		"""
+		Merge all embeddings and build the FAISS index. Call after all chunks are added.
+		index_spec is a faiss index_factory string ("Flat", "IVF64,Flat", "IVF64,PQ48", "HNSW32");
+		indexes that need training are trained on the embeddings themselves.
+		"""
 		if not self.embeddings_list:
 			raise ValueError("No data to build index. Add text chunks first.")
 		all_embeddings = np.vstack(self.embeddings_list)
 		self.embeddings = all_embeddings
-		self.index = faiss.IndexFlatL2(all_embeddings.shape[1])
+		self.index = faiss.index_factory(all_embeddings.shape[1], index_spec)
+		if not self.index.is_trained:
+			self.index.train(all_embeddings)
 		self.index.add(all_embeddings)
+		# as finalrun.TuneIndex: set the parameters the index has (e.g. efSearch of "IDMap,HNSW32") and skip the others
+		params = faiss.ParameterSpace()
+		for name, value in (("nprobe", nprobe), ("efSearch", ef_search)):
+			try:
+				params.set_index_parameter(self.index, name, value)
+			except RuntimeError:
+				pass
 
 	def answer(self, question, top_k=1):
 		"""Finds the most relevant chunk(s) for the question."""
@@ -0,0 +1,124 @@
+"""
+This file has the in-memory registry of worker nodes. Workers send heartbeats
+with their User/SystemData.py metrics; nodes that stop sending them go offline
+after NODE_TTL seconds and are dropped after NODE_EVICT seconds.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+NODE_TTL = 30
+NODE_EVICT = 600
+
+class NodeRegistry:
+    """
+    Live and offline nodes are kept in two OrderedDicts ordered by last
+    heartbeat, so expiry only looks at the oldest entries of each. A
+    status -> node IDs index keeps lookups and counts by status O(1).
+    """
+
+    def __init__(self, ttl=NODE_TTL, evict_after=NODE_EVICT, on_change=None):
+        self.ttl = ttl
+        self.evict_after = evict_after
+        self.on_change = on_change
+        self._live = OrderedDict()
+        self._offline = OrderedDict()
+        self._by_status = {}
+        self._lock = threading.Lock()
+
+    def heartbeat(self, node_id, metrics=None, address=None):
+        """Record a heartbeat; unknown nodes are registered. Returns the node record"""
+        now = time.time()
+        with self._lock:
+            node = self._live.pop(node_id, None) or self._offline.pop(node_id, None)
+            if node is None:
+                node = {"id": node_id, "joined": now, "status": None, "metrics": {}, "address": address}
+            self._live[node_id] = node
+            node["last_seen"] = now
+            if metrics:
+                # a value the node did not measure this time (None) keeps the last one it did
+                node["metrics"].update({k: v for k, v in metrics.items() if v is not None})
+            if address:
+                node["address"] = address
+            if node["status"] in (None, "offline"):
+                self._set_status(node, "online")
+            self._expire(now)
+            self._changed()
+            return dict(node)
+
+    def set_status(self, node_id, status):
+        """Manually set a node's status (e.g. maintenance); returns False if unknown"""
+        with self._lock:
+            node = self._find(node_id)
+            if node is None:
+                return False
+            self._set_status(node, status)
+            self._changed()
+            return True
+
+    def get(self, node_id):
+        with self._lock:
+            self._expire(time.time())
+            node = self._find(node_id)
+            return dict(node) if node else None
+
+    def by_status(self, status):
+        with self._lock:
+            self._expire(time.time())
+            return [dict(self._find(i)) for i in self._by_status.get(status, ())]
+
+    def count(self, status=None):
+        with self._lock:
+            self._expire(time.time())
+            if status is None:
+                return len(self._live) + len(self._offline)
+            return len(self._by_status.get(status, ()))
+
+    def all(self):
+        with self._lock:
+            self._expire(time.time())
+            return [dict(node) for node in (*self._live.values(), *self._offline.values())]
+
+    def capacity(self):
+        """{node_id: metrics} of the nodes that are not offline, for CapacityWeights"""
+        with self._lock:
+            self._expire(time.time())
+            return {i: dict(n["metrics"]) for i, n in self._live.items()}
+
+    def expire(self):
+        """Move nodes without a recent heartbeat offline (and drop old ones) now"""
+        with self._lock:
+            self._expire(time.time())
+
+    def _set_status(self, node, status):
+        if node["status"] is not None:
+            self._by_status.get(node["status"], set()).discard(node["id"])
+        node["status"] = status
+        self._by_status.setdefault(status, set()).add(node["id"])
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change("nodes")
+
+    def _find(self, node_id):
+        return self._live.get(node_id) or self._offline.get(node_id)
+
+    def _expire(self, now):
+        # oldest heartbeat first; stop at the first node that is still fresh
+        while self._live:
+            node_id, node = next(iter(self._live.items()))
+            if now - node["last_seen"] < self.ttl:
+                break
+            del self._live[node_id]
+            self._offline[node_id] = node
+            self._set_status(node, "offline")
+            self._changed()
+
+        while self._offline:
+            node_id, node = next(iter(self._offline.items()))
+            if now - node["last_seen"] < self.evict_after:
+                break
+            del self._offline[node_id]
+            self._by_status.get(node["status"], set()).discard(node_id)
+            self._changed()
@@ -0,0 +1,209 @@
+"""
+This file has the chunk scheduler of the admin server. The corpus is split into
+many more chunks than there are nodes, and idle nodes pull the next chunk from a
+priority queue, so a slow or dead node only holds up the chunk it is working on.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+OVERPARTITION = 4       # chunks per node
+LEASE_SECONDS = 900     # a chunk not finished within this time is handed out again
+MAX_ATTEMPTS = 3        # failures before a chunk is given up
+SPECULATE_FRACTION = 0.1  # speculate once only this share of chunks is left running
+MAX_COPIES = 2          # running copies of a chunk, including speculative ones
+
+class ChunkScheduler:
+    """
+    Tasks wait in a heap ordered by (priority, sequence); failed chunks go back
+    with a higher priority so they are retried first, and never by the node that
+    failed them while other nodes ask for work. Near the end of a job, idle nodes
+    get a second copy of the oldest running chunk (speculative execution); the
+    first copy to finish wins.
+    """
+
+    def __init__(self, lease=LEASE_SECONDS, max_attempts=MAX_ATTEMPTS,
+                 speculate_fraction=SPECULATE_FRACTION, max_copies=MAX_COPIES, on_change=None):
+        self.lease = lease
+        self.max_attempts = max_attempts
+        self.speculate_fraction = speculate_fraction
+        self.max_copies = max_copies
+        self.on_change = on_change
+        self._tasks = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._durations = []
+        self._nodes = set()
+        self._lock = threading.Lock()
+
+    def load(self, chunk_files, job_id=None):
+        """Replace the current work with one task per chunk file"""
+        with self._lock:
+            self._tasks = {}
+            self._heap = []
+            self._durations = []
+            self._nodes = set()
+            for i, chunk in enumerate(chunk_files):
+                task_id = f"{job_id or 'task'}-{i+1}"
+                self._tasks[task_id] = {
+                    "id": task_id,
+                    "chunk": chunk,
+                    "priority": 0,
+                    "status": "queued",
+                    "attempts": 0,
+                    "running": {},      # node_id -> start time
+                    "failed_on": set(),
+                    "node": None,
+                    "seconds": None,
+                    "finished": None,
+                }
+                self._push(self._tasks[task_id])
+            self._changed()
+
+    def next(self, node_id):
+        """Give node_id its next task, or None if there is nothing to do"""
+        with self._lock:
+            now = time.time()
+            self._nodes.add(node_id)
+            self._expire(now)
+
+            skipped = []
+            task = None
+            while self._heap:
+                _, _, task_id = heapq.heappop(self._heap)
+                candidate = self._tasks.get(task_id)
+                if candidate is None or candidate["status"] != "queued":
+                    continue
+                # leave a retry to the other nodes, unless they all failed it too
+                if node_id in candidate["failed_on"] and self._nodes - candidate["failed_on"]:
+                    skipped.append(candidate)
+                    continue
+                task = candidate
+                break
+            for candidate in skipped:
+                self._push(candidate)
+
+            if task is None:
+                task = self._speculative(node_id)
+                if task is None:
+                    return None
+
+            task["status"] = "running"
+            task["running"][node_id] = now
+            task["node"] = node_id
+            self._changed()
+            return self._view(task, node_id)
+
+    def complete(self, task_id, node_id):
+        """First copy to finish completes the task; returns False for unknown/late reports"""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or task["status"] == "done":
+                return False
+            started = task["running"].pop(node_id, None)
+            task["status"] = "done"
+            task["node"] = node_id
+            task["running"] = {}
+            task["finished"] = time.time()
+            if started is not None:
+                task["seconds"] = round(time.time() - started, 2)
+                self._durations.append(task["seconds"])
+            self._changed()
+            return True
+
+    def fail(self, task_id, node_id, error=None):
+        """A node gave up on a task; it is retried elsewhere unless it ran out of attempts"""
+        with self._lock:
+            task = self._tasks.get(task_id)
+            if task is None or task["status"] == "done" or node_id not in task["running"]:
+                return False
+            del task["running"][node_id]
+            self._retry(task, node_id, error)
+            return True
+
+    def node_lost(self, node_id):
+        """Requeue everything a node was running (e.g. it went offline)"""
+        with self._lock:
+            # a lost node no longer counts as another candidate for retries
+            self._nodes.discard(node_id)
+            for task in self._tasks.values():
+                if node_id in task["running"]:
+                    del task["running"][node_id]
+                    self._retry(task, node_id, "node lost")
+
+    def current(self, node_id):
+        """Chunk files node_id is working on right now"""
+        with self._lock:
+            return [t["chunk"] for t in self._tasks.values() if node_id in t["running"]]
+
+    def tasks(self):
+        with self._lock:
+            return [self._view(t) for t in self._tasks.values()]
+
+    def counts(self):
+        with self._lock:
+            counts = {"queued": 0, "running": 0, "done": 0, "failed": 0}
+            for t in self._tasks.values():
+                counts[t["status"]] += 1
+            return counts
+
+    def done_since(self, since):
+        """Tasks finished at or after the `since` timestamp"""
+        with self._lock:
+            return sum(1 for t in self._tasks.values() if t["status"] == "done" and t["finished"] >= since)
+
+    def estimate(self):
+        """Average seconds per finished task, or None before the first one finishes"""
+        with self._lock:
+            if not self._durations:
+                return None
+            return sum(self._durations) / len(self._durations)
+
+    def _changed(self):
+        if self.on_change:
+            self.on_change("tasks")
+
+    def _push(self, task):
+        heapq.heappush(self._heap, (task["priority"], next(self._seq), task["id"]))
+
+    def _retry(self, task, node_id, error):
+        self._changed()
+        task["failed_on"].add(node_id)
+        task["attempts"] += 1
+        task["error"] = error
+        if task["running"]:
+            return  # another copy is still going
+        if task["attempts"] >= self.max_attempts:
+            task["status"] = "failed"
+            return
+        task["status"] = "queued"
+        task["priority"] -= 1
+        self._push(task)
+
+    def _expire(self, now):
+        for task in self._tasks.values():
+            for node_id, started in list(task["running"].items()):
+                if now - started > self.lease:
+                    del task["running"][node_id]
+                    self._retry(task, node_id, "lease expired")
+
+    def _speculative(self, node_id):
+        running = [t for t in self._tasks.values() if t["status"] == "running"]
+        if not running or len(running) > max(1, self.speculate_fraction * len(self._tasks)):
+            return None
+        candidates = [
+            t for t in running
+            if node_id not in t["running"] and len(t["running"]) < self.max_copies
+        ]
+        if not candidates:
+            return None
+        return min(candidates, key=lambda t: min(t["running"].values()))
+
+    def _view(self, task, node_id=None):
+        view = {k: v for k, v in task.items() if k not in ("running", "failed_on")}
+        view["nodes"] = sorted(task["running"])
+        if node_id is not None:
+            view["speculative"] = len(task["running"]) > 1
+        return view
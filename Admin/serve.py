@@ -0,0 +1,98 @@
+"""
+This file is the production entry point of the admin server. It serves the
+same Flask app as main.py, but on waitress instead of the Werkzeug dev server:
+a pool of worker threads, request bodies buffered before a thread is taken (so
+slow uploads to /api/receivedd do not block the dashboard), connection
+timeouts and a graceful shutdown on SIGINT/SIGTERM.
+
+There is no per-request timeout: waitress cannot stop a handler that is
+running in one of its threads. CHANNEL_TIMEOUT closes connections that stay
+idle or stall while sending or reading, and the handlers that can run long
+(submit-nodes, lan_dispatch, index finalize) answer 202 at once and
+run as jobs in main.py's JobQueue, polled through /api/admin/jobs.
+
+Everything runs in one process on purpose: the node registry, job queue,
+scheduler and cluster state live in memory, so several processes would each
+see only part of the cluster. Scale with --threads, not with processes.
+
+Usage: python serve.py [--port 5000] [--threads 32] [--ngrok] [--lan]
+"""
+
+import argparse
+import os
+import signal
+import threading
+
+from waitress import create_server
+
+import main
+from main import app, job_queue, start_ngrok_http, print_ngrok_url
+
+# Worker threads; /api/admin/events streams are served by events.py and hold none of them
+SERVE_THREADS = 32
+# Seconds a connection may go without any traffic (idle keep-alive, or a client that
+# stalls mid-request) before it is closed; this is not a limit on handler run time
+CHANNEL_TIMEOUT = 120
+# Connections accepted at once before new ones wait in the backlog
+CONNECTION_LIMIT = 1000
+# Largest accepted request body (chunk uploads, embeddings)
+MAX_BODY = 4 * 1024 ** 3
+
+def Serve(host="0.0.0.0", port=5000, threads=SERVE_THREADS, ngrok=False, lan=False):
+    server = create_server(
+        app,
+        host=host,
+        port=port,
+        threads=threads,
+        channel_timeout=CHANNEL_TIMEOUT,
+        connection_limit=CONNECTION_LIMIT,
+        max_request_body_size=MAX_BODY,
+        ident="devjam-admin",
+    )
+
+    def stop(signum, frame):
+        # run() catches SystemExit, stops accepting and gives in-flight requests a few seconds
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    ngrok_proc = None
+    if ngrok:
+        ngrok_proc = start_ngrok_http(port)
+        threading.Thread(target=print_ngrok_url, daemon=True).start()
+
+    if lan or main.LAN_TRANSFER:
+        main.StartTransferServer()
+    if main.LIVE_INDEX:
+        main.StartMerger()
+    # a quarter of the pool at most if the Flask route has to stream itself
+    main.MAX_EVENT_STREAMS = max(1, threads // 4)
+    main.StartEventServer()
+
+    print(f"[SERVE] http://{host}:{port} with {threads} threads (pid {os.getpid()})")
+    try:
+        server.run()
+    finally:
+        print("[SERVE] Shutting down, waiting for running jobs...")
+        job_queue.shutdown(wait=True)
+        if main.transfer_server:
+            main.transfer_server.stop()
+        if main.merger:
+            main.merger.stop()
+        if main.event_server:
+            main.event_server.stop()
+        if ngrok_proc:
+            ngrok_proc.terminate()
+            print("[NGROK] Tunnel closed.")
+        print("[SERVE] Stopped.")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Production server for the admin API")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--threads", type=int, default=SERVE_THREADS)
+    parser.add_argument("--ngrok", action="store_true", help="Also open the ngrok tunnel for nodes")
+    parser.add_argument("--lan", action="store_true", help="Also start the LAN transfer server (server.py)")
+    args = parser.parse_args()
+    Serve(args.host, args.port, args.threads, args.ngrok, args.lan)
@@ -1,90 +1,342 @@
-import socket
+"""
+This file has the LAN transfer server of the admin. TransferServer runs an
+asyncio loop in a background thread and holds any number of worker
+connections at once: bundles are pushed to many nodes concurrently and result
+files are received from all of them at the same time. main.py drives it
+through its thread-safe methods; run_server() is the interactive console, and
+receive_messages()/send_file() are the blocking path used by benchmarks/pipeline.py.
+Frames are the ones in common/protocol.py.
+"""
+
+import asyncio
+import hashlib
+import re
+import shlex
+import sys
+import tempfile
 import threading
-import time
 import os
-from core import GetIP 
+import time
+import zlib
+from core import GetIP
+from helper import Sha256
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from protocol import (BLOCK, BUFFER_SIZE, FILE, HEADER, MAGIC, MESSAGE, RAW, VERSION, ZLIB,
+                      ChooseCodec, CompressBlocks, FrameHeader, LinkStats, ProtocolError,
+                      Receiver, SendFiles, Tune)
 
-BUFFER_SIZE = 1024
+# Bytes a connection may buffer unread before its reads pause (per-connection flow control)
+READ_LIMIT = 4 * 1024 * 1024
+# Unsent bytes per connection above which senders wait for the socket to drain
+WRITE_HIGH_WATER = 8 * 1024 * 1024
+BACKLOG = 512
 
-def receive_messages(conn):
-    """Thread to constantly receive messages or files from client"""
-    while True:
-        try:
-            data = conn.recv(BUFFER_SIZE)
-            if not data:
-                break
 
-            decoded = None
-            try:
-                decoded = data.decode()
-            except UnicodeDecodeError:
-                pass
-
-            if decoded and decoded.startswith("FILE:"):
-                _, filename, filesize = decoded.split(":")
-                filesize = int(filesize)
-                print(f"[CLIENT] Sending file: {filename} ({filesize} bytes)")
-
-                with open("received_" + filename, "wb") as f:
-                    remaining = filesize
-                    while remaining > 0:
-                        chunk = conn.recv(min(BUFFER_SIZE, remaining))
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                        remaining -= len(chunk)
-
-                print(f"[SERVER] File {filename} received successfully ✅")
-            else:
-                print(f"[CLIENT] {decoded if decoded else data[:50]}...")
+# Blocking, one-connection versions of the transfer: TransferServer does not use
+# them; benchmarks/pipeline.py measures the raw protocol through them
 
-        except Exception as e:
-            print(f"[ERROR] {e}")
-            break
+def receive_messages(conn):
+    """Receive messages and files from one blocking socket until it closes"""
+    try:
+        for kind, name, payload in Receiver(conn, prefix="received_"):
+            if kind == FILE:
+                print(f"[SERVER] File {name} received successfully ✅ ({os.path.getsize(payload)} bytes)")
+            else:
+                print(f"[CLIENT] {payload}")
+    except (ProtocolError, OSError) as e:
+        print(f"[ERROR] {e}")
 
 
 def send_file(conn, filepath):
-    """Send a file to the connected client"""
-    if not os.path.exists(filepath):
-        print("[ERROR] File does not exist")
+    """Send one or more files (a list, or space separated paths quoted as in a shell) over one blocking socket"""
+    filepaths = shlex.split(filepath) if isinstance(filepath, str) else list(filepath)
+    missing = [p for p in filepaths if not os.path.exists(p)]
+    if missing:
+        print(f"[ERROR] File does not exist: {', '.join(missing)}")
         return
 
-    filesize = os.path.getsize(filepath)
-    filename = os.path.basename(filepath)
+    for path, size in zip(filepaths, SendFiles(conn, filepaths)):
+        print(f"[SERVER] Sent file {os.path.basename(path)} ({size} bytes)")
+
+
+class TransferServer:
+    """
+    Concurrent worker connections over the framed protocol. A worker names
+    itself by sending the message "HELLO <node_id>" first; until then it is
+    known by its address. Received files go to directory/(prefix +
+    node_id + "_" + name), so the same file name from several workers (every
+    node sends n1_PostP.zip) does not collide.
+    on_file(node_id, path) and on_message(node_id, text) are called from the
+    loop thread.
+    """
+
+    def __init__(self, host="0.0.0.0", port=5002, directory="receivedd", prefix="",
+                 on_file=None, on_message=None):
+        self.host = host
+        self.port = port
+        self.directory = directory
+        self.prefix = prefix
+        self.on_file = on_file
+        self.on_message = on_message
+        self._connections = {}
+        self._loop = None
+        self._server = None
+        self._ready = threading.Event()
+        self._thread = None
+
+    # ---- thread-safe API (callable from Flask handlers) ----
+
+    def start(self):
+        """Starts the event loop thread and waits until the server is listening"""
+        self._thread = threading.Thread(target=self._run, name="transfer-server", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        return self
+
+    def stop(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self._close(), self._loop).result()
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+
+    def connected(self):
+        """IDs of the connected workers; read on the loop thread, which owns _connections"""
+        if threading.current_thread() is self._thread:
+            return list(self._connections)
+        if self._loop is None or not self._loop.is_running():
+            return []
+        return self._submit(self._connected()).result()
+
+    def send_file(self, node_id, filepath):
+        """Queues a file for one node; returns a concurrent.futures.Future of the bytes sent"""
+        return self._submit(self._send_file(node_id, filepath))
+
+    def send_message(self, node_id, text):
+        return self._submit(self._send_message(node_id, text))
+
+    def dispatch(self, assignments, timeout=None):
+        """
+        Sends {node_id: file path or list of paths} to all nodes concurrently and
+        waits. Returns {node_id: bytes sent or the error string}.
+        """
+        async def one(node_id, paths):
+            try:
+                return sum([await self._send_file(node_id, p) for p in paths])
+            except Exception as e:
+                return f"{type(e).__name__}: {e}"
+
+        async def all_nodes():
+            items = [(n, [p] if isinstance(p, str) else list(p)) for n, p in assignments.items()]
+            results = await asyncio.gather(*(one(n, p) for n, p in items))
+            return dict(zip((n for n, _ in items), results))
+
+        return self._submit(all_nodes()).result(timeout)
+
+    def broadcast_file(self, filepath, timeout=None):
+        return self.dispatch({node: filepath for node in self.connected()}, timeout)
 
-    header = f"FILE:{filename}:{filesize}".encode()
-    conn.sendall(header)
+    # ---- event loop side ----
 
-    time.sleep(0.5)  # small delay
+    def _submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    def _run(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._server = self._loop.run_until_complete(asyncio.start_server(
+            self._handle, self.host, self.port, limit=READ_LIMIT, backlog=BACKLOG))
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            self._loop.run_forever()
+        finally:
+            self._loop.close()
+
+    async def _connected(self):
+        return list(self._connections)
+
+    async def _close(self):
+        self._server.close()
+        for connection in list(self._connections.values()):
+            connection["writer"].close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        sock = writer.get_extra_info("socket")
+        if sock is not None:
+            Tune(sock)
+        writer.transport.set_write_buffer_limits(high=WRITE_HIGH_WATER)
+        host, port = writer.get_extra_info("peername")[:2]
+        node_id = f"{host}:{port}"
+        self._connections[node_id] = {"writer": writer, "lock": asyncio.Lock(), "link": LinkStats()}
+        print(f"[SERVER] Connected by {node_id}")
+        try:
+            while True:
+                frame = await self._read_frame(reader, node_id)
+                if frame is None:
+                    break
+                kind, name, payload = frame
+                if kind == MESSAGE and payload.startswith("HELLO "):
+                    self._connections[payload[6:].strip()] = self._connections.pop(node_id)
+                    node_id = payload[6:].strip()
+                    print(f"[SERVER] {node_id} joined")
+                elif kind == MESSAGE:
+                    print(f"[{node_id}] {payload}")
+                    if self.on_message:
+                        self.on_message(node_id, payload)
+                else:
+                    print(f"[SERVER] File {name} received from {node_id} ✅")
+                    if self.on_file:
+                        self.on_file(node_id, payload)
+        except (ProtocolError, ConnectionError, asyncio.IncompleteReadError) as e:
+            print(f"[ERROR] {node_id}: {e}")
+        finally:
+            if self._connections.get(node_id, {}).get("writer") is writer:
+                del self._connections[node_id]
+            writer.close()
+            print(f"[SERVER] {node_id} disconnected")
+
+    async def _read_frame(self, reader, node_id):
+        try:
+            header = await reader.readexactly(HEADER.size)
+        except asyncio.IncompleteReadError as e:
+            if not e.partial:
+                return None
+            raise
+        magic, version, kind, codec, name_len, length, checksum = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ProtocolError(f"bad frame header {header[:4]!r}")
+        if codec not in (RAW, ZLIB):
+            raise ProtocolError(f"unknown codec {codec}")
+        name = (await reader.readexactly(name_len)).decode() if name_len else None
+
+        if kind == MESSAGE:
+            payload = await reader.readexactly(length)
+            if hashlib.sha256(payload).digest() != checksum:
+                raise ProtocolError("message checksum mismatch")
+            return MESSAGE, None, payload.decode()
+        if kind != FILE:
+            raise ProtocolError(f"unknown frame type {kind}")
+
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self.prefix}{_SafeName(node_id)}_{os.path.basename(name or 'file')}")
+        # a unique .part per frame, so a resend never writes into one still being received
+        fd, part = tempfile.mkstemp(dir=self.directory, prefix=os.path.basename(path) + ".", suffix=".part")
+        try:
+            await self._receive_file(reader, fd, codec, name, length, checksum)
+        except BaseException:
+            os.remove(part)
+            raise
+        os.replace(part, path)
+        return FILE, name, path
+
+    async def _receive_file(self, reader, fd, codec, name, length, checksum):
+        digest = hashlib.sha256()
+        remaining = length
+        with open(fd, "wb") as f:
+            if codec == ZLIB:
+                decompressor = zlib.decompressobj()
+                while block_len := BLOCK.unpack(await reader.readexactly(BLOCK.size))[0]:
+                    block = await reader.readexactly(block_len)
+                    remaining -= await asyncio.to_thread(_InflateBlock, f, digest, decompressor, block)
+                if remaining:
+                    raise ProtocolError(f"{name} decompressed to {length - remaining} bytes, expected {length}")
+            while remaining:
+                block = await reader.read(min(remaining, BUFFER_SIZE))
+                if not block:
+                    raise ProtocolError(f"connection closed with {remaining} bytes of {name} left")
+                # disk writes and hashing off the loop, so other connections keep going
+                await asyncio.to_thread(_WriteBlock, f, digest, block)
+                remaining -= len(block)
+        if digest.digest() != checksum:
+            raise ProtocolError(f"checksum mismatch for {name}")
+
+    def _connection(self, node_id):
+        connection = self._connections.get(node_id)
+        if connection is None:
+            raise KeyError(f"{node_id} is not connected")
+        return connection
+
+    async def _send_message(self, node_id, text):
+        connection = self._connection(node_id)
+        payload = text.encode()
+        async with connection["lock"]:
+            connection["writer"].write(FrameHeader(MESSAGE, b"", len(payload), hashlib.sha256(payload).digest()) + payload)
+            await connection["writer"].drain()
+
+    async def _send_file(self, node_id, filepath, codec=None):
+        connection = self._connection(node_id)
+        writer = connection["writer"]
+        name = os.path.basename(filepath).encode()
+        size = os.path.getsize(filepath)
+        if codec is None:
+            codec = await asyncio.to_thread(ChooseCodec, filepath, connection["link"])
+        checksum = bytes.fromhex(await asyncio.to_thread(Sha256, filepath))
+        # one frame at a time per connection; drain() waits while the peer is slow
+        async with connection["lock"]:
+            writer.write(FrameHeader(FILE, name, size, checksum, codec) + name)
+            await writer.drain()
+            with open(filepath, "rb") as f:
+                if codec == ZLIB:
+                    blocks = CompressBlocks(f)
+                    sent, seconds = 0, 0.0
+                    while block := await asyncio.to_thread(next, blocks, None):
+                        start = time.perf_counter()
+                        writer.write(block)
+                        await writer.drain()
+                        seconds += time.perf_counter() - start
+                        sent += len(block)
+                    connection["link"].record(sent, seconds)
+                else:
+                    start = time.perf_counter()
+                    await self._loop.sendfile(writer.transport, f, 0, size)
+                    await writer.drain()
+                    connection["link"].record(size, time.perf_counter() - start)
+        print(f"[SERVER] Sent file {name.decode()} ({size} bytes, {'zlib' if codec == ZLIB else 'raw'}) to {node_id}")
+        return size
+
+
+def _SafeName(node_id):
+    """A node ID (or host:port) usable as part of a file name"""
+    return re.sub(r"[^\w.-]", "-", node_id)
+
+
+def _WriteBlock(f, digest, block):
+    digest.update(block)
+    f.write(block)
+
+
+def _InflateBlock(f, digest, decompressor, block):
+    data = decompressor.decompress(block)
+    digest.update(data)
+    f.write(data)
+    return len(data)
 
-    with open(filepath, "rb") as f:
-        while chunk := f.read(BUFFER_SIZE):
-            conn.sendall(chunk)
 
-    print(f"[SERVER] Sent file {filename} ({filesize} bytes)")
 
 
 def run_server(port=5002):
+    """Interactive console: messages and "file:<path> ..." go to every connected worker"""
     host = GetIP()
-    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server:
-        server.bind((host, port))
-        server.listen(1)
-        print(f"[SERVER] Listening on {host}:{port} ...")
-
-        conn, addr = server.accept()
-        print(f"[SERVER] Connected by {addr}")
-
-        threading.Thread(target=receive_messages, args=(conn,), daemon=True).start()
-
-        # Interactive input loop
-        while True:
-            user_input = input("Enter message or file:<path> > ").strip()
-            if user_input.startswith("file:"):
-                filepath = user_input[5:].strip()
-                send_file(conn, filepath)
-            else:
-                conn.sendall(user_input.encode())
-                print(f"[SENT] {user_input}")
+    server = TransferServer(host, port, directory=".", prefix="received_").start()
+    print(f"[SERVER] Listening on {host}:{server.port} ...")
+
+    while True:
+        user_input = input("Enter message or file:<path> > ").strip()
+        nodes = server.connected()
+        if not nodes:
+            print("[SERVER] No workers connected")
+        elif user_input.startswith("file:"):
+            filepaths = shlex.split(user_input[5:])
+            missing = [p for p in filepaths if not os.path.exists(p)]
+            if missing:
+                print(f"[ERROR] File does not exist: {', '.join(missing)}")
+                continue
+            print(server.dispatch({node: filepaths for node in nodes}))
+        else:
+            for node in nodes:
+                server.send_message(node, user_input).result()
+            print(f"[SENT] {user_input} to {len(nodes)} worker(s)")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,188 @@
+"""
+This file keeps the final index as one FAISS index per node shard instead of a
+single index over merged_embeddings.npy. Every shard is built straight from the
+node's .npy (memory-mapped, so nothing is copied into a merged file) and saved
+as shards/<name>.faiss. A search goes to all shards at once on a thread pool
+(FAISS releases the GIL while it searches) and the per-shard top-k are merged
+into the global top-k. Global IDs are row numbers in manifest order, i.e. the
+rows merged_embeddings.npy would have.
+
+Shards are named after the .npy path under merged/, which starts with the
+result zip's name (ExtractZips gives every zip its own folder), so each result
+zip gets its own shards even though all nodes name their files n1_*.
+
+When one node runs again, BuildShards only rebuilds the shards whose .npy
+changed, and ShardedIndex.reload() swaps those in without touching the others.
+"""
+
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import faiss
+
+from finalrun import (DEFAULT_EF_SEARCH, DEFAULT_NPROBE, INDEX_SPEC, MERGED_DIR, RECEIVED_DIR, BuildIndex,
+                      NpyShape, TuneIndex)
+from helper import Sha256
+
+SHARD_DIR = os.path.join(RECEIVED_DIR, "shards")
+MANIFEST = "shards.json"
+
+def ShardName(path, merged_dir=MERGED_DIR):
+    """task-3_n1_PostP/n1_PostProcess/n1_embeddings.npy -> task-3_n1_PostP__n1_PostProcess__n1_embeddings"""
+    return os.path.splitext(os.path.relpath(path, merged_dir))[0].replace(os.sep, "__")
+
+def ReadManifest(directory=SHARD_DIR):
+    try:
+        with open(os.path.join(directory, MANIFEST)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def BuildShards(files, directory=SHARD_DIR, spec=INDEX_SPEC, nprobe=DEFAULT_NPROBE, ef_search=DEFAULT_EF_SEARCH,
+                merged_dir=MERGED_DIR):
+    """
+    Builds one index per embedding file, keeping the shards whose file has not
+    changed since they were built with the same spec (re-tuned and saved again
+    if nprobe / ef_search changed); returns the manifest.
+    """
+    if not files:
+        raise ValueError("No embedding files to index.")
+    os.makedirs(directory, exist_ok=True)
+    previous = ReadManifest(directory)
+    built = {s["name"]: s for s in previous.get("shards", [])} if previous.get("spec") == spec else {}
+    retune = (previous.get("nprobe"), previous.get("ef_search")) != (nprobe, ef_search)
+
+    shards = []
+    for path in files:
+        name = ShardName(path, merged_dir)
+        rows, dim, _ = NpyShape(path)
+        # by content: ExtractZips rewrites every file on each run
+        sha256 = Sha256(path)
+        index_path = os.path.join(directory, name + ".faiss")
+        entry = built.get(name)
+        if entry and entry["sha256"] == sha256 and os.path.exists(index_path):
+            if retune:
+                # the search parameters are saved in the index file
+                _WriteIndex(TuneIndex(faiss.read_index(index_path), nprobe, ef_search), index_path)
+                print(f"Shard {name} is up to date, retuned")
+            else:
+                print(f"Shard {name} is up to date")
+        else:
+            index = BuildIndex(np.load(path, mmap_mode="r").reshape(rows, dim), spec, nprobe=nprobe, ef_search=ef_search)
+            _WriteIndex(index, index_path)
+            print(f"Shard {name} built with {rows} vectors")
+        shards.append({"name": name, "file": name + ".faiss", "embeddings": path, "rows": rows, "dim": dim,
+                       "sha256": sha256})
+
+    dims = {s["dim"] for s in shards}
+    if len(dims) != 1:
+        raise ValueError(f"Embedding sizes differ between nodes: {sorted(dims)}")
+    for name in set(s["name"] for s in previous.get("shards", [])) - set(s["name"] for s in shards):
+        try:
+            os.remove(os.path.join(directory, name + ".faiss"))
+        except FileNotFoundError:
+            pass
+
+    manifest = {"spec": spec, "nprobe": nprobe, "ef_search": ef_search, "shards": shards}
+    path = os.path.join(directory, MANIFEST)
+    with open(path + ".tmp", "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+    return manifest
+
+class ShardedIndex:
+    """
+    Searches several indexes as one. search(queries, k) returns (D, I) like a
+    FAISS index, with I the global row numbers.
+    """
+
+    def __init__(self, directory=SHARD_DIR, workers=None, nprobe=None, ef_search=None):
+        self.directory = directory
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self._shards = []
+        self._loaded = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=workers or min(32, os.cpu_count() or 1),
+                                        thread_name_prefix="shard")
+        if directory:
+            self.reload()
+
+    @property
+    def shards(self):
+        return [name for name, _, _ in self._shards]
+
+    @property
+    def indexes(self):
+        return [index for _, index, _ in self._shards]
+
+    @property
+    def ntotal(self):
+        return sum(index.ntotal for _, index, _ in self._shards)
+
+    @property
+    def d(self):
+        return self._shards[0][1].d if self._shards else None
+
+    def add(self, name, index):
+        """Appends an index that is already in memory as the last shard"""
+        with self._lock:
+            self._shards.append((name, TuneIndex(index, self.nprobe, self.ef_search), self.ntotal))
+
+    def reload(self, name=None):
+        """
+        Re-reads the manifest and loads the shards whose index file changed (or
+        only `name`); the others stay as they are. A shard whose index file is
+        missing is left out with a warning, and the other shards keep their IDs.
+        Returns the reloaded names.
+        """
+        manifest = ReadManifest(self.directory)
+        reloaded = []
+        shards, start = [], 0
+        for entry in manifest.get("shards", []):
+            path = os.path.join(self.directory, entry["file"])
+            try:
+                mtime = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                print(f"Shard {entry['name']} skipped: {path} is missing")
+                start += entry["rows"]
+                continue
+            loaded = self._loaded.get(entry["name"])
+            if loaded is None or (loaded[1] != mtime and name in (None, entry["name"])):
+                loaded = (TuneIndex(faiss.read_index(path), self.nprobe, self.ef_search), mtime)
+                self._loaded[entry["name"]] = loaded
+                reloaded.append(entry["name"])
+            shards.append((entry["name"], loaded[0], start))
+            start += entry["rows"]
+        with self._lock:
+            self._shards = shards
+            for gone in set(self._loaded) - set(n for n, _, _ in shards):
+                del self._loaded[gone]
+        return reloaded
+
+    def tune(self, nprobe=None, ef_search=None):
+        for index in self.indexes:
+            TuneIndex(index, nprobe, ef_search)
+
+    def search(self, queries, k):
+        queries = np.ascontiguousarray(np.atleast_2d(queries), dtype=np.float32)
+        with self._lock:
+            shards = list(self._shards)
+        heap = faiss.ResultHeap(len(queries), k)
+        futures = [(start, self._pool.submit(index.search, queries, k)) for _, index, start in shards]
+        for start, future in futures:
+            D, I = future.result()
+            heap.add_result(D, np.where(I >= 0, I + start, -1))
+        heap.finalize()
+        return heap.D, heap.I
+
+    def close(self):
+        self._pool.shutdown(wait=False)
+
+def _WriteIndex(index, path):
+    faiss.write_index(index, path + ".tmp")
+    os.replace(path + ".tmp", path)
+
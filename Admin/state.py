@@ -0,0 +1,117 @@
+"""
+This file has the versioned cluster state of the admin server. The registry,
+scheduler and job queue bump its version whenever something changes; dashboard
+snapshots are built at most once per version (and per SNAPSHOT_TTL), and carry
+an ETag so unchanged polls can be answered with 304. Subscribers (the SSE
+stream) are told which topics changed.
+"""
+
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+SNAPSHOT_TTL = 2.0
+
+class Subscriber:
+    """
+    Coalescing buffer of changed topics for one stream. A topic that changes
+    again before it was sent is only sent once, so the buffer never holds more
+    than one entry per topic however slow the client is. Streams that do not
+    block in wait() (events.py) pass on_push to be told instead.
+    """
+
+    def __init__(self, on_push=None):
+        self.on_push = on_push
+        self._pending = OrderedDict()
+        self._cond = threading.Condition()
+
+    def push(self, topic):
+        with self._cond:
+            self._pending[topic] = True
+            self._cond.notify()
+        if self.on_push:
+            self.on_push()
+
+    def wait(self, timeout):
+        """Block until something changed; returns False on timeout"""
+        with self._cond:
+            return self._cond.wait_for(lambda: self._pending, timeout)
+
+    def drain(self):
+        """Changed topics since the last drain"""
+        with self._cond:
+            topics = list(self._pending)
+            self._pending.clear()
+            return topics
+
+class ClusterState:
+    """
+    Version counter plus a cache of JSON snapshots keyed by name.
+    """
+
+    def __init__(self, ttl=SNAPSHOT_TTL, refresh=None):
+        self.ttl = ttl
+        # called before every snapshot, for state that only changes when looked at
+        # (the registry expires nodes lazily)
+        self.refresh = refresh
+        self._version = 0
+        self._snapshots = {}
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    @property
+    def version(self):
+        return self._version
+
+    def bump(self, topic=None):
+        """Something changed; the next snapshot request rebuilds"""
+        with self._lock:
+            self._version += 1
+            subscribers = list(self._subscribers)
+        for subscriber in subscribers:
+            subscriber.push(topic or "state")
+        return self._version
+
+    def subscribe(self, limit=None, on_push=None):
+        """A new Subscriber, or None when `limit` subscribers are already open"""
+        with self._lock:
+            if limit is not None and len(self._subscribers) >= limit:
+                return None
+            subscriber = Subscriber(on_push)
+            self._subscribers.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    @property
+    def subscribers(self):
+        return len(self._subscribers)
+
+    def snapshot(self, name, build, ttl=None):
+        """
+        Returns (data, etag, version) for this snapshot. build() is only called when the
+        version moved on and the cached copy is older than ttl, so a burst of
+        heartbeats does not rebuild the dashboard on every poll. ttl=0 rebuilds on
+        every version, which the event stream uses so it never sends stale data.
+        """
+        ttl = self.ttl if ttl is None else ttl
+        if self.refresh:
+            # outside the lock: it may bump the version
+            self.refresh()
+        now = time.time()
+        with self._lock:
+            cached = self._snapshots.get(name)
+            if cached and (cached["version"] == self._version or now - cached["built"] < ttl):
+                return cached["data"], cached["etag"], cached["version"]
+            version = self._version
+
+        data = build()
+        body = json.dumps(data, sort_keys=True, default=str).encode()
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            self._snapshots[name] = {"version": version, "built": now, "data": data, "etag": etag}
+        return data, etag, version
@@ -0,0 +1,216 @@
+"""
+This file has the resumable upload store of the admin server. A node starts an
+upload with the file's size (and optionally its sha256), sends fixed size parts
+in any order and in parallel, each with its own sha256, and finishes it once
+every part is in. Parts are written straight to their offset in a preallocated
+file, and the upload's state is kept next to it, so a dropped connection (or a
+server restart) only costs the parts that were not acknowledged yet.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+from werkzeug.utils import secure_filename
+
+from helper import Sha256
+
+UPLOAD_DIR = ".uploads"
+PART_SIZE = 8 * 1024 * 1024
+MAX_PART_SIZE = 64 * 1024 * 1024
+UPLOAD_TTL = 24 * 3600
+WRITE_BUFFER = 1024 * 1024
+
+class UploadError(Exception):
+    """Raised for a bad request against an upload; status is the HTTP code to answer with"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+class UploadStore:
+    """
+    Keeps the in-progress uploads under `directory` (<id>.part and <id>.json)
+    and moves finished files into `destination`.
+    """
+
+    def __init__(self, directory=UPLOAD_DIR, destination="receivedd", ttl=UPLOAD_TTL):
+        self.directory = directory
+        self.destination = destination
+        self.ttl = ttl
+        self._uploads = {}
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def init(self, filename, size, sha256=None, part_size=PART_SIZE):
+        """
+        Starts an upload, or returns the unfinished one for the same file (name,
+        size and sha256), so a client that lost its upload ID can still resume.
+        """
+        filename = secure_filename(filename or "")
+        if not filename:
+            raise UploadError("filename is required")
+        if not isinstance(size, int) or size < 0:
+            raise UploadError("size must be a non-negative integer")
+        if not isinstance(part_size, int) or not 0 < part_size <= MAX_PART_SIZE:
+            raise UploadError(f"part_size must be between 1 and {MAX_PART_SIZE}")
+
+        with self._lock:
+            self._expire()
+            for upload in self._uploads.values():
+                if (upload["filename"], upload["size"], upload["sha256"]) == (filename, size, sha256) and sha256:
+                    return self._view(upload)
+
+            upload = {
+                "id": uuid.uuid4().hex[:16],
+                "filename": filename,
+                "size": size,
+                "sha256": sha256,
+                "part_size": part_size,
+                "parts": max(1, -(-size // part_size)),
+                "received": {},
+                "created": time.time(),
+                "updated": time.time(),
+            }
+            with open(self._path(upload, ".part"), "wb") as f:
+                f.truncate(size)
+            self._uploads[upload["id"]] = upload
+            self._save(upload)
+            return self._view(upload)
+
+    def status(self, upload_id):
+        with self._lock:
+            return self._view(self._get(upload_id))
+
+    def write_part(self, upload_id, index, stream, sha256):
+        """
+        Streams one part from `stream` to its offset in the file, checking its
+        length and sha256. A part that fails the check is not acknowledged and
+        can simply be sent again.
+        """
+        if not sha256:
+            raise UploadError("part checksum is required")
+        with self._lock:
+            upload = self._get(upload_id)
+            if not 0 <= index < upload["parts"]:
+                raise UploadError(f"part {index} out of range (0-{upload['parts'] - 1})")
+            offset = index * upload["part_size"]
+            length = min(upload["part_size"], upload["size"] - offset)
+            path = self._path(upload, ".part")
+
+        digest = hashlib.sha256()
+        written = 0
+        with open(path, "r+b") as f:
+            f.seek(offset)
+            while written <= length:
+                block = stream.read(min(WRITE_BUFFER, length + 1 - written))
+                if not block:
+                    break
+                if written + len(block) > length:
+                    raise UploadError(f"part {index} is longer than {length} bytes")
+                f.write(block)
+                digest.update(block)
+                written += len(block)
+
+        if written != length:
+            raise UploadError(f"part {index} is {written} bytes, expected {length}")
+        if digest.hexdigest() != sha256.lower():
+            raise UploadError(f"part {index} checksum mismatch", status=422)
+
+        with self._lock:
+            upload = self._get(upload_id)
+            upload["received"][str(index)] = sha256.lower()
+            upload["updated"] = time.time()
+            self._save(upload)
+            return self._view(upload)
+
+    def complete(self, upload_id):
+        """Checks that every part is in (and the whole-file sha256, if given) and moves the file into place"""
+        with self._lock:
+            upload = self._get(upload_id)
+            missing = self._missing(upload)
+            if missing:
+                raise UploadError(f"{len(missing)} part(s) missing", status=409)
+            part_path = self._path(upload, ".part")
+
+        if upload["sha256"] and Sha256(part_path) != upload["sha256"].lower():
+            raise UploadError("file checksum mismatch", status=422)
+
+        with self._lock:
+            if upload["id"] not in self._uploads:
+                raise UploadError("upload not found", status=404)
+            os.makedirs(self.destination, exist_ok=True)
+            final_path = os.path.join(self.destination, upload["filename"])
+            os.replace(part_path, final_path)
+            os.remove(self._path(upload, ".json"))
+            del self._uploads[upload["id"]]
+            return {"id": upload["id"], "path": final_path, "size": upload["size"]}
+
+    def abort(self, upload_id):
+        with self._lock:
+            self._remove(self._get(upload_id))
+
+    def _get(self, upload_id):
+        upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise UploadError("upload not found", status=404)
+        return upload
+
+    def _missing(self, upload):
+        return [i for i in range(upload["parts"]) if str(i) not in upload["received"]]
+
+    def _view(self, upload):
+        received = sorted(int(i) for i in upload["received"])
+        missing = self._missing(upload)
+        # bytes acknowledged without a gap, for clients that upload sequentially
+        offset = min(upload["size"], (missing[0] if missing else upload["parts"]) * upload["part_size"])
+        return {
+            "upload_id": upload["id"],
+            "filename": upload["filename"],
+            "size": upload["size"],
+            "part_size": upload["part_size"],
+            "parts": upload["parts"],
+            "received": received,
+            "missing": missing,
+            "offset": offset,
+        }
+
+    def _path(self, upload, suffix):
+        return os.path.join(self.directory, upload["id"] + suffix)
+
+    def _save(self, upload):
+        path = self._path(upload, ".json")
+        with open(path + ".tmp", "w") as f:
+            json.dump(upload, f)
+        os.replace(path + ".tmp", path)
+
+    def _remove(self, upload):
+        for suffix in (".part", ".json"):
+            try:
+                os.remove(self._path(upload, suffix))
+            except FileNotFoundError:
+                pass
+        self._uploads.pop(upload["id"], None)
+
+    def _expire(self):
+        now = time.time()
+        for upload in [u for u in self._uploads.values() if now - u["updated"] > self.ttl]:
+            self._remove(upload)
+
+    def _load(self):
+        """Picks up unfinished uploads left by a previous run"""
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    upload = json.load(f)
+            except (OSError, ValueError):
+                continue
+            if os.path.exists(self._path(upload, ".part")):
+                self._uploads[upload["id"]] = upload
+
@@ -1,30 +1,238 @@
+import hashlib
+import json
 import os
+import shutil
+import sys
+import threading
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from zipstream import ZipStream
 from helper import *
+COMMON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common")
+sys.path.insert(0, COMMON_DIR)
+from formats import STORED_EXTENSIONS
 
-def CreateZip(file_path, source_code, node_id, allcommands):
-    zip_filename = f"{node_id}.zip"
+BUNDLE_CACHE = ".bundles"
+MANIFEST_ARCNAME = "manifest.json"
+# Shared modules every bundle ships in ServerFiles/ next to the source code (helpdef.py imports formats)
+SHARED_CODE = [os.path.join(COMMON_DIR, "formats.py")]
+# STORED_EXTENSIONS files are stored as is; everything else is deflated at a fast level
+DEFLATE_LEVEL = 1
+_shared_lock = threading.Lock()
+_hash_cache = {}
 
-    with zipfile.ZipFile(zip_filename, "w", zipfile.ZIP_DEFLATED) as zipf:
-        # Ensure PreProcess folder exists in the zip
-        zipf.writestr("PreProcess/", "")
+def CreateZip(file_path, source_code, node_id, allcommands, shared=None, include_code=True):
+    """
+    Builds {node_id}.zip with the chunk file(s) under PreProcess/ and the source
+    code plus a generated Makefile under ServerFiles/. file_path can be a single
+    chunk or a list of chunks. The zip comment stores a fingerprint of the inputs,
+    and an existing zip with the same fingerprint is left untouched.
 
-        if os.path.exists(file_path):  # make sure the file exists
-            arcname = os.path.join("PreProcess", os.path.basename(file_path))
-            zipf.write(file_path, arcname)
+    The ServerFiles part is compressed once into a shared zip (see SharedBundle);
+    each node zip is a copy of it with the chunks appended, so the source tree
+    is never re-compressed per node.
 
-        if os.path.exists(source_code):
-            for folder, _, files in os.walk(source_code):
-                for file in files:
-                    src_file = os.path.join(folder, file)
-                    arcname = os.path.join("ServerFiles", os.path.relpath(src_file, source_code))
-                    zipf.write(src_file, arcname)
+    With include_code=False it builds {node_id}_data.zip with only the
+    PreProcess/ chunks, the on-disk twin of StreamZip(include_code=False).
+    """
+    zip_filename = f"{node_id}.zip" if include_code else f"{node_id}_data.zip"
+    file_paths = [file_path] if isinstance(file_path, str) else list(file_path)
 
-        makefile_content = ".PHONY: run\n\nrun:\n"
-        for cmd in allcommands:
-            makefile_content += f"\t@echo \"Executing {cmd['description']}\"\n"
-            makefile_content += f"\t{cmd['command']} >> output.log 2>> error.log\n\n"
+    if include_code:
+        fingerprint = BundleFingerprint(file_paths, source_code, allcommands)
+    else:
+        fingerprint = BundleFingerprint(file_paths, "", [])
+    if os.path.exists(zip_filename):
+        try:
+            with zipfile.ZipFile(zip_filename, "r") as existing:
+                if existing.comment == fingerprint:
+                    return zip_filename
+        except zipfile.BadZipFile:
+            pass
 
-        # Add Makefile inside ServerFiles in the zip
-        zipf.writestr("ServerFiles/Makefile", makefile_content)
+    tmp_filename = zip_filename + ".tmp"
+    if include_code:
+        if shared is None:
+            shared = SharedBundle(source_code, allcommands)
+        shutil.copyfile(shared, tmp_filename)
+    else:
+        with zipfile.ZipFile(tmp_filename, "w") as zipf:
+            zipf.writestr("PreProcess/", "")
 
+    with zipfile.ZipFile(tmp_filename, "a", zipfile.ZIP_DEFLATED) as zipf:
+        for path in file_paths:
+            if os.path.exists(path):  # make sure the file exists
+                arcname = os.path.join("PreProcess", os.path.basename(path))
+                zipf.write(path, arcname, *ZipCompression(path))
+
+        zipf.comment = fingerprint
+    os.replace(tmp_filename, zip_filename)
+
+    return zip_filename
+
+
+def CreateZips(assignments, source_code, allcommands, workers=None):
+    """
+    Builds the zips of many nodes at once. assignments is a list of
+    (node_id, chunk file or list of chunk files). The shared ServerFiles part is
+    compressed once, and the per-node zips are built on a thread pool.
+    Returns the zip filenames in the same order.
+    """
+    if not assignments:
+        return []
+    shared = SharedBundle(source_code, allcommands)
+    workers = workers or min(32, (os.cpu_count() or 1) * 4)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(CreateZip, chunk_files, source_code, node_id, allcommands, shared)
+            for node_id, chunk_files in assignments
+        ]
+        return [f.result() for f in futures]
+
+
+def StreamZip(file_path, source_code, allcommands, include_code=True):
+    """
+    Same layout as CreateZip, but as a lazy zipstream-ng ZipStream: the archive
+    is generated while it is being sent, and nothing is written to disk.
+    With include_code=False only the PreProcess/ chunks are sent, for workers
+    that fetch the code from their blob cache (see CodeManifest).
+    """
+    file_paths = [file_path] if isinstance(file_path, str) else list(file_path)
+
+    zs = ZipStream(compress_type=zipfile.ZIP_DEFLATED)
+    zs.mkdir("PreProcess")
+    for path in file_paths:
+        if os.path.exists(path):
+            compress_type, level = ZipCompression(path)
+            zs.add_path(path, os.path.join("PreProcess", os.path.basename(path)),
+                        compress_type=compress_type, compress_level=level)
+
+    if include_code:
+        for arcname, _, blob in _CodeEntries(source_code, allcommands):
+            if isinstance(blob, bytes):
+                zs.add(blob, arcname)
+            else:
+                compress_type, level = ZipCompression(blob)
+                zs.add_path(blob, arcname, compress_type=compress_type, compress_level=level)
+        zs.add(json.dumps(CodeManifest(source_code, allcommands)).encode(), MANIFEST_ARCNAME)
+    return zs
+
+
+def CodeManifest(source_code, allcommands):
+    """
+    Content hashes of the ServerFiles/ part of a bundle, as {arcname: sha256}.
+    It is shipped as manifest.json in every bundle and served on its own, so
+    workers can fetch only the blobs they do not have yet.
+    """
+    return {arcname: sha for arcname, sha, _ in _CodeEntries(source_code, allcommands)}
+
+
+def CodeBlob(source_code, allcommands, sha):
+    """
+    Returns the file path (or bytes, for the Makefile) of the code blob with
+    this sha256, or None if the current code has no such blob.
+    """
+    for _, blob_sha, blob in _CodeEntries(source_code, allcommands):
+        if blob_sha == sha:
+            return blob
+    return None
+
+
+def _CodeEntries(source_code, allcommands):
+    """
+    (arcname, sha256, path or bytes) of every ServerFiles/ entry. File hashes
+    are cached by size and mtime, so only changed files are read again.
+    """
+    entries = []
+    if os.path.exists(source_code):
+        for folder, _, files in os.walk(source_code):
+            for file in sorted(files):
+                src_file = os.path.join(folder, file)
+                arcname = os.path.join("ServerFiles", os.path.relpath(src_file, source_code))
+                entries.append((arcname, FileSha256(src_file), src_file))
+    for src_file in SHARED_CODE:
+        entries.append((os.path.join("ServerFiles", os.path.basename(src_file)), FileSha256(src_file), src_file))
+
+    makefile = MakefileContent(allcommands).encode()
+    entries.append(("ServerFiles/Makefile", hashlib.sha256(makefile).hexdigest(), makefile))
+    return entries
+
+
+def FileSha256(path):
+    """sha256 hex of a file, cached until its size or mtime changes"""
+    st = os.stat(path)
+    cached = _hash_cache.get(path)
+    if cached and cached[:2] == (st.st_size, st.st_mtime_ns):
+        return cached[2]
+    sha = Sha256(path)
+    _hash_cache[path] = (st.st_size, st.st_mtime_ns, sha)
+    return sha
+
+
+def SharedBundle(source_code, allcommands):
+    """
+    Returns the path of a zip holding the PreProcess/ folder entry, the source
+    tree under ServerFiles/ and the Makefile, compressed once. It is cached in
+    BUNDLE_CACHE under its fingerprint and only rebuilt when the sources or the
+    commands change.
+    """
+    fingerprint = BundleFingerprint([], source_code, allcommands).decode()
+    shared = os.path.join(BUNDLE_CACHE, f"shared-{fingerprint[:16]}.zip")
+
+    with _shared_lock:
+        if os.path.exists(shared):
+            return shared
+
+        os.makedirs(BUNDLE_CACHE, exist_ok=True)
+        tmp_shared = shared + ".tmp"
+        with zipfile.ZipFile(tmp_shared, "w", zipfile.ZIP_DEFLATED) as zipf:
+            # Ensure PreProcess folder exists in the zip
+            zipf.writestr("PreProcess/", "")
+
+            # source tree, shared modules and the Makefile under ServerFiles/
+            for arcname, _, blob in _CodeEntries(source_code, allcommands):
+                if isinstance(blob, bytes):
+                    zipf.writestr(arcname, blob)
+                else:
+                    zipf.write(blob, arcname, *ZipCompression(blob))
+
+            zipf.writestr(MANIFEST_ARCNAME, json.dumps(CodeManifest(source_code, allcommands)))
+        os.replace(tmp_shared, shared)
+
+    return shared
+
+
+def ZipCompression(path):
+    """(compress_type, compresslevel) for a file going into a bundle, by its type"""
+    if os.path.splitext(path)[1].lower() in STORED_EXTENSIONS:
+        return zipfile.ZIP_STORED, None
+    return zipfile.ZIP_DEFLATED, DEFLATE_LEVEL
+
+
+def MakefileContent(allcommands):
+    """
+    Makefile that runs every command of allcommands in order.
+    """
+    makefile_content = ".PHONY: run\n\nrun:\n"
+    for cmd in allcommands:
+        makefile_content += f"\t@echo \"Executing {cmd['description']}\"\n"
+        makefile_content += f"\t{cmd['command']} >> output.log 2>> error.log\n\n"
+    return makefile_content
+
+
+def BundleFingerprint(file_paths, source_code, allcommands):
+    """
+    Cheap fingerprint of everything that goes into a node zip: name, size and
+    mtime of the chunk and source files, plus the commands. Nothing is read.
+    """
+    digest = hashlib.sha256()
+    paths = list(file_paths) + SHARED_CODE
+    if os.path.exists(source_code):
+        for folder, _, files in os.walk(source_code):
+            paths.extend(os.path.join(folder, file) for file in sorted(files))
+    for path in paths:
+        if os.path.exists(path):
+            st = os.stat(path)
+            digest.update(f"{path}:{st.st_size}:{st.st_mtime_ns}\n".encode())
+    digest.update(json.dumps(allcommands, sort_keys=True).encode())
+    return digest.hexdigest().encode()
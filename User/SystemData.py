@@ -46,3 +46,41 @@ def GetFileCount(path=None):
     for dirpath, dirnames, filenames in os.walk(path):
         file_count += len(filenames)
     return file_count
+
+def GetEmbeddingRate(samples=64, chunk_size=500):
+    """
+    Measures how many 500-character windows this machine encodes per second
+    """
+    import time
+    from aipart import SimpleTextQA
+
+    qa = SimpleTextQA()
+    windows = [("lorem ipsum dolor sit amet " * 20)[:chunk_size]] * samples
+    qa.model.encode(windows[:4], convert_to_numpy=True)  # warm up
+    start = time.time()
+    qa.model.encode(windows, convert_to_numpy=True)
+    return samples / max(time.time() - start, 1e-6)
+
+def GetCapacity(measure=False):
+    """
+    Returns the capacity report the admin uses to size this node's chunk.
+    The embedding rate is only measured when measure is True, since it loads the model.
+    """
+    return {
+        "cpu_cores": psutil.cpu_count(logical=True),
+        "ram_gb": round(psutil.virtual_memory().total / (1024 ** 3), 2),
+        "embeddings_per_sec": GetEmbeddingRate() if measure else None,
+    }
+
+def GetMetrics():
+    """
+    Returns the metrics a node sends with every heartbeat
+    """
+    import socket
+
+    return {
+        "hostname": socket.gethostname(),
+        "cpu_percent": GetCPU(),
+        "ram_percent": GetRAM(),
+        **GetCapacity(),
+    }
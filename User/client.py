@@ -1,98 +1,336 @@
 import sys
+import subprocess
 import requests
 import socket
 import threading
 import time
 import os
+import glob
+import hashlib
+import json
+import shlex
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+from protocol import FILE, ProtocolError, Receiver, SendFiles, SendMessage, Tune
 
-BUFFER_SIZE = 1024
+HEARTBEAT_INTERVAL = 10
+UPLOAD_WORKERS = 4
+UPLOAD_RETRIES = 5
+DOWNLOAD_SEGMENTS = 4
+DOWNLOAD_RETRIES = 5
+DOWNLOAD_BUFFER = 1024 * 1024
+SEGMENT_SIZE = 8 * 1024 * 1024
 
+_session = None
 
-def download_file(ngrok_url, filename):
-    """Generic function to download a file (like helper.py or n1.zip)"""
+
+def base_url(ngrok_url):
+    """Normalise an ngrok link to https://host without a trailing slash"""
     if not ngrok_url.startswith("http"):
         ngrok_url = "https://" + ngrok_url
     if ngrok_url.endswith("/"):
         ngrok_url = ngrok_url[:-1]
+    return ngrok_url
 
-    file_url = ngrok_url + "/" + filename
-    print(f"[DOWNLOAD] Fetching {file_url}")
-    try:
-        resp = requests.get(file_url, stream=True)
-        resp.raise_for_status()
 
-        with open(filename, "wb") as f:
-            for chunk in resp.iter_content(chunk_size=BUFFER_SIZE):
-                if chunk:
+def http_session():
+    """One pooled session per process, shared by every download thread"""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=DOWNLOAD_SEGMENTS * 2)
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+
+def fetch_file(url, dest, segments=DOWNLOAD_SEGMENTS):
+    """
+    Downloads url to dest. The first attempt is one streaming GET, so a bundle
+    the admin generates on the fly starts arriving at once and is never built
+    on its disk. If that fails, or an earlier attempt left dest.part behind,
+    the rest is fetched with Range requests (fetch_ranges) and resumed from
+    there. The result is checked against the server's X-Content-Sha256, when
+    it sends one, before it is renamed to dest.
+    """
+    part, state_file = dest + ".part", dest + ".part.json"
+    sha = None
+    if not (os.path.exists(state_file) and os.path.exists(part)):
+        try:
+            with http_session().get(url, stream=True, timeout=60) as resp:
+                resp.raise_for_status()
+                sha = resp.headers.get("X-Content-Sha256")
+                with open(part, "wb") as f:
+                    for chunk in resp.iter_content(chunk_size=DOWNLOAD_BUFFER):
+                        f.write(chunk)
+        except requests.RequestException as e:
+            if getattr(e.response, "status_code", 500) < 500:
+                raise
+            print(f"[DOWNLOAD] {os.path.basename(dest)} failed ({e}), resuming with range requests")
+            sha = fetch_ranges(url, dest, segments)
+    else:
+        sha = fetch_ranges(url, dest, segments)
+
+    if sha and file_sha256(part) != sha:
+        os.remove(part)
+        if os.path.exists(state_file):
+            os.remove(state_file)
+        raise ValueError(f"Checksum mismatch for {os.path.basename(dest)}")
+    os.replace(part, dest)
+    if os.path.exists(state_file):
+        os.remove(state_file)
+    return dest
+
+
+def fetch_ranges(url, dest, segments=DOWNLOAD_SEGMENTS):
+    """
+    Fetches url into dest.part as SEGMENT_SIZE pieces on `segments` threads,
+    each written straight to its offset; the pieces already done are recorded
+    in dest.part.json, so running this again after a failure only fetches the
+    rest. A server without range support gets one plain GET. Returns the
+    server's X-Content-Sha256 (or None).
+    """
+    session = http_session()
+    head = session.head(url, timeout=60, allow_redirects=True)
+    head.raise_for_status()
+    size = int(head.headers.get("Content-Length") or 0)
+    sha = head.headers.get("X-Content-Sha256")
+    etag = head.headers.get("ETag")
+    part, state_file = dest + ".part", dest + ".part.json"
+
+    if head.headers.get("Accept-Ranges") != "bytes" or not size:
+        with session.get(url, stream=True, timeout=60) as resp:
+            resp.raise_for_status()
+            with open(part, "wb") as f:
+                for chunk in resp.iter_content(chunk_size=DOWNLOAD_BUFFER):
                     f.write(chunk)
+        return sha
+
+    state = {}
+    if os.path.exists(state_file) and os.path.exists(part):
+        with open(state_file) as f:
+            state = json.load(f)
+    if (state.get("size"), state.get("etag"), state.get("sha256")) != (size, etag, sha):
+        # different file on the server (or no earlier attempt): start over
+        state = {"size": size, "etag": etag, "sha256": sha, "done": []}
+        with open(part, "wb") as f:
+            f.truncate(size)
+    pieces = [(i, start, min(start + SEGMENT_SIZE, size) - 1)
+              for i, start in enumerate(range(0, size, SEGMENT_SIZE)) if i not in state["done"]]
+    if len(pieces) < -(-size // SEGMENT_SIZE):
+        print(f"[DOWNLOAD] Resuming {os.path.basename(dest)}: {len(pieces)} piece(s) left")
+    lock = threading.Lock()
+
+    def fetch_piece(piece):
+        i, start, end = piece
+        offset = start
+        for attempt in range(1, DOWNLOAD_RETRIES + 1):
+            try:
+                headers = {"Range": f"bytes={offset}-{end}"}
+                if etag:
+                    headers["If-Range"] = etag
+                with session.get(url, headers=headers, stream=True, timeout=60) as resp:
+                    resp.raise_for_status()
+                    if resp.status_code != 206:
+                        raise ValueError("server ignored the Range request (file changed?)")
+                    with open(part, "r+b") as f:
+                        f.seek(offset)
+                        for chunk in resp.iter_content(chunk_size=DOWNLOAD_BUFFER):
+                            f.write(chunk)
+                            offset += len(chunk)
+                if offset != end + 1:
+                    raise ValueError(f"piece {i} ended at {offset}, expected {end + 1}")
+                break
+            except (requests.RequestException, ValueError) as e:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                print(f"[DOWNLOAD] Piece {i} failed at byte {offset} ({e}), retrying")
+                time.sleep(min(2 ** attempt, 30))
+        with lock:
+            state["done"].append(i)
+            with open(state_file, "w") as f:
+                json.dump(state, f)
+
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        list(pool.map(fetch_piece, pieces))
+    return sha
 
+
+def download_file(ngrok_url, filename):
+    """Generic function to download a file (like helper.py or n1.zip)"""
+    file_url = base_url(ngrok_url) + "/" + filename
+    print(f"[DOWNLOAD] Fetching {file_url}")
+    try:
+        fetch_file(file_url, filename)
         print(f"[SUCCESS] {filename} downloaded and saved.")
     except Exception as e:
         print(f"[ERROR] Could not download {filename}: {e}")
 
 
-def receive_messages(sock):
-    """Thread to constantly receive messages or files from server"""
+def report_capacity(ngrok_url, node_id, measure=False):
+    """Send this node's capacity so the admin can size its chunk"""
+    from SystemData import GetCapacity
+
+    capacity = GetCapacity(measure=measure)
+    try:
+        resp = requests.post(base_url(ngrok_url) + "/api/nodes/capacity",
+                             json={"node": node_id, "capacity": capacity})
+        resp.raise_for_status()
+        print(f"[CAPACITY] Reported {capacity} for {node_id}")
+    except Exception as e:
+        print(f"[ERROR] Could not report capacity: {e}")
+
+
+def send_heartbeat(ngrok_url, node_id):
+    """Send one heartbeat with this node's metrics to the admin"""
+    from SystemData import GetMetrics
+
+    resp = requests.post(base_url(ngrok_url) + "/api/nodes/heartbeat",
+                         json={"node": node_id, "metrics": GetMetrics()}, timeout=10)
+    resp.raise_for_status()
+    return resp.json()
+
+
+def heartbeat_loop(ngrok_url, node_id, interval=HEARTBEAT_INTERVAL):
+    """Keep this node registered with the admin; runs until interrupted"""
     while True:
         try:
-            data = sock.recv(BUFFER_SIZE)
-            if not data:
-                break
+            status = send_heartbeat(ngrok_url, node_id)
+            print(f"[HEARTBEAT] {node_id}: {status['status']}")
+        except Exception as e:
+            print(f"[ERROR] Heartbeat failed: {e}")
+        time.sleep(interval)
+
 
-            decoded = None
+def work_loop(ngrok_url, node_id, workdir="work", poll=HEARTBEAT_INTERVAL):
+    """Pull chunks from the admin's scheduler, run them and report back; runs until interrupted"""
+    from core import FetchBundle
+
+    base = base_url(ngrok_url)
+    with requests.Session() as session:
+        while True:
             try:
-                decoded = data.decode()
-            except UnicodeDecodeError:
-                pass
-
-            if decoded and decoded.startswith("FILE:"):
-                _, filename, filesize = decoded.split(":")
-                filesize = int(filesize)
-                print(f"[SERVER] Sending file: {filename} ({filesize} bytes)")
-
-                with open("received_" + filename, "wb") as f:
-                    remaining = filesize
-                    while remaining > 0:
-                        chunk = sock.recv(min(BUFFER_SIZE, remaining))
-                        if not chunk:
-                            break
-                        f.write(chunk)
-                        remaining -= len(chunk)
+                resp = session.post(base + "/api/tasks/next", json={"node": node_id}, timeout=30)
+                if resp.status_code == 204:
+                    time.sleep(poll)
+                    continue
+                resp.raise_for_status()
+                task = resp.json()
+            except Exception as e:
+                print(f"[ERROR] Could not get a task: {e}")
+                time.sleep(poll)
+                continue
 
-                print(f"[CLIENT] File {filename} received successfully ✅")
-            else:
-                print(f"[SERVER] {decoded if decoded else data[:50]}...")
+            print(f"[TASK] {task['id']}: {os.path.basename(task['chunk'])}")
+            task_dir = os.path.join(workdir, task["id"])
+            try:
+                FetchBundle(ngrok_url, node_id, task_dir)
+                subprocess.run(["make", "-C", os.path.join(task_dir, "ServerFiles"), "run"], check=True)
+                # mycmd/helpdef.py leaves the results next to ServerFiles as n1_PostP.zip
+                results = glob.glob(os.path.join(task_dir, "*_PostP.zip"))
+                if not results:
+                    raise RuntimeError(f"no result zip in {task_dir}")
+                for path in results:
+                    # every node's zip has the same name; the task ID keeps them apart in receivedd/
+                    upload_file(ngrok_url, path, name=f"{task['id']}_{os.path.basename(path)}")
+                session.post(f"{base}/api/tasks/{task['id']}/complete", json={"node": node_id}, timeout=30)
+                print(f"[TASK] {task['id']} done")
+            except Exception as e:
+                print(f"[ERROR] Task {task['id']} failed: {e}")
+                try:
+                    session.post(f"{base}/api/tasks/{task['id']}/fail",
+                                 json={"node": node_id, "error": str(e)}, timeout=30)
+                except Exception:
+                    pass
 
-        except Exception as e:
-            print(f"[ERROR] {e}")
-            break
 
+def file_sha256(filepath):
+    digest = hashlib.sha256()
+    with open(filepath, "rb") as f:
+        while block := f.read(1024 * 1024):
+            digest.update(block)
+    return digest.hexdigest()
 
-def send_file(sock, filepath):
-    """Send a file to the server"""
-    if not os.path.exists(filepath):
-        print("[ERROR] File does not exist")
-        return
 
-    filesize = os.path.getsize(filepath)
-    filename = os.path.basename(filepath)
+def upload_file(ngrok_url, filepath, workers=UPLOAD_WORKERS, name=None):
+    """
+    Resumable upload to the admin's receivedd folder, as `name` (default: the
+    file's own name). Parts go up in parallel, each with its sha256; if the
+    connection drops, running this again resumes with only the parts the admin
+    has not acknowledged.
+    """
+    base = base_url(ngrok_url)
+    size = os.path.getsize(filepath)
+    session = http_session()
 
-    header = f"FILE:{filename}:{filesize}".encode()
-    sock.sendall(header)
+    resp = session.post(base + "/api/uploads", json={
+        "filename": name or os.path.basename(filepath), "size": size, "sha256": file_sha256(filepath)}, timeout=30)
+    resp.raise_for_status()
+    upload = resp.json()
+    upload_id, part_size = upload["upload_id"], upload["part_size"]
+    if upload["received"]:
+        print(f"[UPLOAD] Resuming {upload_id}: {len(upload['received'])}/{upload['parts']} parts already there")
 
-    time.sleep(0.5)
+    def send_part(index):
+        with open(filepath, "rb") as f:
+            f.seek(index * part_size)
+            data = f.read(part_size)
+        checksum = hashlib.sha256(data).hexdigest()
+        for attempt in range(1, UPLOAD_RETRIES + 1):
+            try:
+                r = session.put(f"{base}/api/uploads/{upload_id}/parts/{index}", data=data,
+                                headers={"X-Checksum-Sha256": checksum}, timeout=120)
+                r.raise_for_status()
+                return index
+            except Exception as e:
+                if attempt == UPLOAD_RETRIES:
+                    raise
+                print(f"[UPLOAD] Part {index} failed ({e}), retrying")
+                time.sleep(min(2 ** attempt, 30))
 
-    with open(filepath, "rb") as f:
-        while chunk := f.read(BUFFER_SIZE):
-            sock.sendall(chunk)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for index in pool.map(send_part, upload["missing"]):
+            print(f"[UPLOAD] Part {index + 1}/{upload['parts']} sent")
 
-    print(f"[CLIENT] Sent file {filename} ({filesize} bytes)")
+    resp = session.post(f"{base}/api/uploads/{upload_id}/complete", timeout=300)
+    resp.raise_for_status()
+    print(f"[SUCCESS] {filepath} uploaded to {resp.json()['path']}")
+    return resp.json()
 
 
-def run_client(server_ip, port=5002):
+def receive_messages(sock):
+    """Thread to constantly receive messages or files from server"""
+    try:
+        for kind, name, payload in Receiver(sock, prefix="received_"):
+            if kind == FILE:
+                print(f"[CLIENT] File {name} received successfully ✅ ({os.path.getsize(payload)} bytes)")
+            else:
+                print(f"[SERVER] {payload}")
+    except (ProtocolError, OSError) as e:
+        print(f"[ERROR] {e}")
+
+
+def send_file(sock, filepath):
+    """Send one or more files (a list, or space separated paths quoted as in a shell) to the server"""
+    filepaths = shlex.split(filepath) if isinstance(filepath, str) else list(filepath)
+    missing = [p for p in filepaths if not os.path.exists(p)]
+    if missing:
+        print(f"[ERROR] File does not exist: {', '.join(missing)}")
+        return
+
+    for path, size in zip(filepaths, SendFiles(sock, filepaths)):
+        print(f"[CLIENT] Sent file {os.path.basename(path)} ({size} bytes)")
+
+
+def run_client(server_ip, port=5002, node_id=None):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as client:
         client.connect((server_ip, port))
+        Tune(client)
         print(f"[CLIENT] Connected to server {server_ip}:{port}")
+        if node_id:
+            # lets the admin address this connection by node ID (Admin/server.py:TransferServer)
+            SendMessage(client, f"HELLO {node_id}")
 
         threading.Thread(target=receive_messages, args=(client,), daemon=True).start()
 
@@ -103,7 +341,7 @@ def run_client(server_ip, port=5002):
                 filepath = user_input[5:].strip()
                 send_file(client, filepath)
             else:
-                client.sendall(user_input.encode())
+                SendMessage(client, user_input)
                 print(f"[SENT] {user_input}")
 
 
@@ -119,6 +357,37 @@ if __name__ == "__main__":
             ngrok_link = sys.argv[2] if len(sys.argv) == 3 else DEFAULT_NGROK_LINK
             download_file(ngrok_link, "n1.zip")
 
+        elif sys.argv[1] == "--fetch-bundle":
+            from core import FetchBundle
+            node_id = sys.argv[2] if len(sys.argv) >= 3 else "n1"
+            ngrok_link = sys.argv[3] if len(sys.argv) == 4 else DEFAULT_NGROK_LINK
+            FetchBundle(ngrok_link, node_id)
+
+        elif sys.argv[1] == "--work":
+            node_id = sys.argv[2] if len(sys.argv) >= 3 else "n1"
+            ngrok_link = sys.argv[3] if len(sys.argv) == 4 else DEFAULT_NGROK_LINK
+            work_loop(ngrok_link, node_id)
+
+        elif sys.argv[1] == "--heartbeat":
+            node_id = sys.argv[2] if len(sys.argv) >= 3 else "n1"
+            ngrok_link = sys.argv[3] if len(sys.argv) == 4 else DEFAULT_NGROK_LINK
+            heartbeat_loop(ngrok_link, node_id)
+
+        elif sys.argv[1] == "--upload":
+            filepath = sys.argv[2]
+            ngrok_link = sys.argv[3] if len(sys.argv) == 4 else DEFAULT_NGROK_LINK
+            upload_file(ngrok_link, filepath)
+
+        elif sys.argv[1] == "--report-capacity":
+            node_id = sys.argv[2] if len(sys.argv) >= 3 else "n1"
+            ngrok_link = sys.argv[3] if len(sys.argv) == 4 else DEFAULT_NGROK_LINK
+            report_capacity(ngrok_link, node_id, measure=True)
+
+        elif sys.argv[1] == "--lan":
+            node_id = sys.argv[2] if len(sys.argv) >= 3 else "n1"
+            server_ip = sys.argv[3] if len(sys.argv) == 4 else "172.18.237.8"
+            run_client(server_ip, node_id=node_id)
+
         else:
             run_client("172.18.237.8")
 
@@ -2,15 +2,85 @@
 This file has all the required functions to run the server files
 """
 
-import zipfile
+import hashlib
+import json
 import os
+import shutil
+import zipfile
+
+from client import base_url, fetch_file, file_sha256, http_session
+
+MANIFEST_NAME = "manifest.json"
+CODE_CACHE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".code_cache")
 
 def ExtractZip(zip_path, extract_to="."):
     """
     Extracts all files from a zip archive into the specified directory.
+    If the bundle has a manifest.json, its code files are added to the code cache.
     """
     if not os.path.exists(zip_path):
         raise FileNotFoundError(f"{zip_path} does not exist")
 
     with zipfile.ZipFile(zip_path, "r") as zipf:
         zipf.extractall(extract_to)
+        has_manifest = MANIFEST_NAME in zipf.namelist()
+
+    if has_manifest:
+        with open(os.path.join(extract_to, MANIFEST_NAME), "r", encoding="utf-8") as f:
+            CacheCode(json.load(f), extract_to)
+
+def CacheCode(manifest, extract_to="."):
+    """
+    Copies extracted code files into CODE_CACHE, named by their sha256.
+    """
+    os.makedirs(CODE_CACHE, exist_ok=True)
+    for arcname, sha in manifest.items():
+        blob = os.path.join(CODE_CACHE, sha)
+        src = os.path.join(extract_to, arcname)
+        if not os.path.exists(blob) and os.path.exists(src) and file_sha256(src) == sha:
+            shutil.copyfile(src, blob + ".tmp")
+            os.replace(blob + ".tmp", blob)
+
+def FetchBundle(ngrok_url, node_id, extract_to="."):
+    """
+    Fetches a node's bundle from the admin, downloading only the code blobs that
+    are not in CODE_CACHE yet. On a repeat job with unchanged code only the
+    PreProcess/ chunks are transferred. Returns the number of blobs downloaded.
+    """
+    base = base_url(ngrok_url)
+    downloaded = 0
+
+    session = http_session()
+    resp = session.get(f"{base}/api/bundle/{node_id}/manifest")
+    resp.raise_for_status()
+    manifest = resp.json()
+
+    os.makedirs(CODE_CACHE, exist_ok=True)
+    for arcname, sha in manifest["code"].items():
+        blob = os.path.join(CODE_CACHE, sha)
+        if not os.path.exists(blob):
+            resp = session.get(f"{base}/api/blob/{sha}")
+            resp.raise_for_status()
+            if hashlib.sha256(resp.content).hexdigest() != sha:
+                raise ValueError(f"Checksum mismatch for {arcname}")
+            with open(blob + ".tmp", "wb") as f:
+                f.write(resp.content)
+            os.replace(blob + ".tmp", blob)
+            downloaded += 1
+
+        dest = os.path.join(extract_to, arcname)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        shutil.copyfile(blob, dest)
+
+    with open(os.path.join(extract_to, MANIFEST_NAME), "w", encoding="utf-8") as f:
+        json.dump(manifest["code"], f)
+
+    # the chunks are the large part: streamed, and resumed with ranges if that fails
+    data_zip = fetch_file(f"{base}/api/bundle/{node_id}/data", os.path.join(extract_to, f"{node_id}_data.zip"))
+    with zipfile.ZipFile(data_zip, "r") as zipf:
+        zipf.extractall(extract_to)
+    os.remove(data_zip)
+
+    print(f"[BUNDLE] {node_id}: {downloaded} code blob(s) downloaded, "
+          f"{len(manifest['code']) - downloaded} from cache")
+    return downloaded
@@ -9,8 +9,8 @@ import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Server, Settings, Activity, RefreshCw } from "lucide-react";
 import { useRouter } from "next/navigation";
 import { useEffect } from "react";
-import { adminApi } from "@/lib/api/backend";
-import { useMultipleApi } from "@/lib/api/hooks";
+import { AdminDashboard, dashboardApi } from "@/lib/api/backend";
+import { useApi } from "@/lib/api/hooks";
 
 export default function AdminDashboard() {
   const { user, loading, isAdmin } = useAuthContext();
@@ -18,23 +18,23 @@ export default function AdminDashboard() {
 
   // Fetch all admin data
   const {
-    data,
+    data: dashboard,
     loading: apiLoading,
-    errors,
+    error,
     refetch,
-  } = useMultipleApi(
-    {
-      stats: adminApi.getStats,
-      nodes: adminApi.getNodes,
-      taskAssignments: adminApi.getTaskAssignments,
-      newNodes: adminApi.getNewNodes,
-      currentAssignments: adminApi.getCurrentAssignments,
-    },
-    {
-      autoFetch: true,
-      refreshInterval: 30000, // Refresh every 30 seconds
-    }
-  );
+  } = useApi(dashboardApi.getAdmin, {
+    autoFetch: true,
+    refreshInterval: 30000, // Refresh every 30 seconds
+  });
+  const data: Partial<AdminDashboard> = dashboard || {};
+  const errors: Partial<Record<keyof AdminDashboard, string>> = error
+    ? {
+        nodes: error,
+        taskAssignments: error,
+        newNodes: error,
+        currentAssignments: error,
+      }
+    : {};
 
   useEffect(() => {
     const checkAuth = async () => {
@@ -26,9 +26,22 @@ export async function GET(
         ...(request.headers.get("authorization") && {
           Authorization: request.headers.get("authorization")!,
         }),
+        // Let the backend answer unchanged snapshots with 304
+        ...(request.headers.get("if-none-match") && {
+          "If-None-Match": request.headers.get("if-none-match")!,
+        }),
       },
     });
 
+    const etag = response.headers.get("etag");
+    const cacheHeaders: Record<string, string> = etag
+      ? { ETag: etag, "Cache-Control": "no-cache" }
+      : {};
+
+    if (response.status === 304) {
+      return new NextResponse(null, { status: 304, headers: cacheHeaders });
+    }
+
     if (!response.ok) {
       console.error(
         `[PROXY] Backend error: ${response.status} ${response.statusText}`
@@ -40,7 +53,7 @@ export async function GET(
     }
 
     const data = await response.json();
-    return NextResponse.json(data);
+    return NextResponse.json(data, { headers: cacheHeaders });
   } catch (error) {
     console.error("[PROXY] Error connecting to backend:", error);
     return NextResponse.json(
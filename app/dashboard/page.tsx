@@ -9,8 +9,8 @@ import { Card, CardContent, CardHeader, CardTitle } from "@/components/ui/card";
 import { Activity, Clock, CheckCircle, Zap, RefreshCw } from "lucide-react";
 import { useRouter } from "next/navigation";
 import { useEffect } from "react";
-import { userApi } from "@/lib/api/backend";
-import { useMultipleApi } from "@/lib/api/hooks";
+import { UserDashboard, dashboardApi } from "@/lib/api/backend";
+import { useApi } from "@/lib/api/hooks";
 
 export default function UserDashboard() {
   const { isAuthenticated, user, loading } = useAuthContext();
@@ -18,22 +18,18 @@ export default function UserDashboard() {
 
   // Fetch all user data
   const {
-    data,
+    data: dashboard,
     loading: apiLoading,
-    errors,
+    error,
     refetch,
-  } = useMultipleApi(
-    {
-      stats: userApi.getStats,
-      gpus: userApi.getGPUs,
-      tasks: userApi.getTasks,
-      processors: userApi.getProcessors,
-    },
-    {
-      autoFetch: true,
-      refreshInterval: 15000, // Refresh every 15 seconds for real-time updates
-    }
-  );
+  } = useApi(dashboardApi.getUser, {
+    autoFetch: true,
+    refreshInterval: 15000, // Refresh every 15 seconds for real-time updates
+  });
+  const data: Partial<UserDashboard> = dashboard || {};
+  const errors: Partial<Record<keyof UserDashboard, string>> = error
+    ? { gpus: error, tasks: error }
+    : {};
 
   useEffect(() => {
     if (!loading && !isAuthenticated) {
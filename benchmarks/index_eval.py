@@ -0,0 +1,147 @@
+"""
+Evaluation of the final index specs (Admin/finalrun.py) against the exact flat
+baseline. For every spec the index is built with finalrun.BuildIndex and then
+searched with each nprobe / efSearch in the sweep, reporting:
+
+  recall      recall@k against exact search, on held-out queries
+  build       training + add time
+  memory      size of the serialized index (vectors, codes and graph)
+  qps         batched queries per second, plus single-query p50 / p95 latency
+
+With --shards N the vectors are split into N shards searched in parallel
+(Admin/shards.py), as finalrun.py --shards does per node.
+
+The vectors are merged_embeddings.npy (--embeddings), or a synthetic clustered
+set shaped like sentence embeddings. Results are printed and written as JSON.
+
+Usage: python benchmarks/index_eval.py --vectors 200000 --specs flat ivf-flat ivf-pq hnsw --output index.json
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import faiss
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "Admin"))
+
+from finalrun import BuildIndex, ExactNeighbors, IndexFactoryString, Recall
+from pipeline import Meta
+from shards import ShardedIndex
+
+SPECS = ["flat", "ivf-flat", "ivf-pq", "hnsw"]
+NPROBE_SWEEP = [1, 4, 16, 64]
+EF_SEARCH_SWEEP = [16, 64, 256]
+
+def Synthetic(n, d, clusters=256, seed=0):
+    """Normalized points around random centres, so approximate search behaves as on real embeddings"""
+    rng = np.random.default_rng(seed)
+    centres = rng.standard_normal((clusters, d)).astype(np.float32)
+    x = centres[rng.integers(0, clusters, n)] + 0.5 * rng.standard_normal((n, d)).astype(np.float32)
+    return x / np.linalg.norm(x, axis=1, keepdims=True)
+
+def Search(index, queries, k, single=200):
+    """(ids, qps of one batched search, per-query latencies in seconds)"""
+    start = time.perf_counter()
+    _, ids = index.search(queries, k)
+    qps = len(queries) / (time.perf_counter() - start)
+    latencies = []
+    for q in queries[:single]:
+        start = time.perf_counter()
+        index.search(q[None, :], k)
+        latencies.append(time.perf_counter() - start)
+    return ids, qps, latencies
+
+def Sweep(index):
+    """The search parameter this index has, and the values to try"""
+    index = index.indexes[0] if isinstance(index, ShardedIndex) else index
+    if faiss.try_extract_index_ivf(index) is not None:
+        nlist = faiss.extract_index_ivf(index).nlist
+        return "nprobe", [v for v in NPROBE_SWEEP if v <= nlist]
+    if "HNSW" in type(faiss.downcast_index(index)).__name__:
+        return "efSearch", EF_SEARCH_SWEEP
+    return None, [None]
+
+def Evaluate(embeddings, queries, truth, spec, k, shards=1):
+    start = time.perf_counter()
+    if shards > 1:
+        index = ShardedIndex(directory=None)
+        bounds = np.linspace(0, embeddings.shape[0], shards + 1).astype(int)
+        for i, (lo, hi) in enumerate(zip(bounds[:-1], bounds[1:])):
+            index.add(f"shard{i}", BuildIndex(embeddings[lo:hi], spec))
+        parts = index.indexes
+    else:
+        index = BuildIndex(embeddings, spec)
+        parts = [index]
+    build = time.perf_counter() - start
+
+    result = {
+        "factory": IndexFactoryString(spec, embeddings.shape[0] // shards, embeddings.shape[1]),
+        "shards": shards,
+        "build_sec": round(build, 3),
+        "memory_mb": round(sum(len(faiss.serialize_index(p)) for p in parts) / 2**20, 2),
+        "runs": [],
+    }
+    name, values = Sweep(index)
+    params = faiss.ParameterSpace()
+    for value in values:
+        for part in parts if name else []:
+            params.set_index_parameter(part, name, value)
+        ids, qps, latencies = Search(index, queries, k)
+        run = {name: value} if name else {}
+        run.update({
+            "recall": round(Recall(ids, truth), 4),
+            "qps": round(qps, 1),
+            "p50_ms": round(statistics.median(latencies) * 1000, 3),
+            "p95_ms": round(sorted(latencies)[int(len(latencies) * 0.95)] * 1000, 3),
+        })
+        result["runs"].append(run)
+    return result
+
+def Run(args):
+    faiss.omp_set_num_threads(args.threads or os.cpu_count())
+    if args.embeddings:
+        embeddings = np.load(args.embeddings, mmap_mode="r")
+    else:
+        embeddings = Synthetic(args.vectors + args.queries, args.dim, seed=args.seed)
+    # held-out queries: the last rows are searched for, not indexed
+    queries = np.ascontiguousarray(embeddings[-args.queries:], dtype=np.float32)
+    embeddings = embeddings[:-args.queries]
+
+    start = time.perf_counter()
+    truth = ExactNeighbors(embeddings, queries, args.top_k)
+    results = {"meta": Meta(args), "vectors": int(embeddings.shape[0]), "dim": int(embeddings.shape[1]),
+               "ground_truth_sec": round(time.perf_counter() - start, 3), "specs": {}}
+    for spec in args.specs:
+        print(f"[EVAL] {spec}...", file=sys.stderr)
+        try:
+            results["specs"][spec] = Evaluate(embeddings, queries, truth, spec, args.top_k, args.shards)
+        except Exception as e:
+            results["specs"][spec] = {"error": f"{type(e).__name__}: {e}"}
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare final index specs against exact search")
+    parser.add_argument("--specs", nargs="+", default=SPECS, help="Index specs or index_factory strings")
+    parser.add_argument("--embeddings", help="A merged_embeddings.npy to evaluate on instead of synthetic vectors")
+    parser.add_argument("--vectors", type=int, default=200000, help="Synthetic vectors to index")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding size (all-MiniLM-L6-v2 is 384)")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=10)
+    parser.add_argument("--shards", type=int, default=1, help="Split the vectors into this many shards")
+    parser.add_argument("--threads", type=int, help="FAISS threads (default: all cores)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    args = parser.parse_args()
+
+    results = Run(args)
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
@@ -0,0 +1,352 @@
+"""
+End-to-end benchmark of the pipeline on a synthetic corpus. Each stage runs in
+a scratch directory, is repeated --repeat times, and reports its best and
+median wall time plus a throughput figure:
+
+  datasplit   DataSplit with every Objtype (1-5), plus the no-op rerun of 4 and 5
+  createzip   CreateZip for every node (cold and cached) and StreamZip
+  transfer    a file sent over a socket with Admin/server.py and User/client.py
+  encode      SimpleTextQA model load, encoding of the chunks and finalize_index
+  merge       Admin/finalrun.py on synthetic node results
+  query       FAISS search latency on the merged index, and SimpleTextQA.answer
+
+Stages whose dependencies are missing (sentence-transformers, faiss) are
+reported as skipped. Results are printed and written as JSON so runs can be
+compared between releases.
+
+Usage: python benchmarks/pipeline.py --corpus-mb 20 --nodes 4 --output results.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import contextmanager, redirect_stdout
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+ADMIN_DIR = os.path.join(ROOT, "Admin")
+USER_DIR = os.path.join(ROOT, "User")
+# Admin first: both folders have a core.py, and server.py needs the Admin one
+sys.path[:0] = [ADMIN_DIR, USER_DIR]
+
+STAGES = ["datasplit", "createzip", "transfer", "encode", "merge", "query"]
+WORDS = ("node chunk index vector embedding model query answer cluster data split "
+         "bundle merge search network server client worker task result text").split()
+
+def Corpus(directory, size_mb, files=4, seed=0):
+    """Writes size_mb of random sentences over `files` files; same seed, same corpus"""
+    rng = random.Random(seed)
+    os.makedirs(directory, exist_ok=True)
+    per_file = size_mb * 1024 * 1024 // files
+    for n in range(files):
+        with open(os.path.join(directory, f"corpus_{n}.txt"), "w", encoding="utf-8") as f:
+            written = 0
+            while written < per_file:
+                line = " ".join(rng.choice(WORDS) for _ in range(rng.randint(8, 40))) + ".\n"
+                f.write(line)
+                written += len(line)
+    return directory
+
+def Measure(fn, repeat, setup=None):
+    """Runs fn() `repeat` times (after setup() each time) and returns timings and fn's last result"""
+    times, result = [], None
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return {"best": round(min(times), 4), "median": round(statistics.median(times), 4)}, result
+
+@contextmanager
+def Quiet():
+    """The pipeline functions print progress; keep it out of the results"""
+    with open(os.devnull, "w") as devnull, redirect_stdout(devnull):
+        yield
+
+@contextmanager
+def Cwd(path):
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def _Size(paths):
+    return sum(os.path.getsize(p) for p in paths)
+
+def BenchDataSplit(work, corpus, args):
+    from helper import DataSplit
+
+    corpus_bytes = _Size(os.path.join(corpus, f) for f in os.listdir(corpus))
+    results = {}
+    for objtype in (1, 2, 3, 4, 5):
+        inp = os.path.join(work, f"split_in_{objtype}")
+        out = os.path.join(work, f"split_out_{objtype}")
+
+        def reset():
+            # types 1-3 write sample1.txt into the input folder, so start from a clean copy
+            shutil.rmtree(inp, ignore_errors=True)
+            shutil.rmtree(out, ignore_errors=True)
+            shutil.copytree(corpus, inp)
+
+        with Quiet():
+            timing, chunks = Measure(lambda: DataSplit(inp, out, Objtype=objtype, chunks=args.chunks), args.repeat, reset)
+        result = dict(timing, chunks=len(chunks or []), mb_per_sec=round(corpus_bytes / 2**20 / timing["best"], 1))
+        if objtype in (4, 5):
+            with Quiet():
+                result["rerun"], _ = Measure(lambda: DataSplit(inp, out, Objtype=objtype, chunks=args.chunks), args.repeat)
+        results[f"objtype_{objtype}"] = result
+    return results
+
+def BenchCreateZip(work, corpus, args):
+    from helper import DataSplit
+    from userside import CreateZip, StreamZip
+
+    source = os.path.join(ADMIN_DIR, "mycmd")
+    commands = [{"description": "benchmark", "command": "python main.py"}]
+    zip_dir = os.path.join(work, "zips")
+    os.makedirs(zip_dir, exist_ok=True)
+    with Quiet():
+        chunks = DataSplit(corpus, os.path.join(work, "zip_chunks"), Objtype=5, chunks=args.nodes)
+    per_node = [chunks[i::args.nodes] for i in range(args.nodes)]
+
+    def build():
+        return [CreateZip(files, source, f"n{i}", commands) for i, files in enumerate(per_node)]
+
+    def clean():
+        # empty the folder, not remove it: it is the working directory while this runs
+        for name in os.listdir(zip_dir):
+            path = os.path.join(zip_dir, name)
+            if os.path.isdir(path):
+                shutil.rmtree(path)
+            else:
+                os.remove(path)
+
+    with Cwd(zip_dir):
+        cold, zips = Measure(build, args.repeat, clean)
+        cached, _ = Measure(build, args.repeat)
+        zip_bytes = _Size(zips)
+
+    def stream():
+        return sum(len(block) for files in per_node for block in StreamZip(files, source, commands))
+
+    streamed, streamed_bytes = Measure(stream, args.repeat)
+    return {
+        "cold": dict(cold, mb_per_sec=round(zip_bytes / 2**20 / cold["best"], 1)),
+        "cached": cached,
+        "stream": dict(streamed, mb_per_sec=round(streamed_bytes / 2**20 / streamed["best"], 1)),
+        "nodes": args.nodes,
+        "bytes": zip_bytes,
+    }
+
+def BenchTransfer(work, corpus, args):
+    import server
+    import client
+
+    payload = os.path.join(work, "transfer.bin")
+    with open(payload, "wb") as f:
+        f.write(os.urandom(args.transfer_mb * 1024 * 1024))
+    recv_dir = os.path.join(work, "transfer_recv")
+    os.makedirs(recv_dir, exist_ok=True)
+
+    def send_once():
+        listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listener.bind(("127.0.0.1", 0))
+        listener.listen(1)
+
+        def receive():
+            conn, _ = listener.accept()
+            with conn:
+                server.receive_messages(conn)
+
+        receiver = threading.Thread(target=receive)
+        receiver.start()
+        with socket.create_connection(listener.getsockname()) as sock:
+            client.send_file(sock, payload)
+            sock.shutdown(socket.SHUT_WR)
+            receiver.join()
+        listener.close()
+
+    with Cwd(recv_dir), Quiet():
+        timing, _ = Measure(send_once, args.repeat)
+    received = os.path.join(recv_dir, "received_transfer.bin")
+    return dict(timing, bytes=os.path.getsize(payload), complete=os.path.getsize(received) == os.path.getsize(payload),
+                mb_per_sec=round(args.transfer_mb / timing["best"], 1))
+
+def BenchEncode(work, corpus, args, shared):
+    try:
+        from aipart import SimpleTextQA
+    except ImportError as e:
+        return {"skipped": str(e)}
+    from helper import DataSplit
+
+    with Quiet():
+        chunks = DataSplit(corpus, os.path.join(work, "encode_chunks"), Objtype=5, chunks=args.chunks)
+    texts = []
+    for path in chunks:
+        with open(path, encoding="utf-8") as f:
+            texts.append(f.read()[:args.encode_chars])
+    windows = sum(-(-len(t) // 500) for t in texts)
+
+    load, qa = Measure(SimpleTextQA, 1)
+
+    def encode():
+        qa.text_chunks, qa.embeddings_list = [], []
+        for text in texts:
+            qa.add_text_chunk(text)
+
+    timing, _ = Measure(encode, args.repeat)
+    finalize, _ = Measure(qa.finalize_index, args.repeat)
+    shared["qa"] = qa
+    return {"model_load": load, "encode": dict(timing, windows=windows, windows_per_sec=round(windows / timing["best"], 1)),
+            "finalize_index": finalize}
+
+def BenchMerge(work, corpus, args, shared):
+    try:
+        import numpy as np
+        import faiss  # noqa: F401 - finalrun.py needs it
+    except ImportError as e:
+        return {"skipped": str(e)}
+
+    # finalrun.py works on the receivedd/ folder next to it, so run a copy in the scratch dir
+    merge_dir = os.path.join(work, "merge")
+    received = os.path.join(merge_dir, "receivedd")
+    rng = np.random.default_rng(0)
+
+    def setup():
+        shutil.rmtree(merge_dir, ignore_errors=True)
+        os.makedirs(received)
+        shutil.copy(os.path.join(ADMIN_DIR, "finalrun.py"), merge_dir)
+        for n in range(args.nodes):
+            node = os.path.join(merge_dir, f"n{n}")
+            os.makedirs(node)
+            np.save(os.path.join(node, "embeddings.npy"), rng.standard_normal((args.vectors, args.dim), dtype=np.float32))
+            with zipfile.ZipFile(os.path.join(received, f"n{n}_PostP.zip"), "w") as z:
+                z.write(os.path.join(node, "embeddings.npy"), f"n{n}/embeddings.npy")
+            shutil.rmtree(node)
+
+    def merge():
+        subprocess.run([sys.executable, os.path.join(merge_dir, "finalrun.py")], check=True,
+                       stdout=subprocess.DEVNULL, cwd=merge_dir)
+
+    timing, _ = Measure(merge, args.repeat, setup)
+    shared["index"] = os.path.join(received, "final_index.faiss")
+    total = args.nodes * args.vectors
+    return dict(timing, vectors=total, dim=args.dim, vectors_per_sec=round(total / timing["best"]))
+
+def BenchQuery(work, corpus, args, shared):
+    results = {}
+    if shared.get("index"):
+        import numpy as np
+        import faiss
+
+        index = faiss.read_index(shared["index"])
+        queries = np.random.default_rng(1).standard_normal((args.queries, index.d), dtype=np.float32)
+        latencies = []
+        for q in queries:
+            start = time.perf_counter()
+            index.search(q[None, :], args.top_k)
+            latencies.append(time.perf_counter() - start)
+        batch, _ = Measure(lambda: index.search(queries, args.top_k), args.repeat)
+        results["index"] = {
+            "vectors": index.ntotal,
+            "p50_ms": round(statistics.median(latencies) * 1000, 3),
+            "p95_ms": round(sorted(latencies)[int(len(latencies) * 0.95)] * 1000, 3),
+            "batch_qps": round(args.queries / batch["best"]),
+        }
+    else:
+        results["index"] = {"skipped": "no merged index (merge stage skipped)"}
+
+    if shared.get("qa"):
+        qa = shared["qa"]
+        latencies = []
+        for i in range(min(args.queries, 100)):
+            question = " ".join(random.Random(i).choice(WORDS) for _ in range(6)) + "?"
+            start = time.perf_counter()
+            qa.answer(question, top_k=args.top_k)
+            latencies.append(time.perf_counter() - start)
+        results["answer"] = {
+            "p50_ms": round(statistics.median(latencies) * 1000, 3),
+            "p95_ms": round(sorted(latencies)[int(len(latencies) * 0.95)] * 1000, 3),
+        }
+    else:
+        results["answer"] = {"skipped": "no SimpleTextQA model (encode stage skipped)"}
+    return results
+
+def Meta(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit or None,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "config": vars(args),
+    }
+
+def Run(args):
+    shared = {}
+    results = {"meta": Meta(args), "stages": {}}
+    work = tempfile.mkdtemp(prefix="devjam-bench-")
+    try:
+        corpus = Corpus(os.path.join(work, "corpus"), args.corpus_mb, seed=args.seed)
+        benches = {
+            "datasplit": lambda: BenchDataSplit(work, corpus, args),
+            "createzip": lambda: BenchCreateZip(work, corpus, args),
+            "transfer": lambda: BenchTransfer(work, corpus, args),
+            "encode": lambda: BenchEncode(work, corpus, args, shared),
+            "merge": lambda: BenchMerge(work, corpus, args, shared),
+            "query": lambda: BenchQuery(work, corpus, args, shared),
+        }
+        for stage in args.stages:
+            print(f"[BENCH] {stage}...", file=sys.stderr)
+            try:
+                results["stages"][stage] = benches[stage]()
+            except Exception as e:
+                results["stages"][stage] = {"error": f"{type(e).__name__}: {e}"}
+    finally:
+        if args.keep:
+            print(f"[BENCH] Scratch files kept in {work}", file=sys.stderr)
+        else:
+            shutil.rmtree(work, ignore_errors=True)
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every stage of the pipeline")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=STAGES)
+    parser.add_argument("--corpus-mb", type=int, default=20, help="Size of the synthetic corpus")
+    parser.add_argument("--chunks", type=int, default=8, help="Chunks per DataSplit")
+    parser.add_argument("--nodes", type=int, default=4, help="Nodes for CreateZip and merge")
+    parser.add_argument("--transfer-mb", type=int, default=64, help="Size of the file sent over the socket")
+    parser.add_argument("--encode-chars", type=int, default=20000, help="Characters per chunk to encode")
+    parser.add_argument("--vectors", type=int, default=50000, help="Embeddings per node for merge and query")
+    parser.add_argument("--dim", type=int, default=384, help="Embedding size (all-MiniLM-L6-v2 is 384)")
+    parser.add_argument("--queries", type=int, default=1000)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="Also write the JSON results to this file")
+    parser.add_argument("--keep", action="store_true", help="Keep the scratch directory")
+    args = parser.parse_args()
+
+    results = Run(args)
+    text = json.dumps(results, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
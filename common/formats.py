@@ -0,0 +1,10 @@
+"""
+File types the transfer and packaging code treats specially. This is the one
+list for common/protocol.py (frame codec), Admin/userside.py (bundle zips) and
+Admin/mycmd/helpdef.py (result zip, which gets this file in its bundle).
+"""
+
+# Formats that are already compressed or are dense binary (float embeddings):
+# sent and zipped as they are, since compressing them costs CPU and saves almost nothing
+STORED_EXTENSIONS = {".npy", ".npz", ".zip", ".gz", ".bz2", ".xz", ".faiss", ".pt", ".safetensors",
+                     ".png", ".jpg", ".jpeg"}
@@ -0,0 +1,247 @@
+"""
+This file has the framing of the LAN socket transfer (server.py <-> client.py).
+Every frame starts with a fixed binary header, so the receiver always knows
+where a message or file ends and frames can be sent back to back:
+
+    magic "DJ" | version (1) | type (1) | codec (1) | name length (2) | payload length (8) | sha256 (32)
+
+followed by the UTF-8 name and the payload. The length and sha256 are those of
+the original payload. With codec RAW the payload follows as is: files are sent
+with socket.sendfile (zero-copy where the OS supports it) and received with
+recv_into into one preallocated buffer, checking the sha256 as they arrive.
+With codec ZLIB it follows as blocks of (4-byte length, zlib data), ended by
+an empty block.
+
+The sender picks the codec per file (ChooseCodec): already dense files
+(.npy, .zip, ...) are never compressed, text is compressed with fast zlib,
+and compression is turned off when the connection has been measured to be
+faster than the compressor.
+Both programs use this one file: Admin/server.py and User/client.py put
+common/ on sys.path before importing it.
+"""
+
+import hashlib
+import os
+import socket
+import struct
+import time
+import weakref
+import zlib
+from formats import STORED_EXTENSIONS
+
+MAGIC = b"DJ"
+VERSION = 2
+HEADER = struct.Struct("!2sBBBHQ32s")
+BLOCK = struct.Struct("!I")
+BUFFER_SIZE = 1024 * 1024
+SOCKET_BUFFER = 4 * 1024 * 1024
+
+MESSAGE = 1
+FILE = 2
+
+RAW = 0
+ZLIB = 1
+ZLIB_LEVEL = 1
+TEXT_EXTENSIONS = {".txt", ".json", ".jsonl", ".csv", ".md", ".py", ".log"}
+# Compress only if a sample shrinks to at most this fraction
+MAX_RATIO = 0.9
+SAMPLE_SIZE = 64 * 1024
+
+class ProtocolError(Exception):
+    """The peer sent something that is not a valid frame, or the connection dropped mid-frame"""
+
+class LinkStats:
+    """
+    Measured throughput of one connection (bytes/s on the wire, timed while
+    sending, whichever the codec) and of the local compressor
+    """
+
+    compress_speed = None
+
+    def __init__(self):
+        self.bytes_per_sec = None
+
+    def record(self, nbytes, seconds):
+        # small sends mostly measure latency, not bandwidth
+        if nbytes >= 256 * 1024 and seconds > 0:
+            self.bytes_per_sec = _Ewma(self.bytes_per_sec, nbytes / seconds)
+
+    @classmethod
+    def record_compress(cls, nbytes, seconds):
+        if seconds > 0:
+            cls.compress_speed = _Ewma(cls.compress_speed, nbytes / seconds)
+
+_links = weakref.WeakKeyDictionary()
+
+def LinkFor(sock):
+    link = _links.get(sock)
+    if link is None:
+        link = _links[sock] = LinkStats()
+    return link
+
+def ChooseCodec(filepath, link=None):
+    """RAW or ZLIB for this file, by type, a compressibility sample and the measured speeds"""
+    ext = os.path.splitext(filepath)[1].lower()
+    if ext in STORED_EXTENSIONS or os.path.getsize(filepath) < 4096:
+        return RAW
+    if ext not in TEXT_EXTENSIONS:
+        with open(filepath, "rb") as f:
+            sample = f.read(SAMPLE_SIZE)
+        start = time.perf_counter()
+        compressed = zlib.compress(sample, ZLIB_LEVEL)
+        LinkStats.record_compress(len(sample), time.perf_counter() - start)
+        if len(compressed) > len(sample) * MAX_RATIO:
+            return RAW
+    if link and link.bytes_per_sec and LinkStats.compress_speed and LinkStats.compress_speed < link.bytes_per_sec:
+        # the link is faster than the compressor: compressing would slow the transfer down
+        return RAW
+    return ZLIB
+
+def CompressBlocks(f):
+    """Yields the framed zlib blocks of the rest of file f, ending with the empty block"""
+    compressor = zlib.compressobj(ZLIB_LEVEL)
+    while block := f.read(BUFFER_SIZE):
+        start = time.perf_counter()
+        data = compressor.compress(block)
+        LinkStats.record_compress(len(block), time.perf_counter() - start)
+        if data:
+            yield BLOCK.pack(len(data)) + data
+    data = compressor.flush()
+    if data:
+        yield BLOCK.pack(len(data)) + data
+    yield BLOCK.pack(0)
+
+def Tune(sock):
+    """Large kernel buffers for bulk transfers, and no Nagle delay for small messages"""
+    for option in (socket.SO_SNDBUF, socket.SO_RCVBUF):
+        try:
+            sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER)
+        except OSError:
+            pass
+    sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    return sock
+
+def SendMessage(sock, text):
+    payload = text.encode()
+    sock.sendall(FrameHeader(MESSAGE, b"", len(payload), hashlib.sha256(payload).digest()) + payload)
+
+def SendFile(sock, filepath, name=None, codec=None):
+    """Sends one file as a frame, with codec or the one ChooseCodec picks; returns its size"""
+    link = LinkFor(sock)
+    codec = ChooseCodec(filepath, link) if codec is None else codec
+    name = (name or os.path.basename(filepath)).encode()
+    size = os.path.getsize(filepath)
+    with open(filepath, "rb") as f:
+        digest = hashlib.sha256()
+        while block := f.read(BUFFER_SIZE):
+            digest.update(block)
+        sock.sendall(FrameHeader(FILE, name, size, digest.digest(), codec) + name)
+        f.seek(0)
+        if codec == ZLIB:
+            # only the socket time counts, so a link that turns out faster than the compressor switches to RAW
+            sent, seconds = 0, 0.0
+            for block in CompressBlocks(f):
+                start = time.perf_counter()
+                sock.sendall(block)
+                seconds += time.perf_counter() - start
+                sent += len(block)
+            link.record(sent, seconds)
+        else:
+            start = time.perf_counter()
+            sock.sendfile(f, 0, size)
+            link.record(size, time.perf_counter() - start)
+    return size
+
+def SendFiles(sock, filepaths):
+    """Sends several files back to back; the receiver splits them by their headers"""
+    return [SendFile(sock, path) for path in filepaths]
+
+class Receiver:
+    """
+    Reads frames from one socket. Files are written to directory/(prefix + name);
+    the receive buffer is allocated once and reused for every frame.
+    """
+
+    def __init__(self, sock, directory=".", prefix="", buffer_size=BUFFER_SIZE):
+        self.sock = sock
+        self.directory = directory
+        self.prefix = prefix
+        self._buffer = bytearray(buffer_size)
+        self._view = memoryview(self._buffer)
+
+    def __iter__(self):
+        while True:
+            frame = self.recv()
+            if frame is None:
+                return
+            yield frame
+
+    def recv(self):
+        """
+        Returns (MESSAGE, None, text) or (FILE, name, saved path), or None when
+        the peer closed the connection between frames.
+        """
+        header = self._recv_exact(HEADER.size, eof_ok=True)
+        if header is None:
+            return None
+        magic, version, kind, codec, name_len, length, checksum = HEADER.unpack(header)
+        if magic != MAGIC or version != VERSION:
+            raise ProtocolError(f"bad frame header {header[:4]!r}")
+        if codec not in (RAW, ZLIB):
+            raise ProtocolError(f"unknown codec {codec}")
+        name = self._recv_exact(name_len).decode() if name_len else None
+
+        if kind == MESSAGE:
+            payload = self._recv_exact(length)
+            if hashlib.sha256(payload).digest() != checksum:
+                raise ProtocolError("message checksum mismatch")
+            return MESSAGE, None, payload.decode()
+
+        if kind == FILE:
+            path = os.path.join(self.directory, self.prefix + os.path.basename(name or "file"))
+            digest = hashlib.sha256()
+            remaining = length
+            with open(path + ".part", "wb") as f:
+                if codec == ZLIB:
+                    decompressor = zlib.decompressobj()
+                    while block_len := BLOCK.unpack(self._recv_exact(BLOCK.size))[0]:
+                        data = decompressor.decompress(self._recv_exact(block_len))
+                        digest.update(data)
+                        f.write(data)
+                        remaining -= len(data)
+                    if remaining:
+                        raise ProtocolError(f"{name} decompressed to {length - remaining} bytes, expected {length}")
+                while remaining:
+                    n = self.sock.recv_into(self._view, min(remaining, len(self._buffer)))
+                    if not n:
+                        raise ProtocolError(f"connection closed with {remaining} bytes of {name} left")
+                    digest.update(self._view[:n])
+                    f.write(self._view[:n])
+                    remaining -= n
+            if digest.digest() != checksum:
+                os.remove(path + ".part")
+                raise ProtocolError(f"checksum mismatch for {name}")
+            os.replace(path + ".part", path)
+            return FILE, name, path
+
+        raise ProtocolError(f"unknown frame type {kind}")
+
+    def _recv_exact(self, size, eof_ok=False):
+        data = bytearray(size)
+        view = memoryview(data)
+        got = 0
+        while got < size:
+            n = self.sock.recv_into(view[got:], size - got)
+            if not n:
+                if eof_ok and got == 0:
+                    return None
+                raise ProtocolError("connection closed mid-frame")
+            got += n
+        return bytes(data)
+
+def FrameHeader(kind, name, length, checksum, codec=RAW):
+    """The fixed header of one frame; name is bytes"""
+    return HEADER.pack(MAGIC, VERSION, kind, codec, len(name), length, checksum)
+
+def _Ewma(previous, value, weight=0.3):
+    return value if previous is None else previous * (1 - weight) + value * weight
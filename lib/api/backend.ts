@@ -124,11 +124,32 @@ export const adminApi = {
     apiRequest<{
       message: string;
       nodes: string[];
-      chunks_created: number;
+      job_id: string;
+      status_url: string;
     }>("/admin/submit-nodes", {
       method: "POST",
       body: JSON.stringify({ nodes }),
     }),
+
+  // Poll a queued job for per-stage progress and timings
+  getJob: (jobId: string) =>
+    apiRequest<{
+      id: string;
+      kind: string;
+      status: "queued" | "running" | "done" | "failed";
+      stages: Array<{
+        name: string;
+        status: string;
+        started: number;
+        seconds: number | null;
+      }>;
+      result: {
+        nodes: string[];
+        chunks_created: number;
+        weighted: boolean;
+      } | null;
+      error: string | null;
+    }>(`/admin/jobs/${jobId}`),
 };
 
 // User Dashboard API calls
@@ -182,6 +203,33 @@ export const userApi = {
     }>("/user/processors"),
 };
 
+type ApiData<F extends (...args: any[]) => Promise<ApiResponse<any>>> =
+  NonNullable<Awaited<ReturnType<F>>["data"]>;
+
+export interface AdminDashboard {
+  version: number;
+  stats: ApiData<typeof adminApi.getStats>;
+  nodes: ApiData<typeof adminApi.getNodes>;
+  taskAssignments: ApiData<typeof adminApi.getTaskAssignments>;
+  newNodes: ApiData<typeof adminApi.getNewNodes>;
+  currentAssignments: ApiData<typeof adminApi.getCurrentAssignments>;
+}
+
+export interface UserDashboard {
+  version: number;
+  stats: ApiData<typeof userApi.getStats>;
+  gpus: ApiData<typeof userApi.getGPUs>;
+  tasks: ApiData<typeof userApi.getTasks>;
+  processors: ApiData<typeof userApi.getProcessors>;
+}
+
+// Aggregated dashboard snapshots - one request per refresh instead of one per card.
+// The backend sends an ETag, so the browser revalidates and unchanged polls are 304s.
+export const dashboardApi = {
+  getAdmin: () => apiRequest<AdminDashboard>("/admin/dashboard"),
+  getUser: () => apiRequest<UserDashboard>("/user/dashboard"),
+};
+
 // General utility functions
 export const api = {
   // Health check
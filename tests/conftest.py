@@ -0,0 +1,19 @@
+import os
+import sys
+import zipfile
+
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "Admin"))
+sys.path.insert(0, os.path.join(ROOT, "common"))
+
+def ResultZip(directory, name, embeddings):
+    """A node result as mycmd/helpdef.py writes it: every node uses the same names inside"""
+    path = os.path.join(directory, name)
+    npy = os.path.join(directory, "n1_embeddings.npy")
+    np.save(npy, embeddings)
+    with zipfile.ZipFile(path, "w") as z:
+        z.write(npy, "n1_PostProcess/n1_embeddings.npy")
+    os.remove(npy)
+    return path
@@ -0,0 +1,62 @@
+import os
+
+import pytest
+
+from helper import DataSplit
+
+LINES = [f"line {i} " + "word " * (i % 13) for i in range(40)]
+
+def Joined(layout):
+    return b"".join(open(p, "rb").read() for p in layout)
+
+@pytest.fixture
+def dirs(tmp_path, monkeypatch):
+    # errors are logged to ../.log
+    work = tmp_path / "work"
+    work.mkdir()
+    monkeypatch.chdir(work)
+    (tmp_path / "in").mkdir()
+    return str(tmp_path / "in") + os.sep, str(tmp_path / "out") + os.sep
+
+@pytest.mark.parametrize("objtype", [4, 5])
+def test_unchanged_inputs_do_no_work(dirs, objtype):
+    source, output = dirs
+    with open(source + "f0.txt", "w") as f:
+        f.write("\n".join(LINES))
+    layout = DataSplit(source, output, Objtype=objtype, chunks=3)
+    mtimes = [os.stat(p).st_mtime_ns for p in layout]
+    assert DataSplit(source, output, Objtype=objtype, chunks=3) == layout
+    assert [os.stat(p).st_mtime_ns for p in layout] == mtimes
+
+@pytest.mark.parametrize("objtype", [4, 5])
+@pytest.mark.parametrize("trailing", ["", "\n"])
+@pytest.mark.parametrize("chunks", [2, 3, 4])
+def test_append_only_adds_tail_chunks(dirs, objtype, trailing, chunks):
+    source, output = dirs
+    text = "\n".join(LINES) + trailing
+    with open(source + "f0.txt", "w") as f:
+        f.write(text)
+    before = DataSplit(source, output, Objtype=objtype, chunks=chunks)
+    kept = {p: open(p, "rb").read() for p in before[:-2]}
+
+    added = "zzz " * 150 + "\nlast line"
+    with open(source + "f0.txt", "a") as f:
+        f.write(added)
+    after = DataSplit(source, output, Objtype=objtype, chunks=chunks)
+
+    assert Joined(after) == (text + added + "\n").encode()
+    # chunks before the one holding the old last line are untouched
+    assert all(open(p, "rb").read() == data for p, data in kept.items())
+    assert sorted(f for f in os.listdir(output) if f != "manifest.json") == sorted(os.path.basename(p) for p in after)
+
+def test_append_after_a_chunk_closed_on_the_last_line(dirs):
+    # the per-file newline can end up alone in the last chunk; the old last line spans two chunks
+    source, output = dirs
+    text = "".join(("abc " * 30 + "\n") for _ in range(4)) + "x" * 100
+    with open(source + "f0.txt", "w") as f:
+        f.write(text)
+    DataSplit(source, output, Objtype=5, chunks=3)
+    with open(source + "f0.txt", "a") as f:
+        f.write("zzz" * 40)
+    layout = DataSplit(source, output, Objtype=5, chunks=3)
+    assert Joined(layout) == (text + "zzz" * 40 + "\n").encode()
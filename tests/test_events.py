@@ -0,0 +1,50 @@
+import socket
+import time
+
+import pytest
+
+from events import EventServer
+from state import ClusterState
+
+def Connect(server, path="/api/admin/events"):
+    conn = socket.create_connection(("127.0.0.1", server.port), timeout=5)
+    conn.sendall(f"GET {path} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+    return conn
+
+def ReadUntil(conn, marker):
+    data = b""
+    while marker not in data:
+        chunk = conn.recv(4096)
+        if not chunk:
+            break
+        data += chunk
+    return data.decode()
+
+@pytest.fixture
+def server():
+    state = ClusterState()
+    server = EventServer(state, lambda: "event: snapshot\ndata: {}\n\n",
+                         lambda topics: f"event: delta\ndata: {sorted(topics)}\n\n" if "nodes" in topics else None,
+                         host="127.0.0.1", port=0, coalesce=0.05, max_streams=2).start()
+    yield server
+    server.stop()
+
+def test_stream_sends_snapshot_then_deltas(server):
+    conn = Connect(server)
+    assert ReadUntil(conn, b"event: snapshot").startswith("HTTP/1.1 200 OK")
+    server.state.bump("jobs")
+    server.state.bump("nodes")
+    assert "data: ['jobs', 'nodes']" in ReadUntil(conn, b"]\n\n")
+    conn.close()
+
+def test_streams_beyond_the_limit_get_503(server):
+    open_streams = [Connect(server), Connect(server)]
+    for conn in open_streams:
+        ReadUntil(conn, b"event: snapshot")
+    assert ReadUntil(Connect(server), b"\r\n").startswith("HTTP/1.1 503")
+    open_streams.pop().close()
+    time.sleep(0.1)
+    assert ReadUntil(Connect(server), b"\r\n").startswith("HTTP/1.1 200")
+
+def test_other_paths_are_not_found(server):
+    assert ReadUntil(Connect(server, "/api/admin/dashboard"), b"\r\n").startswith("HTTP/1.1 404")
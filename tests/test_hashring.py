@@ -0,0 +1,32 @@
+import pytest
+
+from helper import HashRing
+
+KEYS = [f"chunk-{i}" for i in range(2000)]
+
+def test_owner_is_stable_and_spread():
+    ring = HashRing(["n1", "n2", "n3", "n4"])
+    owners = [ring.owner(k) for k in KEYS]
+    assert owners == [HashRing(["n4", "n3", "n2", "n1"]).owner(k) for k in KEYS]
+    for node in ["n1", "n2", "n3", "n4"]:
+        assert 0.15 < owners.count(node) / len(KEYS) < 0.35
+
+def test_adding_a_node_only_moves_its_keys():
+    ring = HashRing(["n1", "n2", "n3", "n4"])
+    before = {k: ring.owner(k) for k in KEYS}
+    ring.add("n5")
+    moved = [k for k in KEYS if ring.owner(k) != before[k]]
+    assert all(ring.owner(k) == "n5" for k in moved)
+    assert len(moved) / len(KEYS) < 0.35
+
+def test_removing_a_node_restores_the_ring():
+    ring = HashRing(["n1", "n2", "n3"])
+    before = [ring.owner(k) for k in KEYS]
+    ring.add("n4")
+    ring.remove("n4")
+    assert [ring.owner(k) for k in KEYS] == before
+    assert len(ring.points) == 3 * ring.replicas
+
+def test_empty_ring_has_no_owner():
+    with pytest.raises(ValueError):
+        HashRing().owner("chunk-1")
@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import pytest
+
+from conftest import ResultZip
+from merger import IncrementalMerger
+
+@pytest.fixture
+def vectors():
+    rng = np.random.default_rng(0)
+    return [rng.standard_normal((n, 8)).astype(np.float32) for n in (5, 7)]
+
+def test_zips_with_the_same_member_names_are_all_kept(tmp_path, vectors):
+    merger = IncrementalMerger(str(tmp_path))
+    for i, emb in enumerate(vectors):
+        assert merger.ingest(ResultZip(tmp_path, f"task-{i}_n1_PostP.zip", emb))
+    assert merger.ntotal == 12
+
+    # each node's vectors are still on disk, and are their own nearest neighbours
+    hits = merger.search(vectors[0][2], k=1)[0]
+    assert hits[0]["file"] == "task-0_n1_PostP.zip"
+    assert hits[0]["embeddings"] == os.path.join("task-0_n1_PostP", "n1_PostProcess", "n1_embeddings.npy")
+    assert hits[0]["row"] == 2
+    hits = merger.search(vectors[1][6], k=1)[0]
+    assert (hits[0]["file"], hits[0]["row"], hits[0]["id"]) == ("task-1_n1_PostP.zip", 6, 11)
+    for i, emb in enumerate(vectors):
+        path = tmp_path / "merged" / f"task-{i}_n1_PostP" / "n1_PostProcess" / "n1_embeddings.npy"
+        assert np.array_equal(np.load(path), emb)
+
+def test_finalize_merges_every_node(tmp_path, vectors):
+    merger = IncrementalMerger(str(tmp_path))
+    merger.scan()
+    for i, emb in enumerate(vectors):
+        ResultZip(tmp_path, f"task-{i}_n1_PostP.zip", emb)
+    assert merger.scan() == 2
+    index, _ = merger.finalize()
+    assert index.ntotal == 12
+    assert np.array_equal(np.load(tmp_path / "merged_embeddings.npy"), np.concatenate(vectors))
+
+def test_changed_zip_rebuilds_and_checkpoint_reloads(tmp_path, vectors):
+    merger = IncrementalMerger(str(tmp_path))
+    first = ResultZip(tmp_path, "a.zip", vectors[0])
+    merger.ingest(first)
+    merger.ingest(ResultZip(tmp_path, "b.zip", vectors[1]))
+    os.utime(ResultZip(tmp_path, "a.zip", vectors[0][:3]), ns=(1, 1))
+    assert merger.ingest(first)
+    assert merger.ntotal == 10
+    assert merger.search(vectors[1][0], k=1)[0][0]["file"] == "b.zip"
+    assert merger.checkpoint()
+
+    reloaded = IncrementalMerger(str(tmp_path))
+    assert reloaded.ntotal == 10
+    assert reloaded.scan() == 0
+
+def test_broken_zip_is_skipped(tmp_path):
+    (tmp_path / "partial.zip").write_bytes(b"PK not a zip")
+    merger = IncrementalMerger(str(tmp_path))
+    assert merger.scan() == 0
+    assert merger.status()["failed"] == ["partial.zip"]
+    assert not os.path.exists(tmp_path / "merged" / "partial.tmp")
@@ -0,0 +1,83 @@
+import os
+import socket
+import threading
+
+import pytest
+
+from protocol import (FILE, MESSAGE, RAW, ZLIB, ChooseCodec, FrameHeader, LinkFor, LinkStats, ProtocolError, Receiver,
+                      SendFile, SendMessage)
+
+def RoundTrip(tmp_path, send):
+    """Runs send(sock) on one end of a socket pair and returns every frame received on the other"""
+    a, b = socket.socketpair()
+    out = tmp_path / "out"
+    out.mkdir()
+
+    def sender():
+        with a:
+            send(a)
+
+    thread = threading.Thread(target=sender)
+    thread.start()
+    with b:
+        frames = list(Receiver(b, directory=str(out), prefix="got_"))
+    thread.join()
+    return frames
+
+def test_message_and_files_round_trip(tmp_path):
+    text = tmp_path / "notes with space.txt"
+    text.write_text("all the nodes " * 50000)
+    dense = tmp_path / "n1_embeddings.npy"
+    dense.write_bytes(os.urandom(300 * 1024))
+
+    def send(sock):
+        SendMessage(sock, "hello")
+        SendFile(sock, str(text))
+        SendFile(sock, str(dense))
+
+    frames = RoundTrip(tmp_path, send)
+    assert frames[0] == (MESSAGE, None, "hello")
+    assert [(kind, name) for kind, name, _ in frames[1:]] == [(FILE, text.name), (FILE, dense.name)]
+    for (_, name, path), source in zip(frames[1:], [text, dense]):
+        assert os.path.basename(path) == "got_" + name
+        assert open(path, "rb").read() == source.read_bytes()
+
+@pytest.mark.parametrize("codec", [RAW, ZLIB])
+def test_forced_codec_round_trip(tmp_path, codec):
+    source = tmp_path / "data.bin"
+    source.write_bytes(b"abc" * 100000)
+    frames = RoundTrip(tmp_path, lambda sock: SendFile(sock, str(source), codec=codec))
+    assert open(frames[0][2], "rb").read() == source.read_bytes()
+
+def test_bad_checksum_is_rejected(tmp_path):
+    payload = b"payload"
+
+    def send(sock):
+        sock.sendall(FrameHeader(MESSAGE, b"", len(payload), b"\0" * 32) + payload)
+
+    with pytest.raises(ProtocolError):
+        RoundTrip(tmp_path, send)
+
+def test_truncated_frame_is_rejected(tmp_path):
+    def send(sock):
+        sock.sendall(FrameHeader(MESSAGE, b"", 100, b"\0" * 32) + b"short")
+
+    with pytest.raises(ProtocolError):
+        RoundTrip(tmp_path, send)
+
+def test_compressed_sends_measure_the_link(tmp_path, monkeypatch):
+    source = tmp_path / "corpus.txt"
+    source.write_bytes(os.urandom(1024 * 1024).hex().encode())
+    links = []
+
+    def send(sock):
+        link = LinkFor(sock)
+        links.append(link)
+        assert ChooseCodec(str(source), link) == ZLIB
+        SendFile(sock, str(source))
+
+    RoundTrip(tmp_path, send)
+    assert links[0].bytes_per_sec
+    # a compressor slower than the measured link turns compression off
+    monkeypatch.setattr(LinkStats, "compress_speed", links[0].bytes_per_sec / 2)
+    assert ChooseCodec(str(source), links[0]) == RAW
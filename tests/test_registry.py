@@ -0,0 +1,24 @@
+import time
+
+from registry import NodeRegistry
+
+def test_heartbeat_keeps_measured_capacity():
+    registry = NodeRegistry()
+    registry.heartbeat("n1", {"cpu_cores": 8, "embeddings_per_sec": 120.0})
+    # GetMetrics sends embeddings_per_sec None unless it measured
+    registry.heartbeat("n1", {"cpu_cores": 8, "cpu_percent": 40, "embeddings_per_sec": None})
+    assert registry.capacity()["n1"] == {"cpu_cores": 8, "cpu_percent": 40, "embeddings_per_sec": 120.0}
+
+def test_silent_nodes_go_offline_then_are_dropped():
+    registry = NodeRegistry(ttl=0.05, evict_after=0.1)
+    registry.heartbeat("n1")
+    registry.heartbeat("n2")
+    time.sleep(0.06)
+    registry.heartbeat("n2")
+    assert registry.get("n1")["status"] == "offline"
+    assert [n["id"] for n in registry.by_status("online")] == ["n2"]
+    assert list(registry.capacity()) == ["n2"]
+    time.sleep(0.06)
+    registry.expire()
+    assert registry.get("n1") is None
+    assert registry.count() == 1
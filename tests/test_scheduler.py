@@ -0,0 +1,82 @@
+import time
+
+from scheduler import ChunkScheduler
+
+def Scheduler(chunks=4, **kwargs):
+    scheduler = ChunkScheduler(**kwargs)
+    scheduler.load([f"chunk{i}.txt" for i in range(chunks)], job_id="job")
+    return scheduler
+
+def test_nodes_pull_every_chunk_once():
+    scheduler = Scheduler(chunks=4, max_copies=1)
+    seen = []
+    for node in ["a", "b", "a", "b"]:
+        task = scheduler.next(node)
+        seen.append(task["chunk"])
+        assert scheduler.complete(task["id"], node)
+    assert sorted(seen) == [f"chunk{i}.txt" for i in range(4)]
+    assert scheduler.next("a") is None
+    assert scheduler.counts() == {"queued": 0, "running": 0, "done": 4, "failed": 0}
+
+def test_failed_chunk_goes_to_another_node_first():
+    scheduler = Scheduler(chunks=2, max_copies=1)
+    scheduler.next("b")
+    task = scheduler.next("a")
+    assert scheduler.fail(task["id"], "a", "boom")
+    # b asked for work before, so a leaves the retry to it
+    assert scheduler.next("a") is None
+    retry = scheduler.next("b")
+    assert retry["id"] == task["id"]
+    assert retry["attempts"] == 1
+
+def test_failing_node_retries_when_no_one_else_is_left():
+    scheduler = Scheduler(chunks=1, max_copies=1)
+    task = scheduler.next("a")
+    scheduler.fail(task["id"], "a")
+    assert scheduler.next("a")["id"] == task["id"]
+
+def test_lost_node_does_not_block_retries():
+    scheduler = Scheduler(chunks=2, max_copies=1)
+    held = scheduler.next("b")
+    task = scheduler.next("a")
+    scheduler.fail(task["id"], "a")
+    scheduler.node_lost("b")
+    # only a is left, so it gets both its own retry and b's chunk
+    ids = {scheduler.next("a")["id"], scheduler.next("a")["id"]}
+    assert ids == {task["id"], held["id"]}
+
+def test_chunk_gives_up_after_max_attempts():
+    scheduler = Scheduler(chunks=1, max_attempts=2, max_copies=1)
+    for _ in range(2):
+        task = scheduler.next("a")
+        scheduler.fail(task["id"], "a")
+    assert scheduler.next("a") is None
+    assert scheduler.counts()["failed"] == 1
+
+def test_expired_lease_is_handed_out_again():
+    scheduler = Scheduler(chunks=1, lease=0, max_copies=1)
+    task = scheduler.next("a")
+    time.sleep(0.01)
+    retry = scheduler.next("b")
+    assert retry["id"] == task["id"]
+    assert retry["nodes"] == ["b"]
+
+def test_idle_node_gets_speculative_copy_and_first_finish_wins():
+    scheduler = Scheduler(chunks=1)
+    task = scheduler.next("a")
+    copy = scheduler.next("b")
+    assert copy["id"] == task["id"]
+    assert copy["speculative"]
+    assert scheduler.next("c") is None  # MAX_COPIES reached
+    assert scheduler.complete(task["id"], "b")
+    assert not scheduler.complete(task["id"], "a")
+
+def test_done_since_counts_only_recent_finishes():
+    scheduler = Scheduler(chunks=2, max_copies=1)
+    first = scheduler.next("a")
+    scheduler.complete(first["id"], "a")
+    since = time.time()
+    second = scheduler.next("a")
+    scheduler.complete(second["id"], "a")
+    assert scheduler.done_since(0) == 2
+    assert scheduler.done_since(since) == 1
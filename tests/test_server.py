@@ -0,0 +1,56 @@
+import socket
+import threading
+
+from protocol import SendFile, SendMessage
+from server import TransferServer
+
+def test_same_file_from_two_nodes_is_kept_apart(tmp_path):
+    received = []
+    done = threading.Semaphore(0)
+
+    def on_file(node_id, path):
+        received.append((node_id, path))
+        done.release()
+
+    server = TransferServer("127.0.0.1", 0, directory=str(tmp_path), on_file=on_file).start()
+    try:
+        results = {}
+        for node in ["n1", "n2"]:
+            results[node] = tmp_path / f"{node}_src" / "n1_PostP.zip"
+            results[node].parent.mkdir()
+            results[node].write_bytes(node.encode() * 100000)
+
+        def worker(node):
+            with socket.create_connection(("127.0.0.1", server.port)) as sock:
+                SendMessage(sock, f"HELLO {node}")
+                SendFile(sock, str(results[node]))
+
+        threads = [threading.Thread(target=worker, args=(node,)) for node in results]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        for _ in results:
+            assert done.acquire(timeout=10)
+    finally:
+        server.stop()
+
+    assert sorted(node for node, _ in received) == ["n1", "n2"]
+    for node, path in received:
+        assert path == str(tmp_path / f"{node}_n1_PostP.zip")
+        assert open(path, "rb").read() == results[node].read_bytes()
+    assert not list(tmp_path.glob("*.part"))
+
+def test_connected_lists_named_workers(tmp_path):
+    joined = threading.Event()
+    server = TransferServer("127.0.0.1", 0, directory=str(tmp_path),
+                            on_message=lambda node_id, text: joined.set()).start()
+    try:
+        assert server.connected() == []
+        with socket.create_connection(("127.0.0.1", server.port)) as sock:
+            SendMessage(sock, "HELLO n7")
+            SendMessage(sock, "ready")
+            assert joined.wait(5)
+            assert server.connected() == ["n7"]
+    finally:
+        server.stop()
@@ -0,0 +1,46 @@
+import os
+
+import faiss
+import numpy as np
+
+from conftest import ResultZip
+from finalrun import EmbeddingFiles, ExtractZips
+from shards import BuildShards, ShardedIndex
+
+def Setup(tmp_path, sizes=(40, 60)):
+    received = tmp_path / "receivedd"
+    received.mkdir()
+    rng = np.random.default_rng(0)
+    vectors = [rng.standard_normal((n, 8)).astype(np.float32) for n in sizes]
+    for i, emb in enumerate(vectors):
+        ResultZip(received, f"task-{i}_n1_PostP.zip", emb)
+    merged = str(received / "merged")
+    ExtractZips(str(received), merged)
+    return vectors, EmbeddingFiles(merged), merged, str(received / "shards")
+
+def test_every_result_zip_gets_its_own_shard(tmp_path):
+    vectors, files, merged, directory = Setup(tmp_path)
+    manifest = BuildShards(files, directory, merged_dir=merged)
+    assert [s["name"] for s in manifest["shards"]] == [
+        f"task-{i}_n1_PostP__n1_PostProcess__n1_embeddings" for i in range(2)]
+    index = ShardedIndex(directory)
+    assert index.ntotal == 100
+    _, I = index.search(vectors[1][5], 1)
+    assert I[0][0] == 40 + 5
+
+def test_reused_shards_are_retuned(tmp_path):
+    _, files, merged, directory = Setup(tmp_path, sizes=(400, 400))
+    BuildShards(files, directory, spec="ivf-flat", nprobe=1, merged_dir=merged)
+    BuildShards(files, directory, spec="ivf-flat", nprobe=3, merged_dir=merged)
+    for name in os.listdir(directory):
+        if name.endswith(".faiss"):
+            assert faiss.extract_index_ivf(faiss.read_index(os.path.join(directory, name))).nprobe == 3
+
+def test_missing_shard_file_is_skipped_and_ids_stay(tmp_path):
+    vectors, files, merged, directory = Setup(tmp_path)
+    manifest = BuildShards(files, directory, merged_dir=merged)
+    os.remove(os.path.join(directory, manifest["shards"][0]["file"]))
+    index = ShardedIndex(directory)
+    assert index.shards == [manifest["shards"][1]["name"]]
+    _, I = index.search(vectors[1][5], 1)
+    assert I[0][0] == 40 + 5
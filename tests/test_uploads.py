@@ -0,0 +1,66 @@
+import hashlib
+import io
+import os
+
+import pytest
+
+from uploads import UploadError, UploadStore
+
+def Sha(data):
+    return hashlib.sha256(data).hexdigest()
+
+@pytest.fixture
+def store(tmp_path):
+    return UploadStore(directory=str(tmp_path / "uploads"), destination=str(tmp_path / "receivedd"))
+
+def Parts(data, part_size):
+    return [data[i:i + part_size] for i in range(0, len(data), part_size)]
+
+def test_parts_in_any_order_complete_the_file(store):
+    data = os.urandom(2500)
+    upload = store.init("result.zip", len(data), Sha(data), part_size=1000)
+    assert upload["parts"] == 3
+    for i in [2, 0, 1]:
+        part = Parts(data, 1000)[i]
+        store.write_part(upload["upload_id"], i, io.BytesIO(part), Sha(part))
+    done = store.complete(upload["upload_id"])
+    assert open(done["path"], "rb").read() == data
+
+def test_resume_reports_missing_parts(store, tmp_path):
+    data = os.urandom(2500)
+    upload = store.init("result.zip", len(data), Sha(data), part_size=1000)
+    part = Parts(data, 1000)[0]
+    store.write_part(upload["upload_id"], 0, io.BytesIO(part), Sha(part))
+
+    # a restarted admin, and a client that only knows the file
+    again = UploadStore(directory=store.directory, destination=store.destination)
+    status = again.init("result.zip", len(data), Sha(data), part_size=1000)
+    assert status["upload_id"] == upload["upload_id"]
+    assert (status["received"], status["missing"], status["offset"]) == ([0], [1, 2], 1000)
+    with pytest.raises(UploadError) as e:
+        again.complete(upload["upload_id"])
+    assert e.value.status == 409
+
+def test_bad_part_is_not_acknowledged(store):
+    data = os.urandom(1500)
+    upload = store.init("result.zip", len(data), part_size=1000)
+    with pytest.raises(UploadError) as e:
+        store.write_part(upload["upload_id"], 0, io.BytesIO(data[:1000]), Sha(b"other"))
+    assert e.value.status == 422
+    with pytest.raises(UploadError):
+        store.write_part(upload["upload_id"], 1, io.BytesIO(data[1000:] + b"x"), Sha(data[1000:] + b"x"))
+    assert store.status(upload["upload_id"])["received"] == []
+
+def test_whole_file_checksum_is_verified(store):
+    data = os.urandom(100)
+    upload = store.init("result.zip", len(data), Sha(b"something else"))
+    store.write_part(upload["upload_id"], 0, io.BytesIO(data), Sha(data))
+    with pytest.raises(UploadError) as e:
+        store.complete(upload["upload_id"])
+    assert e.value.status == 422
+
+def test_filename_is_sanitized(store):
+    upload = store.init("../../etc/passwd", 0)
+    assert upload["filename"] == "etc_passwd"
+    store.write_part(upload["upload_id"], 0, io.BytesIO(b""), Sha(b""))
+    assert os.path.dirname(store.complete(upload["upload_id"])["path"]) == store.destination